@@ -1,5 +1,5 @@
 from catan.models import *
-from django.core.exceptions import ObjectDoesNotExist
+from catan.store import load_state, play
 
 ACTION_HANDLERS = dict()
 
@@ -20,47 +20,41 @@ def check_structure(struct, conf):
 
 
 class BaseActionHandler:
+    """
+    Action handlers check the payloads of the API, and play their action on
+    the in-memory GameState (see catan.engine), persisting the result.
+    """
+    action = None
+
     def is_payload_valid(self, payload):
         """Returns True only if the given payload is valid for this action."""
         return True
 
-    def can_execute(self, player, game, payload):
-        """Returns True only if the player may play this action on his turn."""
-        return True
-
-    def execute(self, player, game, payload):
-        """Assuming can_execute and is_payload_valid, play this action."""
-
-
-def get_available_settlement_positions(player):
-    result = []
-    for level in range(3):
-        for index in range(vertex_count(level)):
-            sett_pos = (level, index)
-            can_construct_here = SettlementBuilding \
-                .is_available_position(player, sett_pos)
-
-            if can_construct_here:
-                result.append(sett_pos)
-
-    return result
+    def load_state(self, game):
+        """Returns the GameState the action is checked and played on."""
+        return load_state(game)
 
+    def can_execute(self, player, game, payload, state=None):
+        """
+        Returns True only if the player may play this action on his turn.
+        state is the GameState of the game, loaded if not given.
+        """
+        if state is None:
+            state = self.load_state(game)
+        return state.can_apply(player.id, self.action, payload)
 
-def get_available_settlement_positions_pos(player):
-    result = []
-    for level in range(3):
-        for index in range(vertex_count(level)):
-            sett_pos = (level, index)
-            can_construct_here = SettlementBuilding \
-                .is_available_position(player, sett_pos)
-
-            if can_construct_here:
-                result.append({"level": sett_pos[0], "index": sett_pos[1]})
-
-    return result
+    def execute(self, player, game, payload, state=None, idempotency_key=None):
+        """
+        Assuming can_execute and is_payload_valid, play this action.
+        Returns the new GameState. Raises StaleState if the game changed
+        since state was loaded (see catan.store).
+        """
+        return play(game, player, self.action, payload, state, idempotency_key)
 
 
 class BuildSettlementAction(BaseActionHandler):
+    action = "build_settlement"
+
     def is_payload_valid(self, payload):
         payload_format = {
             "level": int,
@@ -75,25 +69,10 @@ class BuildSettlementAction(BaseActionHandler):
 
         return valid_level and valid_index
 
-    def can_execute(self, player, game, payload):
-        enough_resources = SettlementBuilding.has_resources_to_build(player)
-        free_slot = SettlementBuilding.objects.filter(owner=player).count() < 5
-        available_position = SettlementBuilding.is_available_position(
-            player, (payload["level"], payload["index"])
-        )
-        return enough_resources and free_slot and available_position
-
-    def execute(self, player, game, payload):
-        SettlementBuilding.take_resources(player)
-        SettlementBuilding.objects.create(
-            owner=player,
-            game=game,
-            pos_level=payload["level"],
-            pos_index=payload["index"]
-        )
-
 
 class BuildRoadAction(BaseActionHandler):
+    action = "build_road"
+
     def is_payload_valid(self, payload):
         payload_format = [
             {"level": int, "index": int},
@@ -119,42 +98,14 @@ class BuildRoadAction(BaseActionHandler):
             snd_vertex in get_neighbors(fst_vertex)
         )
 
-    def can_execute(self, player, game, payload):
-        enough_resources = RoadBuilding.has_resources_to_build(player)
-        free_slot = RoadBuilding.objects.filter(owner=player).count() < 15
-        available_position = RoadBuilding.is_available_position(
-            game, player,
-            (
-                (payload[0]["level"], payload[0]["index"]),
-                (payload[1]["level"], payload[1]["index"])
-            )
-        )
-        return enough_resources and free_slot and available_position
-
-    def execute(self, player, game, payload):
-        RoadBuilding.take_resources(player)
-        RoadBuilding.objects.create(
-            owner=player,
-            game=game,
-            fst_pos_level=payload[0]["level"],
-            fst_pos_index=payload[0]["index"],
-            snd_pos_level=payload[1]["level"],
-            snd_pos_index=payload[1]["index"]
-        )
-
 
 class EndTurnAction(BaseActionHandler):
-    def execute(self, player, game, payload):
-        game.advance_turn()
-        game.roll_dices()
-
-        if game.dices_sum() == 7:
-            game.robber_activate()
-        else:
-            game.distribute_resources(game.dices_sum())
+    action = "end_turn"
 
 
 class BankTradeAction(BaseActionHandler):
+    action = "bank_trade"
+
     def is_payload_valid(self, payload):
         payload_format = {
             "give": str,
@@ -172,32 +123,11 @@ class BankTradeAction(BaseActionHandler):
 
         return True
 
-    def can_execute(self, player, game, payload):
-        enough_gives = ResourcesCard.count_player(player, payload["give"]) >= 4
-        enough_receives = ResourcesCard.count_bank(game, payload["receive"]) >= 1
-        return enough_gives and enough_receives
-
-    def execute(self, player, game, payload):
-        ResourcesCard.take(player, payload["give"], 4)
-        ResourcesCard.give(player, payload["receive"], 1)
-        return True
-
 
 class BuyCardAction(BaseActionHandler):
-    def is_payload_valid(self, payload):
-        return True
+    action = "buy_card"
 
-    def can_execute(self, player, game, payload):
-        has_ore = ResourcesCard.count_player(player, 'ore') >= 1
-        has_wool = ResourcesCard.count_player(player, 'wool') >= 1
-        has_grain = ResourcesCard.count_player(player, 'grain') >= 1
-        return has_ore and has_wool and has_grain
-
-    def execute(self, player, game, playload):
-        ResourcesCard.take(player, 'ore', 1)
-        ResourcesCard.take(player, 'wool', 1)
-        ResourcesCard.take(player, 'grain', 1)
-        DevelopmentCard.give(player, 1)
+    def is_payload_valid(self, payload):
         return True
 
 
@@ -222,37 +152,9 @@ def parse_road_position_pair(payload):
     return (fst_vertex, snd_vertex)
 
 
-def get_available_road_positions(player):
-    result = []
-    for level in range(3):
-        for index in range(vertex_count(level)):
-            v = (level, index)
-            for n in get_neighbors(v):
-                road_pos = (v, n)
-                if road_pos in result or (n, v) in result:
-                    continue
-
-                can_construct_here = RoadBuilding.is_available_position(
-                    player.game, player, road_pos)
-                if can_construct_here:
-                    result.append(road_pos)
-
-    return result
-
-
-def get_available_road_positions_pos(player):
-    result = []
-    for ps in get_available_road_positions(player):
-        r2 = []
-        for p in ps:
-            r2.append({"level": p[0], "index": p[1]})
-
-        result.append(r2)
-
-    return result
-
-
 class PlayBuildRoadCardAction(BaseActionHandler):
+    action = "play_road_building_card"
+
     def is_payload_valid(self, payload):
         payload_format = [
             [
@@ -275,67 +177,10 @@ class PlayBuildRoadCardAction(BaseActionHandler):
 
         return True
 
-    def cmp_roads(self, r1, r2):
-        if (r1[0] == r2[0] and r1[1] == r2[1]):
-            return True
-
-        if (r1[0] == r2[1] and r1[1] == r2[0]):  # orden invertido
-            return True
-
-        return False
-
-    def is_road_in_roads(self, road, roadlist):
-        for r in roadlist:
-            if self.cmp_roads(r, road):
-                return True
-
-        return False
-
-    def can_execute(self, player, game, payload):
-        road_pos_0 = parse_road_position_pair(payload[0])
-        road_pos_1 = parse_road_position_pair(payload[1])
-        available = get_available_road_positions(player)
-        has_the_card = DevelopmentCard.count_player(player, 'road_building') >= 1
-        road_1_valid = self.is_road_in_roads(road_pos_0, available)
-        road_2_valid = self.is_road_in_roads(road_pos_1, available)
-
-        if self.cmp_roads(road_pos_0, road_pos_1):
-            return False
-
-        return road_1_valid and road_2_valid and has_the_card
-
-    def execute(self, player, game, payload):
-        DevelopmentCard.take(player, 'road_building', 1)
-
-        road_pos_0 = parse_road_position_pair(payload[0])
-        road_pos_1 = parse_road_position_pair(payload[1])
-
-        for vertex1, vertex2 in [road_pos_0, road_pos_1]:
-            RoadBuilding.objects.create(
-                owner=player,
-                game=game,
-                fst_pos_level=vertex1[0],
-                fst_pos_index=vertex1[1],
-                snd_pos_level=vertex2[0],
-                snd_pos_index=vertex2[1],
-            )
-
-
-def get_available_robber_positions(player):
-    result = []
-    current = (player.game.robber_level, player.game.robber_index)
-
-    for level in range(3):
-        for index in range(hexagon_count(level)):
-            h = (level, index)
-
-            if h != current:
-                result.append({"level": level, "index": index})
-
-    return result
-
 
 class MoveRobberAction(BaseActionHandler):
+    action = "move_robber"
+
     def is_payload_valid(self, payload):
         payload_format = {
             "position": {
@@ -353,39 +198,10 @@ class MoveRobberAction(BaseActionHandler):
 
         return valid_level and valid_index
 
-    def can_execute(self, player, game, payload):
-        new_pos = (payload["position"]["level"], payload["position"]["index"])
-        target_player = None
-
-        valid_player = True
-        if len(payload["player"]) != 0:
-            try:
-                target_user = User.objects.get(username=payload["player"])
-                target_player = Player.objects.get(game=game, user=target_user)
-                itself = player == target_player
-                possible_players = get_adjacent_players(game, new_pos[0], new_pos[1])
-
-                valid_player = not itself and target_player in possible_players
-            except ObjectDoesNotExist:
-                valid_player = False
-        correct_dices_sum = game.dices_sum() == 7
-        other_pos = new_pos != (game.robber_level, game.robber_index)
-        moved = game.robber_moved
-
-        return valid_player and correct_dices_sum and other_pos and not moved
-
-    def execute(self, player, game, payload):
-        new_pos = (payload["position"]["level"], payload["position"]["index"])
-        game.move_robber(new_pos)
-
-        target_player = None
-        if len(payload["player"]) != 0:
-            target_user = User.objects.get(username=payload["player"])
-            target_player = Player.objects.get(game=game, user=target_user)
-        game.steal_resource(player, target_player)
-
 
 class PlayKnightAction(BaseActionHandler):
+    action = "play_knight_card"
+
     def is_payload_valid(self, payload):
         payload_format = {
             "position": {
@@ -403,39 +219,6 @@ class PlayKnightAction(BaseActionHandler):
 
         return valid_level and valid_index
 
-    def can_execute(self, player, game, payload):
-        new_pos = (payload["position"]["level"], payload["position"]["index"])
-        target_player = None
-
-        valid_player = True
-        if len(payload["player"]) != 0:
-            try:
-                target_user = User.objects.get(username=payload["player"])
-                target_player = Player.objects.get(game=game, user=target_user)
-                itself = player == target_player
-                possible_players = get_adjacent_players(game, new_pos[0], new_pos[1])
-
-                valid_player = not itself and target_player in possible_players
-            except ObjectDoesNotExist:
-                valid_player = False
-        has_knight_card = DevelopmentCard.count_player(player, "knight") > 0
-        other_pos = new_pos != (game.robber_level, game.robber_index)
-        moved = game.robber_moved
-
-        return valid_player and has_knight_card and other_pos and not moved
-
-    def execute(self, player, game, payload):
-        DevelopmentCard.take(player, 'knight', 1)
-
-        new_pos = (payload["position"]["level"], payload["position"]["index"])
-        game.move_robber(new_pos)
-
-        target_player = None
-        if len(payload["player"]) != 0:
-            target_user = User.objects.get(username=payload["player"])
-            target_player = Player.objects.get(game=game, user=target_user)
-        game.steal_resource(player, target_player)
-
 
 register_action_handler("build_settlement", BuildSettlementAction())
 register_action_handler("build_road", BuildRoadAction())
@@ -0,0 +1,70 @@
+"""
+Monte Carlo estimate of how much each vertex of a board produces, to tell
+whether a board is fair to every starting position.
+
+Dice rolls are simulated in NumPy batches and reduced to how many times
+each sum came up, so the cost of the analysis does not grow with the
+number of rolls beyond drawing them: the yield of every vertex is then one
+matrix product against the vertex -> hexagon adjacency.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from catan.rules import *
+from catan.topology import *
+
+RESOURCES = [r for r, _ in RESOURCE_TYPES]
+ROLL_BATCH = 1000000
+
+# ADJACENCY[v, h] is 1 if vertex v touches hexagon h
+ADJACENCY = np.zeros((VERTEX_COUNT, HEXAGON_COUNT))
+for _v, _hexes in enumerate(VERTEX_HEXES):
+    ADJACENCY[_v, list(_hexes)] = 1
+
+# DICE_PROBABILITY[s] is the probability of rolling the sum s
+DICE_PROBABILITY = np.array([max(0, 6 - abs(7 - s)) / 36 for s in range(13)])
+
+STARTING_VERTICES = [[vertex_id(p) for p in seat] for seat in STARTING_SETTLEMENTS]
+
+BoardAnalysis = namedtuple("BoardAnalysis", [
+    "rolls",
+    "vertex_yield",  # (VERTEX_COUNT, len(RESOURCES)) resources per roll
+    "seat_yield",  # (len(STARTING_SETTLEMENTS), len(RESOURCES)) same, per starting seat
+])
+
+
+def roll_frequencies(rolls, rng):
+    """Rolls two dice rolls times and returns how often each sum (0 to 12) came up."""
+    counts = np.zeros(13, dtype=np.int64)
+    remaining = rolls
+    while remaining > 0:
+        batch = min(remaining, ROLL_BATCH)
+        sums = rng.integers(1, 7, size=(2, batch)).sum(axis=0)
+        counts += np.bincount(sums, minlength=13)
+        remaining -= batch
+    return counts / rolls
+
+
+def hexagon_yield(hexes, frequencies):
+    """
+    Returns the (HEXAGON_COUNT, len(RESOURCES)) matrix of resources each
+    hexagon gives per roll to a settlement next to it.
+    """
+    produced = np.zeros((HEXAGON_COUNT, len(RESOURCES)))
+    for h, resource, token in hexes:
+        if resource is not None:
+            produced[h, RESOURCES.index(resource)] = frequencies[token]
+    return produced
+
+
+def analyze(hexes, rolls=1000000, seed=None):
+    """
+    Estimates the yield of every vertex and every starting seat of the
+    board given as (hexagon id, resource, token) tuples, from rolls
+    simulated rolls.
+    """
+    frequencies = roll_frequencies(rolls, np.random.default_rng(seed))
+    vertex_yield = ADJACENCY @ hexagon_yield(hexes, frequencies)
+    seat_yield = np.stack([vertex_yield[vertices].sum(axis=0) for vertices in STARTING_VERTICES])
+    return BoardAnalysis(rolls, vertex_yield, seat_yield)
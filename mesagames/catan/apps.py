@@ -1,5 +1,12 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class CatanConfig(AppConfig):
     name = 'catan'
+
+    def ready(self):
+        profiling = getattr(settings, 'CATAN_ACTION_PROFILING', None)
+        if profiling is not None:
+            from catan.profiling import instrument_action_handlers
+            instrument_action_handlers(profiling)
@@ -0,0 +1,121 @@
+"""
+Cache of the payloads of the game read endpoints.
+
+Entries are keyed by (game id, state version, viewer, view), so they never
+go stale: any action bumps the version of the game and later polls miss.
+The backend is chosen with the CATAN_STATE_CACHE setting:
+
+    CATAN_STATE_CACHE = {
+        "BACKEND": "catan.cache.LocalStateCache",
+        "OPTIONS": {"max_entries": 4096, "max_size": 16 * 1024 * 1024},
+    }
+"""
+import pickle
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_STATE_CACHE = {
+    "BACKEND": "catan.cache.LocalStateCache",
+    "OPTIONS": {},
+}
+
+
+class StateCache:
+    """Interface of the state cache backends. This one caches nothing."""
+    def get(self, key):
+        """Returns the payload stored under key, or None."""
+        return None
+
+    def set(self, key, payload):
+        """Stores payload under key. Payloads must not be mutated afterwards."""
+
+    def invalidate_game(self, game_id):
+        """Drops every entry of the game, whatever its version."""
+
+    def clear(self):
+        """Drops every entry."""
+
+
+class LocalStateCache(StateCache):
+    """
+    In-process LRU cache bounded both by number of entries and by the
+    (pickled) size of the payloads it holds.
+    """
+    def __init__(self, max_entries=4096, max_size=16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self._entries = OrderedDict()  # key -> (payload, size)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, payload):
+        size = len(pickle.dumps(payload, pickle.HIGHEST_PROTOCOL))
+        if size > self.max_size:
+            return
+
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (payload, size)
+            self._size += size
+            while len(self._entries) > self.max_entries or self._size > self.max_size:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= evicted
+
+    def invalidate_game(self, game_id):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == game_id]:
+                self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry[1]
+
+
+_state_cache = None
+_state_cache_lock = threading.Lock()
+
+
+def get_state_cache():
+    """Returns the process wide state cache configured in the settings."""
+    global _state_cache
+    if _state_cache is None:
+        with _state_cache_lock:
+            if _state_cache is None:
+                conf = getattr(settings, "CATAN_STATE_CACHE", DEFAULT_STATE_CACHE)
+                backend = import_string(conf["BACKEND"])
+                _state_cache = backend(**conf.get("OPTIONS", {}))
+    return _state_cache
+
+
+def cached_payload(game_id, version, viewer, view, build):
+    """
+    Returns the payload of view for (game, version, viewer) from the cache,
+    calling build() to compute and store it on a miss.
+    """
+    cache = get_state_cache()
+    key = (game_id, version, viewer, view)
+    payload = cache.get(key)
+    if payload is None:
+        payload = build()
+        cache.set(key, payload)
+    return payload
@@ -0,0 +1,562 @@
+"""
+In-memory game engine: the whole state of a game and the rules of every
+action, without the database. Players, vertices, edges and hexagons are
+identified by their integer ids.
+
+The database is only read to load a GameState and written to persist what
+an action changed (see catan.store). Every action draws its random numbers
+from action_rng(seed, sequence), so replaying the action log of a game (see
+ActionLog and Game.replay) ends in exactly the same state.
+
+Payloads are the ones of the API and are assumed to have passed the
+is_payload_valid check of their action handler.
+"""
+import json
+import random
+from catan.events import DICE_ROLLED, SETTLEMENT_BUILT, ROAD_BUILT, ROBBER_MOVED, CARD_BOUGHT
+from catan.events import BANK_TRADED, TURN_ADVANCED, WINNER_SET
+from catan.occupancy import Occupancy, iter_bits
+from catan.production import ProductionIndex, SETTLEMENT_YIELD, CITY_YIELD
+from catan.rules import *
+from catan.topology import *
+
+ROBBER_START = hexagon_id((0, 0))
+RESOURCES = [r for r, _ in RESOURCE_TYPES]
+
+
+def action_rng(seed, sequence):
+    """Random generator of the action with the given sequence number in a game."""
+    return random.Random("%d:%d" % (seed, sequence))
+
+
+def position_vertex(position):
+    return vertex_id((position["level"], position["index"]))
+
+
+def position_hexagon(position):
+    return hexagon_id((position["level"], position["index"]))
+
+
+def position_edge(fst, snd):
+    return edge_id((fst["level"], fst["index"]), (snd["level"], snd["index"]))
+
+
+def position_json(position):
+    return {"level": position[0], "index": position[1]}
+
+
+class GameState:
+    __slots__ = (
+        'seed', 'hexes', 'version', 'players', 'usernames', 'turn', 'winner', 'dices',
+        'robber', 'robber_moved', 'resources', 'cards', 'occupancy', 'production', 'events',
+        'board_shared', 'history',
+    )
+
+    def __init__(self, seed, hexes):
+        """hexes are (hexagon id, resource, token) tuples of the board."""
+        self.seed = seed
+        self.hexes = list(hexes)
+        self.version = 0
+        self.players = []  # player ids, in turn order
+        self.usernames = dict()  # player id -> username
+        self.turn = None
+        self.winner = None
+        self.dices = (0, 0)
+        self.robber = ROBBER_START
+        self.robber_moved = False
+        self.resources = dict()  # (player id or None for the bank, resource) -> amount
+        self.cards = []  # [card, player id or None for the bank], in deck order
+        self.occupancy = Occupancy()
+        self.production = ProductionIndex.build(self.hexes, [], [])
+        self.events = []  # (type, data) of the last action, see catan.events
+        # occupancy and production may be used by another state or by an undo
+        # entry: they are copied before building (see own_board)
+        self.board_shared = False
+        self.history = []  # undo entries of the actions played with push
+
+    def copy(self):
+        """
+        Returns an independent state, without the undo history. The board is
+        shared until either state builds on it, and players never change
+        once the game started, so copying costs the cards and resources.
+        """
+        state = GameState.__new__(GameState)
+        state.seed = self.seed
+        state.hexes = self.hexes
+        state.version = self.version
+        state.players = self.players
+        state.usernames = self.usernames
+        state.turn = self.turn
+        state.winner = self.winner
+        state.dices = self.dices
+        state.robber = self.robber
+        state.robber_moved = self.robber_moved
+        state.resources = dict(self.resources)
+        state.cards = [list(card) for card in self.cards]
+        state.occupancy = self.occupancy
+        state.production = self.production
+        state.events = []
+        state.board_shared = self.board_shared = True
+        state.history = []
+        return state
+
+    def own_board(self):
+        """Copies occupancy and production if they are shared, before changing them."""
+        if self.board_shared:
+            self.occupancy = self.occupancy.copy()
+            self.production = self.production.copy()
+            self.board_shared = False
+
+    def can_apply(self, player, action, payload):
+        """Returns True only if player may play the action now."""
+        return CAN_APPLY[action](self, player, payload)
+
+    def apply(self, sequence, player, action, payload):
+        """Plays the action of player, which leads to version sequence."""
+        self.events = []
+        APPLY_ACTION[action](self, action_rng(self.seed, sequence), player, payload)
+        if player is not None:
+            self.try_set_winner(player)
+        self.version = sequence
+
+    def record(self, kind, **data):
+        self.events.append((kind, data))
+
+    # undo, for searching the game tree without copying states
+
+    def push(self, player, action, payload):
+        """Applies the action as the next version, remembering how to undo it."""
+        self.history.append((
+            self.version, self.players, self.usernames, self.turn, self.winner, self.dices,
+            self.robber, self.robber_moved, self.resources, self.cards,
+            tuple(holder for _, holder in self.cards), self.occupancy, self.production,
+            self.events
+        ))
+        self.resources = dict(self.resources)
+        self.board_shared = True
+        self.apply(self.version + 1, player, action, payload)
+
+    def undo(self):
+        """Takes back the last action played with push."""
+        (
+            self.version, self.players, self.usernames, self.turn, self.winner, self.dices,
+            self.robber, self.robber_moved, self.resources, self.cards,
+            holders, self.occupancy, self.production, self.events
+        ) = self.history.pop()
+        for card, holder in zip(self.cards, holders):
+            card[1] = holder
+        # copies made since the push may still use the restored board
+        self.board_shared = True
+
+    # snapshots
+
+    def dumps(self):
+        """
+        Serializes the state compactly: buildings as one bitmask per player
+        and cards as counters (resources) or deck indexes (development).
+        """
+        holders = {p: i for i, p in enumerate(self.players)}
+        holders[None] = -1
+
+        def masks(buildings):
+            result = [0] * len(self.players)
+            for position, owner in buildings.items():
+                result[holders[owner]] |= 1 << position
+            return result
+
+        return json.dumps({
+            "seed": self.seed,
+            "version": self.version,
+            "hexes": self.hexes,
+            "players": [[p, self.usernames[p]] for p in self.players],
+            "turn": holders.get(self.turn, -1),
+            "winner": holders.get(self.winner, -1),
+            "dices": self.dices,
+            "robber": self.robber,
+            "robber_moved": self.robber_moved,
+            "resources": [
+                [self.count_resources(holder, r) for r in RESOURCES]
+                for holder in self.players + [None]
+            ],
+            "deck": "".join(str(DEVELOPMENT_DECK.index(card)) for card, _ in self.cards),
+            "deck_holders": [holders[holder] for _, holder in self.cards],
+            "settlements": masks(self.occupancy.settlements),
+            "cities": masks(self.occupancy.cities),
+            "roads": masks(self.occupancy.roads),
+        }, separators=(",", ":"))
+
+    @staticmethod
+    def loads(data):
+        data = json.loads(data)
+        state = GameState(data["seed"], [tuple(h) for h in data["hexes"]])
+        state.version = data["version"]
+        state.players = [p for p, _ in data["players"]]
+        state.usernames = {p: name for p, name in data["players"]}
+        holders = state.players + [None]
+        state.turn = holders[data["turn"]]
+        state.winner = holders[data["winner"]]
+        state.dices = tuple(data["dices"])
+        state.robber = data["robber"]
+        state.robber_moved = data["robber_moved"]
+        for holder, counts in zip(holders, data["resources"]):
+            for resource, amount in zip(RESOURCES, counts):
+                if amount > 0:
+                    state.resources[(holder, resource)] = amount
+        state.cards = [
+            [DEVELOPMENT_DECK[int(card)], holders[holder]]
+            for card, holder in zip(data["deck"], data["deck_holders"])
+        ]
+        for player, settlements, cities, roads in zip(
+                state.players, data["settlements"], data["cities"], data["roads"]):
+            for v in iter_bits(settlements):
+                state.add_settlement(player, v)
+            for v in iter_bits(cities):
+                state.add_city(player, v)
+            for e in iter_bits(roads):
+                state.add_road(player, e)
+        return state
+
+    # cards
+
+    def count_resources(self, holder, resource=None):
+        if resource is not None:
+            return self.resources.get((holder, resource), 0)
+        return sum(amount for (h, _), amount in self.resources.items() if h == holder)
+
+    def can_afford(self, player, cost):
+        return all(self.count_resources(player, r) >= amount for r, amount in cost.items())
+
+    def transfer(self, source, target, resource, amount):
+        """Moves cards between holders, None being the bank, like ResourcesCard.transfer."""
+        if amount <= 0:
+            return
+        if self.count_resources(source, resource) < amount:
+            raise ValueError("holder does't own that amount of the resource")
+        self.resources[(source, resource)] -= amount
+        self.resources[(target, resource)] = self.count_resources(target, resource) + amount
+
+    def pay(self, player, cost):
+        for resource, amount in cost.items():
+            self.transfer(player, None, resource, amount)
+
+    def take_random(self, rng, player, new_owner=None):
+        """Moves one random card of player to new_owner (None being the bank), by resource name."""
+        if player == new_owner:
+            return
+        stock = sorted(
+            (resource, amount) for (holder, resource), amount in self.resources.items()
+            if holder == player and amount > 0
+        )
+        total = sum(amount for _, amount in stock)
+        if total > 0:
+            pick = rng.randrange(total)
+            for resource, amount in stock:
+                if pick < amount:
+                    break
+                pick -= amount
+            self.transfer(player, new_owner, resource, 1)
+
+    def distribute(self, dices):
+        """Like ResourcesCard.distribute: a resource the bank cannot pay in full is skipped."""
+        payouts = self.production.collect(dices, self.robber)
+        demand = dict()
+        for (_, resource), amount in payouts.items():
+            demand[resource] = demand.get(resource, 0) + amount
+        payable = {r for r, total in demand.items() if self.count_resources(None, r) >= total}
+        for (player, resource), amount in payouts.items():
+            if resource in payable:
+                self.transfer(None, player, resource, amount)
+
+    def count_cards(self, player, name=None):
+        return sum(1 for card, holder in self.cards if holder == player and name in (None, card))
+
+    def give_card(self, player):
+        for card in self.cards:
+            if card[1] is None:
+                card[1] = player
+                return
+        raise ValueError("bank does't have cards")
+
+    def take_card(self, player, name):
+        for card in self.cards:
+            if card[1] == player and card[0] == name:
+                card[1] = None
+                return
+        raise ValueError("player does't own that amount of the card")
+
+    # board
+
+    def points(self, player):
+        occupancy = self.occupancy
+        settlements = sum(1 for o in occupancy.settlements.values() if o == player)
+        cities = sum(1 for o in occupancy.cities.values() if o == player)
+        return settlements * SETTLEMENT_POINTS + cities * CITY_POINTS
+
+    def try_set_winner(self, player):
+        if self.points(player) >= WINNING_POINTS:
+            if self.winner != player:
+                self.record(WINNER_SET, player=self.usernames[player])
+            self.winner = player
+
+    def add_settlement(self, player, vertex):
+        self.own_board()
+        self.occupancy.add_settlement(player, vertex)
+        self.production.add_building(player, vertex, SETTLEMENT_YIELD)
+
+    def add_city(self, player, vertex):
+        self.own_board()
+        self.occupancy.add_city(player, vertex)
+        self.production.add_building(player, vertex, CITY_YIELD)
+
+    def add_road(self, player, edge):
+        self.own_board()
+        self.occupancy.add_road(player, edge)
+
+    def roll_dices(self, rng):
+        self.dices = (rng.randint(1, 6), rng.randint(1, 6))
+        self.record(DICE_ROLLED, dices=list(self.dices))
+
+    def adjacent_players(self, hexagon):
+        """Owners of the buildings around the hexagon, in vertex order without repeats."""
+        result = []
+        for v in HEX_VERTICES[hexagon]:
+            owner = self.occupancy.cities.get(v, self.occupancy.settlements.get(v))
+            if owner is not None and owner not in result:
+                result.append(owner)
+        return result
+
+    def player_named(self, username):
+        """Returns the id of the player with that username, or None."""
+        return next((p for p, name in self.usernames.items() if name == username), None)
+
+    def robber_target_valid(self, player, payload):
+        if len(payload["player"]) == 0:
+            return True
+        target = self.player_named(payload["player"])
+        possible = self.adjacent_players(position_hexagon(payload["position"]))
+        return target is not None and target != player and target in possible
+
+    def move_robber_and_steal(self, rng, player, payload):
+        position = payload["position"]
+        self.robber = position_hexagon(position)
+        self.robber_moved = True
+        self.record(ROBBER_MOVED, position={"level": position["level"], "index": position["index"]})
+
+        if len(payload["player"]) != 0:
+            target = self.player_named(payload["player"])
+        else:
+            possible = self.adjacent_players(self.robber)
+            if possible == []:
+                return
+            target = rng.choice(possible)
+        self.take_random(rng, target, player)
+
+    def available_actions(self, player):
+        """The actions player may play now, in the format of PlayerAction.get."""
+        available_actions = list()
+        if self.turn != player:
+            return available_actions
+
+        end_turn_locked = sum(self.dices) == 7 and not self.robber_moved
+        robber = list()
+        for h, position in enumerate(HEXAGON_POSITIONS):
+            if h != self.robber:
+                players = [self.usernames[p] for p in self.adjacent_players(h) if p != player]
+                robber.append({"position": position_json(position), "players": players})
+        if end_turn_locked:
+            if robber != []:
+                available_actions.append({"type": "move_robber", "payload": robber})
+            return available_actions
+
+        available_actions.append({"type": "end_turn", "payload": None})
+
+        sett = [position_json(p) for p in self.occupancy.settlement_positions(player)]
+        if sett != [] and self.can_afford(player, SETTLEMENT_COST):
+            available_actions.append({"type": "build_settlement", "payload": sett})
+
+        if robber != [] and self.count_cards(player, "knight") > 0:
+            available_actions.append({"type": "play_knight_card", "payload": robber})
+
+        road = [
+            [position_json(fst), position_json(snd)]
+            for fst, snd in self.occupancy.road_positions(player)
+        ]
+        if road != []:
+            if self.can_afford(player, ROAD_COST):
+                available_actions.append({"type": "build_road", "payload": road})
+            if self.count_cards(player, "road_building") > 0:
+                available_actions.append({"type": "play_road_building_card", "payload": road})
+
+        if any(self.count_resources(player, r) >= BANK_TRADE_RATE for r in RESOURCES):
+            available_actions.append({"type": "bank_trade", "payload": None})
+
+        if self.can_buy_card(player, None):
+            available_actions.append({"type": "buy_card", "payload": None})
+
+        return available_actions
+
+    # actions: can_<action> checks the rules, <action> plays it
+
+    def start_game(self, rng, player, payload):
+        """payload: {"players": [[id, username], ...] in joining order, "first_turn": id}."""
+        self.players = [p for p, _ in payload["players"]]
+        self.usernames = {p: name for p, name in payload["players"]}
+        for p, positions in zip(self.players, STARTING_SETTLEMENTS):
+            for s in positions:
+                self.add_settlement(p, vertex_id(s))
+                self.add_road(p, edge_id(s, VERTEX_NEIGHBOR_POSITIONS[s][0]))
+        self.cards = [
+            [rng.choice(DEVELOPMENT_DECK), None] for _ in range(DEVELOPMENT_DECK_SIZE)
+        ]
+        for resource in RESOURCES:
+            self.resources[(None, resource)] = BANK_RESOURCES
+
+        self.turn = payload["first_turn"]
+        self.roll_dices(rng)
+        self.distribute(sum(self.dices))
+
+    def can_build_settlement(self, player, payload):
+        occupancy = self.occupancy
+        return (
+            self.can_afford(player, SETTLEMENT_COST) and
+            occupancy.count_settlements(player) < MAX_SETTLEMENTS and
+            occupancy.can_build_settlement(player, (payload["level"], payload["index"]))
+        )
+
+    def build_settlement(self, rng, player, payload):
+        self.pay(player, SETTLEMENT_COST)
+        self.add_settlement(player, position_vertex(payload))
+        self.record(
+            SETTLEMENT_BUILT,
+            player=self.usernames[player],
+            position={"level": payload["level"], "index": payload["index"]}
+        )
+
+    def can_build_road(self, player, payload):
+        occupancy = self.occupancy
+        position = (
+            (payload[0]["level"], payload[0]["index"]),
+            (payload[1]["level"], payload[1]["index"])
+        )
+        return (
+            self.can_afford(player, ROAD_COST) and
+            occupancy.count_roads(player) < MAX_ROADS and
+            occupancy.can_build_road(player, position)
+        )
+
+    def build_road(self, rng, player, payload):
+        self.pay(player, ROAD_COST)
+        self.add_road(player, position_edge(payload[0], payload[1]))
+        self.record(ROAD_BUILT, player=self.usernames[player], position=payload)
+
+    def can_end_turn(self, player, payload):
+        return True
+
+    def end_turn(self, rng, player, payload):
+        if len(self.players) == 0:
+            self.turn = None
+        else:
+            idx = self.players.index(self.turn)
+            self.turn = self.players[(idx + 1) % len(self.players)]
+        self.robber_moved = False
+        if self.turn is not None:
+            self.record(TURN_ADVANCED, player=self.usernames[self.turn])
+
+        self.roll_dices(rng)
+        if sum(self.dices) == 7:
+            for p in self.players:
+                count = self.count_resources(p)
+                if count > 7:
+                    for _ in range(count // 2):
+                        self.take_random(rng, p)
+        else:
+            self.distribute(sum(self.dices))
+
+    def can_bank_trade(self, player, payload):
+        return (
+            self.count_resources(player, payload["give"]) >= BANK_TRADE_RATE and
+            self.count_resources(None, payload["receive"]) >= 1
+        )
+
+    def bank_trade(self, rng, player, payload):
+        self.transfer(player, None, payload["give"], BANK_TRADE_RATE)
+        self.transfer(None, player, payload["receive"], 1)
+        self.record(
+            BANK_TRADED,
+            player=self.usernames[player],
+            give=payload["give"],
+            receive=payload["receive"]
+        )
+
+    def can_buy_card(self, player, payload):
+        return self.count_cards(None) > 0 and self.can_afford(player, DEVELOPMENT_CARD_COST)
+
+    def buy_card(self, rng, player, payload):
+        self.pay(player, DEVELOPMENT_CARD_COST)
+        self.give_card(player)
+        self.record(CARD_BOUGHT, player=self.usernames[player])
+
+    def can_play_road_building_card(self, player, payload):
+        road_0 = position_edge(*payload[0])
+        road_1 = position_edge(*payload[1])
+        if road_0 is None or road_1 is None or road_0 == road_1:
+            return False
+
+        available = self.occupancy.road_mask(player)
+        return (
+            bool(available >> road_0 & 1) and bool(available >> road_1 & 1) and
+            self.count_cards(player, 'road_building') >= 1
+        )
+
+    def play_road_building_card(self, rng, player, payload):
+        self.take_card(player, 'road_building')
+        for fst, snd in payload:
+            self.add_road(player, position_edge(fst, snd))
+            self.record(ROAD_BUILT, player=self.usernames[player], position=[fst, snd])
+
+    def can_move_robber(self, player, payload):
+        return (
+            self.robber_target_valid(player, payload) and
+            sum(self.dices) == 7 and
+            position_hexagon(payload["position"]) != self.robber and
+            not self.robber_moved
+        )
+
+    def move_robber(self, rng, player, payload):
+        self.move_robber_and_steal(rng, player, payload)
+
+    def can_play_knight_card(self, player, payload):
+        return (
+            self.robber_target_valid(player, payload) and
+            self.count_cards(player, "knight") > 0 and
+            position_hexagon(payload["position"]) != self.robber and
+            not self.robber_moved
+        )
+
+    def play_knight_card(self, rng, player, payload):
+        self.take_card(player, 'knight')
+        self.move_robber_and_steal(rng, player, payload)
+
+
+CAN_APPLY = {
+    "build_settlement": GameState.can_build_settlement,
+    "build_road": GameState.can_build_road,
+    "end_turn": GameState.can_end_turn,
+    "bank_trade": GameState.can_bank_trade,
+    "buy_card": GameState.can_buy_card,
+    "play_road_building_card": GameState.can_play_road_building_card,
+    "move_robber": GameState.can_move_robber,
+    "play_knight_card": GameState.can_play_knight_card,
+}
+
+APPLY_ACTION = {
+    "start_game": GameState.start_game,
+    "build_settlement": GameState.build_settlement,
+    "build_road": GameState.build_road,
+    "end_turn": GameState.end_turn,
+    "bank_trade": GameState.bank_trade,
+    "buy_card": GameState.buy_card,
+    "play_road_building_card": GameState.play_road_building_card,
+    "move_robber": GameState.move_robber,
+    "play_knight_card": GameState.play_knight_card,
+}
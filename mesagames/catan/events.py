@@ -0,0 +1,138 @@
+"""
+Stream of the events of the games (dice rolled, settlement built, ...), so
+clients can apply deltas to the state they already have instead of fetching
+GameStatus again.
+
+Events are recorded on the Game while an action executes (see
+Game.record_event) and published by PlayerAction.post, stamped with the new
+state version, to an in-process broker. Every subscriber has a bounded
+queue: a consumer that falls behind loses its queued events and gets a
+"sync" event instead, telling it to fetch the whole state again, so a slow
+client never blocks the players nor makes the server buffer without limit.
+"""
+import json
+import threading
+import time
+from collections import deque, namedtuple
+from contextlib import contextmanager
+
+DICE_ROLLED = "dice_rolled"
+SETTLEMENT_BUILT = "settlement_built"
+ROAD_BUILT = "road_built"
+ROBBER_MOVED = "robber_moved"
+CARD_BOUGHT = "card_bought"
+BANK_TRADED = "bank_traded"
+TURN_ADVANCED = "turn_advanced"
+WINNER_SET = "winner_set"
+# not an action: the state version the client should be at, sent when the
+# stream starts and when the client fell behind and has to refetch the state
+SYNC = "sync"
+
+MAX_PENDING_EVENTS = 256
+
+GameEvent = namedtuple("GameEvent", ["type", "version", "data"])
+
+
+class Subscription:
+    """Bounded queue of the events published to a subscriber."""
+    def __init__(self, max_pending=MAX_PENDING_EVENTS):
+        self.max_pending = max_pending
+        self._pending = deque()
+        self._overflow_version = None
+        self._ready = threading.Condition()
+
+    def put(self, events):
+        """Queues events, dropping the whole queue if it would exceed max_pending."""
+        if not events:
+            return
+        with self._ready:
+            if self._overflow_version is None and \
+                    len(self._pending) + len(events) <= self.max_pending:
+                self._pending.extend(events)
+            else:
+                self._pending.clear()
+                self._overflow_version = events[-1].version
+            self._ready.notify()
+
+    def get(self, timeout):
+        """
+        Waits at most timeout seconds for events. Returns the queued events
+        and, if some were dropped since the last call, the version the
+        consumer has to resync to (else None).
+        """
+        with self._ready:
+            if not self._pending and self._overflow_version is None:
+                self._ready.wait(timeout)
+            events = list(self._pending)
+            self._pending.clear()
+            overflow_version, self._overflow_version = self._overflow_version, None
+            return events, overflow_version
+
+
+class EventBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = dict()  # game id -> set of Subscription
+
+    @contextmanager
+    def subscribe(self, game_id, max_pending=MAX_PENDING_EVENTS):
+        """Yields a Subscription receiving the events of the game until the block exits."""
+        subscription = Subscription(max_pending)
+        with self._lock:
+            self._subscriptions.setdefault(game_id, set()).add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                subscriptions = self._subscriptions[game_id]
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[game_id]
+
+    def publish(self, game_id, version, events):
+        """Sends (type, data) events to the subscribers of the game, stamped with version."""
+        events = [GameEvent(kind, version, data) for kind, data in events]
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(game_id, ()))
+        for subscription in subscriptions:
+            subscription.put(events)
+
+    def subscribers(self, game_id):
+        """Returns how many subscribers the game has."""
+        with self._lock:
+            return len(self._subscriptions.get(game_id, ()))
+
+
+event_broker = EventBroker()
+
+
+def sse_message(kind, data, id=None):
+    """Formats a Server-Sent Events message."""
+    message = "event: %s\ndata: %s\n\n" % (kind, json.dumps(data))
+    if id is not None:
+        message = "id: %d\n" % id + message
+    return message
+
+
+def event_stream(game_id, load_version, duration, keepalive, broker=event_broker):
+    """
+    Yields the Server-Sent Events messages of the game for duration seconds,
+    starting with a sync to the version returned by load_version() and
+    sending a comment every keepalive seconds without events.
+    """
+    with broker.subscribe(game_id) as subscription:
+        # subscribed before reading the version, so nothing is missed in between
+        version = load_version()
+        yield sse_message(SYNC, {"version": version}, version)
+
+        deadline = time.monotonic() + duration
+        remaining = duration
+        while remaining > 0:
+            events, overflow_version = subscription.get(min(remaining, keepalive))
+            if overflow_version is not None:
+                yield sse_message(SYNC, {"version": overflow_version}, overflow_version)
+            elif events:
+                yield "".join(sse_message(e.type, e.data, e.version) for e in events)
+            else:
+                yield ": keepalive\n\n"
+            remaining = deadline - time.monotonic()
@@ -0,0 +1,134 @@
+"""
+Serializes the actions of each game: requests playing on the same game
+take turns in arrival order, while different games run in parallel.
+
+Within a process, every game has a queue of waiting requests and only the
+first one runs. Across processes (several workers), the game is also
+locked with flock on a file of the CATAN_GAME_LOCK_DIR setting, which
+defaults to a directory under the system temporary one and can be set to
+None when a single process serves the games. Platforms without fcntl only
+get the in-process queue; the version check of catan.store still rejects
+conflicting writes there.
+
+The requests run their own action once it is their turn, instead of
+handing it to a worker thread, so it uses the database connection (and
+transaction) of the request.
+"""
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # not on POSIX
+    fcntl = None
+
+DEFAULT_LOCK_DIR = os.path.join(tempfile.gettempdir(), "catan-locks")
+# Seconds a request waits for its turn before giving up.
+QUEUE_TIMEOUT = 30
+FILE_LOCK_RETRY = 0.01
+
+
+class GameBusy(Exception):
+    """The game stayed busy for longer than the timeout."""
+
+
+class GameExecutor:
+    def __init__(self, lock_dir=DEFAULT_LOCK_DIR):
+        self.lock_dir = lock_dir
+        self._lock = threading.Lock()
+        self._queues = dict()  # game id -> deque of threading.Event, the first one runs
+
+    @contextmanager
+    def serialized(self, game_id, timeout=QUEUE_TIMEOUT):
+        """
+        Waits until it is the turn of the caller on the game and holds it
+        until the block exits. Raises GameBusy after timeout seconds.
+        """
+        deadline = time.monotonic() + timeout
+        self._enqueue(game_id, deadline)
+        try:
+            with self._file_lock(game_id, deadline):
+                yield
+        finally:
+            self._dequeue(game_id)
+
+    def run(self, game_id, function, *args, **kwargs):
+        """Calls function in the turn of the caller on the game."""
+        with self.serialized(game_id):
+            return function(*args, **kwargs)
+
+    def waiting(self, game_id):
+        """Returns how many requests are running or waiting on the game."""
+        with self._lock:
+            return len(self._queues.get(game_id, ()))
+
+    def _enqueue(self, game_id, deadline):
+        ticket = threading.Event()
+        with self._lock:
+            queue = self._queues.setdefault(game_id, deque())
+            queue.append(ticket)
+            if len(queue) == 1:
+                ticket.set()
+        if ticket.wait(max(0, deadline - time.monotonic())):
+            return
+        with self._lock:
+            if ticket.is_set():
+                return  # our turn came while timing out
+            queue = self._queues[game_id]
+            queue.remove(ticket)
+        raise GameBusy()
+
+    def _dequeue(self, game_id):
+        with self._lock:
+            queue = self._queues[game_id]
+            queue.popleft()
+            if queue:
+                queue[0].set()
+            else:
+                del self._queues[game_id]
+
+    @contextmanager
+    def _file_lock(self, game_id, deadline):
+        if self.lock_dir is None or fcntl is None:
+            yield
+            return
+
+        os.makedirs(self.lock_dir, exist_ok=True)
+        fd = os.open(os.path.join(self.lock_dir, "game-%d.lock" % game_id), os.O_RDWR | os.O_CREAT)
+        try:
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        raise GameBusy()
+                    time.sleep(FILE_LOCK_RETRY)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+
+_game_executor = None
+_game_executor_lock = threading.Lock()
+
+
+def get_game_executor():
+    """Returns the process wide executor, locking files in the configured directory."""
+    global _game_executor
+    if _game_executor is None:
+        with _game_executor_lock:
+            if _game_executor is None:
+                _game_executor = GameExecutor(
+                    getattr(settings, "CATAN_GAME_LOCK_DIR", DEFAULT_LOCK_DIR)
+                )
+    return _game_executor
@@ -0,0 +1,55 @@
+"""
+Creation of the initial state of a game.
+"""
+from django.db import transaction
+from catan.engine import GameState
+from catan.models import *
+from catan.store import persist
+
+COLOURS = ['red', 'green', 'yellow', 'blue']
+
+
+def start_game(room, first_user):
+    """
+    Creates the game of the room with all its players, buildings and cards in
+    a single transaction using bulk inserts, plays the first roll with
+    first_user in turn on its GameState and marks the room as started.
+    Returns the game.
+    """
+    with transaction.atomic():
+        seed = new_seed()
+        before = GameState(seed, Hexagon.of_board(room.board_id_id))
+        game = Game.objects.create(
+            board=room.board_id, name=room.name, seed=seed, snapshot=before.dumps()
+        )
+
+        Player.objects.bulk_create([
+            Player(user=u, game=game, colour=COLOURS[i])
+            for i, u in enumerate(room.players.all())
+        ])
+        # not every backend sets the primary keys on bulk_create
+        players = list(
+            Player.objects
+                  .filter(game=game)
+                  .order_by('id')
+                  .values_list('id', 'user_id', 'user__username')
+        )
+
+        # movimiento inicial de la partida
+        payload = {
+            "players": [[p, name] for p, _, name in players],
+            "first_turn": next(p for p, user, _ in players if user == first_user.id),
+        }
+        after = before.copy()
+        after.apply(before.version + 1, None, "start_game", payload)
+        DevelopmentCard.objects.bulk_create([
+            DevelopmentCard(game=game, player=None, card=card) for card, _ in after.cards
+        ])
+        persist(game, before, after)
+        ActionLog.append(game, None, "start_game", payload)
+
+        room.game_has_started = True
+        room.game_id = game
+        room.save()
+
+    return game
@@ -0,0 +1,119 @@
+"""
+Procedural boards: shuffles the standard resources and tokens over the 19
+hexagons, drops the layouts with a 6 or an 8 next to each other and keeps
+the fairest ones (see the generate_boards command).
+
+Layouts are generated and scored in NumPy batches, as two (count,
+HEXAGON_COUNT) integer arrays: the index of the resource in RESOURCES (or
+DESERT) and the token of every hexagon.
+"""
+import numpy as np
+from django.db import transaction
+
+from catan.analysis import ADJACENCY, DICE_PROBABILITY, RESOURCES, STARTING_VERTICES
+from catan.models import Board, Hexagon
+from catan.rules import *
+from catan.topology import *
+
+DESERT = -1
+LAYOUT_BATCH = 10000
+
+_RESOURCE_CODES = np.array([RESOURCES.index(r) for r in BOARD_RESOURCES] + [DESERT])
+_TOKENS = np.array(BOARD_TOKENS)
+
+# hexagons sharing a side, as two arrays of hexagon ids
+_NEIGHBORS = np.array([
+    (h, g)
+    for h in range(HEXAGON_COUNT)
+    for g in range(h + 1, HEXAGON_COUNT)
+    if len(set(HEX_VERTICES[h]) & set(HEX_VERTICES[g])) == 2
+]).T
+
+
+def generate_layouts(count, rng):
+    """Returns the resources and tokens of count shuffled layouts, valid or not."""
+    resources = rng.permuted(np.tile(_RESOURCE_CODES, (count, 1)), axis=1)
+    tokens = np.zeros((count, HEXAGON_COUNT), dtype=np.int64)
+    # every row has one desert, so the shuffled tokens fill the rest in order
+    tokens[resources != DESERT] = rng.permuted(np.tile(_TOKENS, (count, 1)), axis=1).ravel()
+    return resources, tokens
+
+
+def valid_layouts(tokens):
+    """Returns the mask of the layouts without two neighbor hexagons on 6 or 8."""
+    hot = (tokens == 6) | (tokens == 8)
+    return ~(hot[:, _NEIGHBORS[0]] & hot[:, _NEIGHBORS[1]]).any(axis=1)
+
+
+def score_layouts(resources, tokens):
+    """
+    Returns the unfairness of each layout, the lower the better: how much
+    more the best starting seat produces per roll than the worst, plus how
+    much more a hexagon of the most produced resource yields on average
+    than one of the least produced.
+    """
+    hex_yield = DICE_PROBABILITY[tokens]
+    seat_yield = (hex_yield @ ADJACENCY.T)[:, STARTING_VERTICES].sum(axis=2)
+
+    kinds = resources[:, :, np.newaxis] == np.arange(len(RESOURCES))
+    resource_yield = (hex_yield[:, :, np.newaxis] * kinds).sum(axis=1) / kinds.sum(axis=1)
+
+    return (
+        seat_yield.max(axis=1) - seat_yield.min(axis=1) +
+        resource_yield.max(axis=1) - resource_yield.min(axis=1)
+    )
+
+
+def best_layouts(candidates, keep, rng):
+    """
+    Generates candidates layouts and returns the resources, tokens and
+    scores of the keep fairest valid ones, best first.
+    """
+    best_resources = np.zeros((0, HEXAGON_COUNT), dtype=np.int64)
+    best_tokens = np.zeros((0, HEXAGON_COUNT), dtype=np.int64)
+    best_scores = np.zeros(0)
+    for start in range(0, candidates, LAYOUT_BATCH):
+        resources, tokens = generate_layouts(min(LAYOUT_BATCH, candidates - start), rng)
+        valid = valid_layouts(tokens)
+        resources, tokens = resources[valid], tokens[valid]
+        scores = np.concatenate([best_scores, score_layouts(resources, tokens)])
+        resources = np.concatenate([best_resources, resources])
+        tokens = np.concatenate([best_tokens, tokens])
+        order = np.argsort(scores, kind='stable')[:keep]
+        best_resources, best_tokens, best_scores = resources[order], tokens[order], scores[order]
+    return best_resources, best_tokens, best_scores
+
+
+def layout_hexes(resources, tokens):
+    """Returns the (hexagon id, resource, token) tuples of one layout."""
+    return [
+        (h, RESOURCES[r] if r != DESERT else None, int(t))
+        for h, (r, t) in enumerate(zip(resources, tokens))
+    ]
+
+
+def save_boards(names, resources, tokens):
+    """
+    Stores the layouts as Boards with the given (distinct) names, in two
+    inserts. Returns the boards in the order of names.
+    """
+    with transaction.atomic():
+        Board.objects.bulk_create([Board(name=name) for name in names])
+        # not every backend sets the primary keys on bulk_create; older boards
+        # may share a name, so the newest one of each name is the one inserted
+        by_name = dict(
+            Board.objects.filter(name__in=names).order_by('id').values_list('name', 'id')
+        )
+        boards = [Board(id=by_name[name], name=name) for name in names]
+        Hexagon.objects.bulk_create([
+            Hexagon(
+                board=board,
+                pos_level=HEXAGON_POSITIONS[h][0],
+                pos_index=HEXAGON_POSITIONS[h][1],
+                resource=resource,
+                token=token
+            )
+            for board, layout in zip(boards, zip(resources, tokens))
+            for h, resource, token in layout_hexes(*layout)
+        ])
+    return boards
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from catan.analysis import RESOURCES, analyze
+from catan.models import Board, Hexagon
+from catan.topology import VERTEX_POSITIONS
+
+
+class Command(BaseCommand):
+    help = "Estimates the resources each vertex and starting seat of a board produce per roll."
+
+    def add_arguments(self, parser):
+        parser.add_argument('board', help="Name of the board.")
+        parser.add_argument('--rolls', type=int, default=1000000)
+        parser.add_argument('--seed', type=int)
+        parser.add_argument('--top', type=int, default=10, help="Best vertices to list.")
+
+    def handle(self, *args, **options):
+        board = Board.objects.filter(name=options['board']).first()
+        if board is None:
+            raise CommandError("No board named %s." % options['board'])
+        if options['rolls'] < 1:
+            raise CommandError("--rolls must be positive.")
+
+        analysis = analyze(Hexagon.of_board(board.id), options['rolls'], options['seed'])
+
+        self.stdout.write("%d rolls, resources per roll (%s)" % (
+            analysis.rolls, ", ".join(RESOURCES)
+        ))
+        totals = analysis.seat_yield.sum(axis=1)
+        for seat, (produced, total) in enumerate(zip(analysis.seat_yield, totals), 1):
+            self.stdout.write("seat %d: %.3f [%s]" % (seat, total, format_yield(produced)))
+        self.stdout.write("seat spread: %.3f" % (totals.max() - totals.min()))
+
+        vertex_totals = analysis.vertex_yield.sum(axis=1)
+        for v in vertex_totals.argsort()[::-1][:options['top']]:
+            level, index = VERTEX_POSITIONS[v]
+            self.stdout.write("vertex (%d, %d): %.3f [%s]" % (
+                level, index, vertex_totals[v], format_yield(analysis.vertex_yield[v])
+            ))
+
+
+def format_yield(produced):
+    return " ".join("%.3f" % amount for amount in produced)
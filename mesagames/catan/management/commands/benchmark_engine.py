@@ -0,0 +1,56 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from catan.engine import GameState
+from catan.moves import apply_move, decode_move, legal_moves
+from catan.simulation import random_board
+
+
+class Command(BaseCommand):
+    help = "Measures how fast bots can copy, search and undo a mid-game state."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--warmup', type=int, default=300, help="Moves played before timing.")
+        parser.add_argument('--iterations', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError("--iterations must be positive.")
+        rng = random.Random(options['seed'])
+        state = GameState(options['seed'], random_board(rng))
+        players = [[1, "ana"], [2, "beto"], [3, "carla"], [4, "dario"]]
+        state.apply(1, None, "start_game", {"players": players, "first_turn": 1})
+        for _ in range(options['warmup']):
+            moves = legal_moves(state)
+            apply_move(state, moves[rng.randrange(len(moves))])
+
+        iterations = options['iterations']
+        self.report("copies", iterations, lambda: timed(state.copy, iterations))
+        self.report(
+            "legal_moves", iterations, lambda: timed(lambda: legal_moves(state), iterations)
+        )
+
+        moves = [decode_move(state, move) for move in legal_moves(state)]
+        player = state.turn
+
+        def push_undo():
+            for action, payload in moves:
+                state.push(player, action, payload)
+                state.undo()
+        rounds = max(1, iterations // len(moves))
+        self.report("push+undo", rounds * len(moves), lambda: timed(push_undo, rounds))
+
+    def report(self, name, count, run):
+        seconds = run()
+        self.stdout.write("%s: %.0f/s (%.2fus each)" % (
+            name, count / seconds, seconds / count * 1e6
+        ))
+
+
+def timed(function, times):
+    start = time.perf_counter()
+    for _ in range(times):
+        function()
+    return time.perf_counter() - start
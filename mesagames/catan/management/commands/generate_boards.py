@@ -0,0 +1,37 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from catan.generation import best_layouts, save_boards
+
+MAX_NAME_LENGTH = 30
+
+
+class Command(BaseCommand):
+    help = "Generates random board layouts and stores the fairest ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--candidates', type=int, default=100000)
+        parser.add_argument('--keep', type=int, default=10, help="Boards to store.")
+        parser.add_argument('--seed', type=int)
+        parser.add_argument('--prefix', default='generated', help="Name of the boards, numbered.")
+
+    def handle(self, *args, **options):
+        if options['candidates'] < 1 or options['keep'] < 1:
+            raise CommandError("--candidates and --keep must be positive.")
+        names = ["%s %d" % (options['prefix'], i + 1) for i in range(options['keep'])]
+        if len(names[-1]) > MAX_NAME_LENGTH:
+            raise CommandError("Board names are up to %d characters." % MAX_NAME_LENGTH)
+
+        start = time.perf_counter()
+        resources, tokens, scores = best_layouts(
+            options['candidates'], options['keep'], np.random.default_rng(options['seed'])
+        )
+        seconds = time.perf_counter() - start
+        self.stdout.write("%d candidates in %.2fs (%.0f/s)" % (
+            options['candidates'], seconds, options['candidates'] / seconds
+        ))
+
+        boards = save_boards(names[:len(scores)], resources, tokens)
+        for board, score in zip(boards, scores):
+            self.stdout.write("%s: unfairness %.4f" % (board.name, score))
@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+from catan.models import Board, Hexagon
+from catan.simulation import BOTS, simulate
+
+
+class Command(BaseCommand):
+    help = "Plays games between bots on the in-memory engine and reports how fast they run."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--games', type=int, default=100)
+        parser.add_argument('--processes', type=int, default=1)
+        parser.add_argument(
+            '--bots', default='random,random,random,random',
+            help="Comma separated bot policies, one per player: %s." % ", ".join(sorted(BOTS))
+        )
+        parser.add_argument('--max-turns', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--board', help="Name of the board to play on, else every game gets a random one."
+        )
+
+    def handle(self, *args, **options):
+        bots = options['bots'].split(',')
+        unknown = [b for b in bots if b not in BOTS]
+        if unknown:
+            raise CommandError("Unknown bot policies: %s" % ", ".join(unknown))
+        if not 2 <= len(bots) <= 4:
+            raise CommandError("A game needs 2 to 4 players.")
+        if options['games'] < 1:
+            raise CommandError("--games must be positive.")
+
+        hexes = None
+        if options['board'] is not None:
+            board = Board.objects.filter(name=options['board']).first()
+            if board is None:
+                raise CommandError("No board named %s." % options['board'])
+            hexes = Hexagon.of_board(board.id)
+
+        results, seconds = simulate(
+            options['games'], bots, options['max_turns'],
+            seed=options['seed'], processes=options['processes'], hexes=hexes
+        )
+
+        games = len(results)
+        turns = sum(r.turns for r in results)
+        actions = sum(r.actions for r in results)
+        wins = dict()
+        for r in results:
+            wins[r.winner] = wins.get(r.winner, 0) + 1
+        timings = dict()
+        for r in results:
+            for action, (count, elapsed) in r.timings.items():
+                total_count, total_elapsed = timings.get(action, (0, 0.0))
+                timings[action] = (total_count + count, total_elapsed + elapsed)
+
+        self.stdout.write("games: %d in %.2fs (%.1f games/s)" % (games, seconds, games / seconds))
+        self.stdout.write("turns/game: %.1f" % (turns / games))
+        self.stdout.write("actions/game: %.1f" % (actions / games))
+        self.stdout.write("unfinished: %d" % wins.pop(None, 0))
+        for seat, name in enumerate(bots, 1):
+            self.stdout.write("wins %s%d: %d" % (name, seat, wins.get(seat, 0)))
+        for action, (count, elapsed) in sorted(timings.items()):
+            self.stdout.write("%s: %d played, %.1fus/action" % (
+                action, count, elapsed / count * 1e6
+            ))
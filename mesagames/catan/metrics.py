@@ -0,0 +1,191 @@
+"""
+Request metrics: for every request, its SQL queries, time spent in the
+database, time spent rendering the response and wall time, grouped by view,
+method, action (for the action endpoints) and status.
+
+MetricsMiddleware records them in a process wide registry, served in the
+Prometheus text format by the /metrics view to local clients, and logs as
+one JSON line the requests slower than CATAN_SLOW_REQUEST_SECONDS.
+Each worker process exposes its own numbers.
+"""
+import ipaddress
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.http import Http404, HttpResponse
+
+logger = logging.getLogger(__name__)
+
+SLOW_REQUEST_SECONDS = 0.5
+# upper bounds of the buckets of the request duration histogram
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LABELS = ("view", "method", "action", "status")
+
+
+class RequestMetrics:
+    """What was measured of one request."""
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+        self.action = ""
+
+    def __call__(self, execute, sql, params, many, context):
+        """Database execute wrapper, see connection.execute_wrapper."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - start
+            self.queries += 1
+
+
+class MetricsRegistry:
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # labels -> [requests, queries, db, render, wall seconds, bucket counts]
+        self._series = dict()
+
+    def observe(self, labels, metrics, wall_seconds):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0, 0, 0.0, 0.0, 0.0, [0] * len(self.buckets)]
+            series[0] += 1
+            series[1] += metrics.queries
+            series[2] += metrics.db_seconds
+            series[3] += metrics.render_seconds
+            series[4] += wall_seconds
+            for i, bound in enumerate(self.buckets):
+                if wall_seconds <= bound:
+                    series[5][i] += 1
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def exposition(self):
+        """Returns the metrics in the Prometheus text format."""
+        with self._lock:
+            series = sorted(
+                (labels, s[:5] + [list(s[5])]) for labels, s in self._series.items()
+            )
+
+        lines = []
+
+        def family(name, kind, help, values):
+            lines.append("# HELP %s %s" % (name, help))
+            lines.append("# TYPE %s %s" % (name, kind))
+            for labels, value in values:
+                lines.append("%s{%s} %s" % (name, format_labels(labels), format_value(value)))
+
+        family("catan_requests_total", "counter", "Requests served.",
+               [(labels, s[0]) for labels, s in series])
+        family("catan_request_queries_total", "counter", "SQL queries run by the requests.",
+               [(labels, s[1]) for labels, s in series])
+        family("catan_request_db_seconds_total", "counter", "Time spent in the database.",
+               [(labels, s[2]) for labels, s in series])
+        family("catan_request_render_seconds_total", "counter", "Time spent rendering responses.",
+               [(labels, s[3]) for labels, s in series])
+
+        name = "catan_request_duration_seconds"
+        lines.append("# HELP %s Wall time of the requests." % name)
+        lines.append("# TYPE %s histogram" % name)
+        for labels, s in series:
+            for bound, count in zip(self.buckets, s[5]):
+                lines.append("%s_bucket{%s} %d" % (
+                    name, format_labels(labels + (("le", format_value(float(bound))),)), count
+                ))
+            lines.append("%s_bucket{%s} %d" % (
+                name, format_labels(labels + (("le", "+Inf"),)), s[0]
+            ))
+            lines.append("%s_sum{%s} %s" % (name, format_labels(labels), format_value(s[4])))
+            lines.append("%s_count{%s} %d" % (name, format_labels(labels), s[0]))
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    return ",".join(
+        '%s="%s"' % (key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in labels
+    )
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+metrics_registry = MetricsRegistry()
+# functions returning more metrics for /metrics, in the Prometheus text format
+_collectors = [metrics_registry.exposition]
+
+
+def register_collector(exposition):
+    """Adds the metrics returned by exposition() to /metrics."""
+    if exposition not in _collectors:
+        _collectors.append(exposition)
+
+
+def tag_request(request, action):
+    """Labels the metrics of the request (a Django or DRF one) with the action played."""
+    metrics = getattr(getattr(request, "_request", request), "metrics", None)
+    if metrics is not None:
+        metrics.action = action
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response, registry=metrics_registry):
+        self.get_response = get_response
+        self.registry = registry
+
+    def __call__(self, request):
+        request.metrics = metrics = RequestMetrics()
+        start = time.perf_counter()
+        with connection.execute_wrapper(metrics):
+            response = self.get_response(request)
+        wall_seconds = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = match.view_name if match is not None else "unresolved"
+        labels = tuple(zip(LABELS, (view, request.method, metrics.action, response.status_code)))
+        self.registry.observe(labels, metrics, wall_seconds)
+
+        slow = getattr(settings, "CATAN_SLOW_REQUEST_SECONDS", SLOW_REQUEST_SECONDS)
+        if slow is not None and wall_seconds >= slow:
+            logger.warning(json.dumps(dict(
+                labels,
+                path=request.path,
+                queries=metrics.queries,
+                db_ms=round(metrics.db_seconds * 1000, 3),
+                render_ms=round(metrics.render_seconds * 1000, 3),
+                wall_ms=round(wall_seconds * 1000, 3),
+            )))
+        return response
+
+    def process_template_response(self, request, response):
+        """Times the rendering of DRF responses, which happens after this hook."""
+        start = time.perf_counter()
+
+        def rendered(response):
+            request.metrics.render_seconds += time.perf_counter() - start
+        response.add_post_render_callback(rendered)
+        return response
+
+
+def metrics_view(request):
+    """The metrics of this process, for Prometheus, only to clients on the local machine."""
+    try:
+        local = ipaddress.ip_address(request.META.get("REMOTE_ADDR", "")).is_loopback
+    except ValueError:
+        local = False
+    if not local and request.META.get("REMOTE_ADDR") not in settings.INTERNAL_IPS:
+        raise Http404
+    return HttpResponse(
+        "".join(exposition() for exposition in _collectors),
+        content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
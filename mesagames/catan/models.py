@@ -1,19 +1,15 @@
 import random
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from catan.cache import get_state_cache
+from catan.engine import GameState
+from catan.rules import *
+from catan.topology import *
+from catan.occupancy import Occupancy
 
-RESOURCE_TYPES = (
-    ('brick', 'Brick'),
-    ('lumber', 'Lumber'),
-    ('wool', 'Wool'),
-    ('grain', 'Grain'),
-    ('ore', 'Ore'),
-)
-
-CARD_TYPES = (
-    ('road_building', 'Road Building'),
-    ('knight', 'Knight'),
-)
+IDEMPOTENCY_KEY_LENGTH = 64
 
 
 def is_valid_resource(resource):
@@ -27,17 +23,6 @@ def is_valid_level(level):
     return level in range(0, 3)
 
 
-def vertex_count(level):
-    return 6 * (1 + level * 2)
-
-
-def hexagon_count(level):
-    if level == 0:
-        return 1
-    else:
-        return level * 6
-
-
 def is_valid_vert_index(level, index):
     return index in range(0, vertex_count(level))
 
@@ -47,99 +32,23 @@ def is_valid_hex_index(level, index):
 
 
 def next_neighbors(vertex):
-    count = vertex_count(vertex[0])
-    result = [
-        (vertex[0], (vertex[1] + 1) % count),
-        (vertex[0], (vertex[1] - 1) % count)
-    ]
-    return result
+    return list(VERTEX_NEIGHBOR_POSITIONS.get(vertex, ())[:2])
 
 
 def get_vertex(pos_level, pos_index):
-    vertexs = []
-    if pos_level == 0:
-        vertexs = [(0, 0), (0, 1), (0, 2), (0, 3), (0, 4), (0, 5)]
-    elif pos_level == 1:
-        if pos_index == 0:
-            vertexs = [(0, 0), (0, 1), (1, 0), (1, 1), (1, 2), (1, 3)]
-        elif pos_index == 1:
-            vertexs = [(0, 1), (0, 2), (1, 3), (1, 4), (1, 5), (1, 6)]
-        elif pos_index == 2:
-            vertexs = [(0, 2), (0, 3), (1, 6), (1, 7), (1, 8), (1, 9)]
-        elif pos_index == 3:
-            vertexs = [(0, 3), (0, 4), (1, 9), (1, 10), (1, 11), (1, 12)]
-        elif pos_index == 4:
-            vertexs = [(0, 4), (0, 5), (1, 12), (1, 13), (1, 14), (1, 15)]
-        elif pos_index == 5:
-            vertexs = [(0, 0), (0, 5), (1, 0), (1, 15), (1, 16), (1, 17)]
-    elif pos_level == 2:
-        if pos_index == 0:
-            vertexs = [(1, 0), (1, 1), (2, 0), (2, 1), (1, 17), (2, 29)]
-        elif pos_index == 1:
-            vertexs = [(1, 1), (1, 2), (2, 1), (2, 2), (2, 3), (2, 4)]
-        elif pos_index == 2:
-            vertexs = [(1, 2), (1, 3), (1, 4), (2, 4), (2, 5), (2, 6)]
-        elif pos_index == 3:
-            vertexs = [(1, 4), (1, 5), (2, 6), (2, 7), (2, 8), (2, 9)]
-        elif pos_index == 4:
-            vertexs = [(1, 5), (1, 6), (1, 7), (2, 9), (2, 10), (2, 11)]
-        elif pos_index == 5:
-            vertexs = [(1, 7), (1, 8), (2, 11), (2, 12), (2, 13), (2, 14)]
-        elif pos_index == 6:
-            vertexs = [(1, 8), (1, 9), (1, 10), (2, 14), (2, 15), (2, 16)]
-        elif pos_index == 7:
-            vertexs = [(1, 10), (1, 11), (2, 16), (2, 17), (2, 18), (2, 19)]
-        elif pos_index == 8:
-            vertexs = [(1, 11), (1, 12), (1, 13), (2, 19), (2, 20), (2, 21)]
-        elif pos_index == 9:
-            vertexs = [(1, 13), (1, 14), (2, 21), (2, 22), (2, 23), (2, 24)]
-        elif pos_index == 10:
-            vertexs = [(1, 14), (1, 15), (1, 16), (2, 24), (2, 25), (2, 26)]
-        elif pos_index == 11:
-            vertexs = [(1, 16), (1, 17), (2, 26), (2, 27), (2, 28), (2, 29)]
-    return vertexs
+    return list(HEXAGON_VERTEX_POSITIONS.get((pos_level, pos_index), ()))
 
 
 def extern_neighbor(vertex):
-    result = []
-
-    level = vertex[0]
-    index = vertex[1]
-
-    if level == 0:
-        result.append((1, index * 3))
-    elif level == 1:
-        if index % 3 == 0:
-            result.append((0, index // 3))
-        else:
-            result.append((2, (index % 3)**2 + 5 * (index // 3)))
-    else:
-        if index % 5 == 1:
-            result.append((1, 1 + 3 * (index // 5)))
-        elif index % 5 == 4:
-            result.append((1, 2 + 3 * (index // 5)))
-    return result
+    return list(VERTEX_NEIGHBOR_POSITIONS.get(vertex, ())[2:])
 
 
 def get_neighbors(vertex):
-    return next_neighbors(vertex) + extern_neighbor(vertex)
-
+    return list(VERTEX_NEIGHBOR_POSITIONS.get(vertex, ()))
 
-def get_adjacent_players(game, hex_level, hex_index):
-    result = []
-    for v in get_vertex(hex_level, hex_index):
-        city = CityBuilding.objects.filter(game=game, pos_level=v[0], pos_index=v[1])
-        sett = SettlementBuilding.objects.filter(game=game, pos_level=v[0], pos_index=v[1])
 
-        if city.count() == 1:
-            owner = city[0].owner
-            if owner not in result:
-                result.append(owner)
-        elif sett.count() == 1:
-            owner = sett[0].owner
-            if owner not in result:
-                result.append(owner)
-    return result
+def new_seed():
+    return random.getrandbits(62)
 
 
 class Board(models.Model):
@@ -159,6 +68,17 @@ class Hexagon(models.Model):
     def __str__(self):
         return "Hexagon (" + str(self.pos_level) + ", " + str(self.pos_index) + ")"
 
+    @staticmethod
+    def of_board(board_id):
+        """Returns the (hexagon id, resource, token) tuples of the board."""
+        hexes = [
+            (hexagon_id((level, index)), resource, token)
+            for level, index, resource, token in Hexagon.objects
+            .filter(board=board_id)
+            .values_list('pos_level', 'pos_index', 'resource', 'token')
+        ]
+        return [h for h in hexes if h[0] is not None]
+
 
 class Game(models.Model):
     board = models.ForeignKey(Board, on_delete=models.CASCADE)
@@ -182,11 +102,39 @@ class Game(models.Model):
         on_delete=models.PROTECT,
     )
     robber_moved = models.BooleanField(default=False)
+    # Bumped every time an action changes the game, see bump_version.
+    version = models.IntegerField(default=0)
+    # Seed of the random generators of the actions, see catan.engine.action_rng.
+    seed = models.BigIntegerField(default=new_seed)
+    # Serialized GameState of some version, see catan.store.load_state. Only games
+    # created with start_game have one.
+    snapshot = models.TextField(blank=True, null=True)
+
+    @staticmethod
+    def points(settlements, cities):
+        """Victory points given by the amount of settlements and cities."""
+        return settlements * SETTLEMENT_POINTS + cities * CITY_POINTS
 
     def calculate_points(self, player):
         setts = SettlementBuilding.objects.filter(game=self, owner=player).count()
         cities = CityBuilding.objects.filter(game=self, owner=player).count()
-        return setts * 1 + cities * 2
+        return Game.points(setts, cities)
+
+    def bump_version(self):
+        """Marks the state of the game as changed, so cached views are not reused."""
+        Game.objects.filter(pk=self.pk).update(version=models.F('version') + 1)
+        self.refresh_from_db(fields=['version'])
+
+    def record_event(self, kind, **data):
+        """
+        Records an event of the action being played, published to the event
+        stream by PlayerAction.post once it is done (see catan.events).
+        """
+        self.__dict__.setdefault('recorded_events', []).append((kind, data))
+
+    def pop_events(self):
+        """Returns the recorded (type, data) events and forgets them."""
+        return self.__dict__.pop('recorded_events', [])
 
     def get_winner_name_or_none(self):
         res = None
@@ -195,79 +143,22 @@ class Game(models.Model):
 
         return res
 
-    def try_set_to_winner(self, player):
-        if self.calculate_points(player) >= 10:
-            self.winner = player
-            self.save()
-            return True
-
-        return False
-
-    def reset_dices(self):
-        self.current_dices_1 = 0
-        self.current_dices_2 = 0
-        self.save()
-
     def are_dices_rolled(self):
         return self.current_dices_1 != 0 and self.current_dices_2 != 0
 
-    def roll_dices(self):
-        self.current_dices_1 = random.randint(1, 6)
-        self.current_dices_2 = random.randint(1, 6)
-        self.save()
-
     def dices_sum(self):
         return self.current_dices_1 + self.current_dices_2
 
-    def advance_turn(self):
-        players = [p for p in Player.objects.filter(game=self.id)]
-        if len(players) == 0:
-            self.current_turn = None
-        else:
-            idx = players.index(self.current_turn)
-            self.current_turn = players[(idx + 1) % len(players)]
-        self.robber_moved = False
-        self.save()
-
-    def robber_activate(self):
-        for player in Player.objects.filter(game=self):
-            count = ResourcesCard.count_player_all(player)
-            if count > 7:
-                for _ in range(count // 2):
-                    ResourcesCard.take_random(player)
-
-    def move_robber(self, position):
-        self.robber_level = position[0]
-        self.robber_index = position[1]
-        self.robber_moved = True
-        self.save()
-
-    def distribute_resources(self, dices):
-        hexagons = Hexagon.objects.filter(board=self.board, token=dices)
-        for hexagon in hexagons:
-            if not (self.robber_level, self.robber_index) == (hexagon.pos_level, hexagon.pos_index):
-                vertexs = get_vertex(hexagon.pos_level, hexagon.pos_index)
-                for v in vertexs:
-                    city = CityBuilding.objects.filter(
-                                    game=self,
-                                    pos_level=v[0],
-                                    pos_index=v[1])
-                    sett = SettlementBuilding.objects.filter(
-                                    game=self,
-                                    pos_level=v[0],
-                                    pos_index=v[1])
-                    if city.count() == 1:
-                        ResourcesCard.give(city[0].owner, hexagon.resource, 2)
-                    elif sett.count() == 1:
-                        ResourcesCard.give(sett[0].owner, hexagon.resource, 1)
-
-    def steal_resource(self, player, target):
-        if target is None:
-            possible_players = get_adjacent_players(self, self.robber_level, self.robber_index)
-            if possible_players == []:
-                return
-            target = random.choice(possible_players)
-        ResourcesCard.take_random(target, player)
+    def board_hexes(self):
+        """Returns the (hexagon id, resource, token) tuples of the board."""
+        return Hexagon.of_board(self.board_id)
+
+    def replay(self, version=None):
+        """
+        Rebuilds the state of the game in memory from its action log, up to
+        the given version (by default, the last one). Returns a GameState.
+        """
+        return ActionLog.replay_onto(GameState(self.seed, self.board_hexes()), self.id, version)
 
     def __str__(self):
         return "Game (" + str(self.id) + ")"
@@ -304,6 +195,10 @@ class Player(models.Model):
 
 
 class ResourcesCard(models.Model):
+    """
+    Counter of the cards of one resource held by a player (or by the bank)
+    in a game. There is at most one row per (game, holder, resource).
+    """
     game = models.ForeignKey(Game, on_delete=models.CASCADE)
     player = models.ForeignKey(
         Player,
@@ -312,70 +207,103 @@ class ResourcesCard(models.Model):
         on_delete=models.SET_NULL,
     )
     resource = models.CharField(max_length=10, choices=RESOURCE_TYPES)
+    amount = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['game', 'player', 'resource'],
+                name='unique_player_resource'
+            ),
+            models.UniqueConstraint(
+                fields=['game', 'resource'],
+                condition=models.Q(player=None),
+                name='unique_bank_resource'
+            ),
+        ]
 
     def is_owned_by_bank(self):
         return self.player is None
 
+    @staticmethod
+    def count(game_id, player_id, resource=None):
+        """Returns the number of cards (of such resource, if given) the holder has."""
+        cards = ResourcesCard.objects.filter(game=game_id, player=player_id)
+        if resource is not None:
+            cards = cards.filter(resource=resource)
+        return cards.aggregate(total=models.Sum('amount'))['total'] or 0
+
+    @staticmethod
+    def count_by_player(game_id):
+        """Returns {player id: total resources} for every player holding cards."""
+        return dict(
+            ResourcesCard.objects
+                         .filter(game=game_id, player__isnull=False)
+                         .order_by()
+                         .values_list('player')
+                         .annotate(models.Sum('amount'))
+        )
+
     @staticmethod
     def count_player(player, resource):
         """Returns the number of cards of such resource player has."""
-        return ResourcesCard.objects \
-                            .filter(game=player.game, player=player, resource=resource) \
-                            .count()
+        return ResourcesCard.count(player.game_id, player.id, resource)
 
     @staticmethod
     def count_player_all(player):
         """Returns the total number of resources the player has."""
-        return ResourcesCard.objects \
-                            .filter(game=player.game, player=player) \
-                            .count()
+        return ResourcesCard.count(player.game_id, player.id)
 
     @staticmethod
     def count_bank(game, resource):
         """Returns the number of cards of such resource the bank has."""
-        return ResourcesCard.objects \
-                            .filter(game=game, player=None, resource=resource) \
-                            .count()
+        return ResourcesCard.count(game.id, None, resource)
 
     @staticmethod
-    def take(player, resource, amount):
+    def add(game, player, resource, amount):
         """
-        Transfer from player to bank amount cards of the given resource.
-        Raises ValueError if the player does not have such amount.
+        Adds amount new cards of the given resource to player (or to the bank
+        if player is None). Used to stock the game, not to trade.
         """
-        if ResourcesCard.count_player(player, resource) < amount:
-            raise ValueError("player does't own that amount of the resource")
-
-        cards = ResourcesCard.objects.filter(player=player, resource=resource)[:amount]
-        for card in cards:
-            card.player = None
-            card.save()
+        player_id = player.id if player is not None else None
+        ResourcesCard.deposit(game.id, player_id, resource, amount)
 
     @staticmethod
-    def take_random(player, new_owner=None):
-        """Take one random resource from player and give it to new_owner (if exists)."""
-        if player is not new_owner:
-            player_res = ResourcesCard.objects.filter(game=player.game, player=player)
-            if player_res.count() > 0:
-                card = random.choice(player_res)
-                card.player = new_owner
-                card.save()
+    def deposit(game_id, player_id, resource, amount):
+        """Increments the holder's counter, creating it if needed."""
+        updated = ResourcesCard.objects \
+                               .filter(game=game_id, player=player_id, resource=resource) \
+                               .update(amount=models.F('amount') + amount)
+        if updated == 0:
+            ResourcesCard.objects.create(
+                game_id=game_id,
+                player_id=player_id,
+                resource=resource,
+                amount=amount
+            )
 
     @staticmethod
-    def give(player, resource, amount):
+    def transfer(game_id, from_id, to_id, resource, amount):
         """
-        Transfer to player amount cards of the given resource.
-        Raises ValueError if the bank does not have such amount.
+        Moves amount cards of the given resource between two holders (None
+        being the bank) with a guarded single-row decrement.
+        Raises ValueError if the source does not have such amount.
         """
-        if ResourcesCard.count_bank(player.game, resource) < amount:
-            raise ValueError("bank does't own that amount of the resource")
-
-        g = player.game
-        cards = ResourcesCard.objects.filter(game=g, player=None, resource=resource)[:amount]
-
-        for card in cards:
-            card.player = player
-            card.save()
+        if amount <= 0:
+            return
+
+        with transaction.atomic():
+            taken = ResourcesCard.objects \
+                                 .filter(
+                                     game=game_id,
+                                     player=from_id,
+                                     resource=resource,
+                                     amount__gte=amount
+                                 ) \
+                                 .update(amount=models.F('amount') - amount)
+            if taken == 0:
+                raise ValueError("holder does't own that amount of the resource")
+            ResourcesCard.deposit(game_id, to_id, resource, amount)
 
     def __str__(self):
         return self.resource + " (" + str(self.player) + ")"
@@ -401,42 +329,84 @@ class DevelopmentCard(models.Model):
                                 .filter(game=player.game, player=player, card=card) \
                                 .count()
 
+    @staticmethod
+    def count_by_player(game_id):
+        """Returns {player id: total cards} for every player holding cards."""
+        return dict(
+            DevelopmentCard.objects
+                           .filter(game=game_id, player__isnull=False)
+                           .order_by()
+                           .values_list('player')
+                           .annotate(models.Count('id'))
+        )
+
     @staticmethod
     def count_bank(game):
         """Returns the number of cards that the bank has."""
         return DevelopmentCard.objects.filter(game=game, player=None).count()
 
+    def __str__(self):
+        return self.card + " (" + str(self.player) + ")"
+
+
+class ActionLog(models.Model):
+    """
+    Append-only log of the actions played in a game, with their validated
+    payloads. Replaying it from the start rebuilds the game (see Game.replay).
+    """
+    game = models.ForeignKey(Game, on_delete=models.CASCADE)
+    # version of the game after the action
+    sequence = models.PositiveIntegerField()
+    player = models.ForeignKey(Player, blank=True, null=True, on_delete=models.CASCADE)
+    action = models.CharField(max_length=50)
+    payload = models.JSONField(blank=True, null=True)
+    # sent by the client so a retried request is not played twice
+    idempotency_key = models.CharField(max_length=IDEMPOTENCY_KEY_LENGTH, blank=True, null=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['game', 'sequence'], name='unique_action_sequence'),
+            models.UniqueConstraint(
+                fields=['game', 'player', 'idempotency_key'], name='unique_action_idempotency_key'
+            ),
+        ]
+
     @staticmethod
-    def take(player, card_name, amount):
-        """
-        Transfer from player to bank amount cards of the given card.
-        Raises ValueError if the player does not have such amount.
-        """
-        if DevelopmentCard.count_player(player, card_name) < amount:
-            raise ValueError("player does't own that amount of the card")
+    def append(game, player, action, payload, idempotency_key=None):
+        """Logs the action that took the game to its current version."""
+        return ActionLog.objects.create(
+            game=game,
+            sequence=game.version,
+            player=player,
+            action=action,
+            payload=payload,
+            idempotency_key=idempotency_key
+        )
 
-        cards = DevelopmentCard.objects.filter(player=player, card=card_name)[:amount]
-        for card in cards:
-            card.player = None
-            card.save()
+    @staticmethod
+    def was_played(game, player, idempotency_key):
+        """Returns True if the player already sent a request with that key."""
+        return ActionLog.objects \
+                        .filter(game=game, player=player, idempotency_key=idempotency_key) \
+                        .exists()
 
     @staticmethod
-    def give(player, amount):
+    def replay_onto(state, game_id, version=None):
         """
-        Transfer development card to player.
-        Raises ValueError if the bank does not have cards.
+        Applies to the GameState the actions of the game logged after its
+        version, up to the given version (by default, the last one).
         """
-        g = player.game
-        if DevelopmentCard.count_bank(g) < amount:
-            raise ValueError("bank does't have cards")
-
-        Dcards = DevelopmentCard.objects.filter(game=g, player=None)[:amount]
-        for card in Dcards:
-            card.player = player
-            card.save()
+        log = ActionLog.objects.filter(game=game_id, sequence__gt=state.version)
+        if version is not None:
+            log = log.filter(sequence__lte=version)
+        log = log.order_by('sequence').values_list('sequence', 'player', 'action', 'payload')
+        for sequence, player, action, payload in log.iterator():
+            state.apply(sequence, player, action, payload)
+        return state
 
     def __str__(self):
-        return self.card + " (" + str(self.player) + ")"
+        return self.action + " #" + str(self.sequence) + " (" + str(self.game) + ")"
 
 
 class SettlementBuilding(models.Model):
@@ -445,38 +415,6 @@ class SettlementBuilding(models.Model):
     pos_level = models.IntegerField()
     pos_index = models.IntegerField()
 
-    @staticmethod
-    def has_resources_to_build(player):
-        has_brick = ResourcesCard.count_player(player, 'brick') > 0
-        has_lumber = ResourcesCard.count_player(player, 'lumber') > 0
-        has_wool = ResourcesCard.count_player(player, 'wool') > 0
-        has_grain = ResourcesCard.count_player(player, 'grain') > 0
-
-        return has_brick and has_lumber and has_wool and has_grain
-
-    @staticmethod
-    def is_available_position(player, position):
-        game_setts = [
-            (s.pos_level, s.pos_index)
-            for s in SettlementBuilding.objects.filter(game=player.game)
-        ]
-        has_neighbors = any(n in game_setts for n in get_neighbors(position))
-
-        player_roads = [
-            ((r.fst_pos_level, r.fst_pos_index), (r.snd_pos_level, r.snd_pos_index))
-            for r in RoadBuilding.objects.filter(game=player.game, owner=player)
-        ]
-        from_road = any(position in road_pos for road_pos in player_roads)
-
-        return position not in game_setts and not has_neighbors and from_road
-
-    @staticmethod
-    def take_resources(player):
-        ResourcesCard.take(player, 'brick', 1)
-        ResourcesCard.take(player, 'lumber', 1)
-        ResourcesCard.take(player, 'wool', 1)
-        ResourcesCard.take(player, 'grain', 1)
-
     def __str__(self):
         return "Settlement in " + str(self.game) + " at (" + \
             str(self.pos_level) + ", " + str(self.pos_index) + ")"
@@ -497,48 +435,19 @@ class RoadBuilding(models.Model):
     snd_pos_level = models.IntegerField()
     snd_pos_index = models.IntegerField()
 
-    @staticmethod
-    def has_resources_to_build(player):
-        has_brick = ResourcesCard.count_player(player, 'brick') > 0
-        has_lumber = ResourcesCard.count_player(player, 'lumber') > 0
-
-        return has_brick and has_lumber
-
-    @staticmethod
-    def is_available_position(game, player, position):
-        game_roads = [
-            ((r.fst_pos_level, r.fst_pos_index), (r.snd_pos_level, r.snd_pos_index))
-            for r in RoadBuilding.objects.filter(game=game)
-        ]
-
-        player_setts = [
-            (s.pos_level, s.pos_index)
-            for s in SettlementBuilding.objects.filter(game=game, owner=player)
-        ]
-        from_settlement = any(position[i] in player_setts for i in [0, 1])
-
-        player_cities = [
-            (c.pos_level, c.pos_index)
-            for c in CityBuilding.objects.filter(game=game, owner=player)
-        ]
-        from_city = any(position[i] in player_cities for i in [0, 1])
-
-        player_roads = [
-            ((r.fst_pos_level, r.fst_pos_index), (r.snd_pos_level, r.snd_pos_index))
-            for r in RoadBuilding.objects.filter(game=game, owner=player)
-        ]
-        from_road = any(
-            position[i] in player_roads[j] for i in [0, 1] for j in range(len(player_roads))
-        )
-
-        return position not in game_roads and (from_settlement or from_city or from_road)
-
-    @staticmethod
-    def take_resources(player):
-        ResourcesCard.take(player, 'brick', 1)
-        ResourcesCard.take(player, 'lumber', 1)
-
     def __str__(self):
         return "Road in " + str(self.game) + " at ((" + \
             str(self.fst_pos_level) + ", " + str(self.fst_pos_index) + "), (" + \
             str(self.snd_pos_level) + ", " + str(self.snd_pos_index) + "))"
+
+
+@receiver(post_save, sender=Game)
+def reset_new_game_cache(sender, instance, created, **kwargs):
+    """Game ids may be reused (e.g. after a rollback), so start new games afresh."""
+    if created:
+        get_state_cache().invalidate_game(instance.id)
+
+
+@receiver(post_delete, sender=Game)
+def reset_deleted_game_cache(sender, instance, **kwargs):
+    get_state_cache().invalidate_game(instance.id)
@@ -0,0 +1,117 @@
+"""
+Move generation for bots: every action the player in turn may play on a
+GameState, as rows of an integer array instead of the JSON payloads of
+PlayerAction.get, and apply_move to play one of them.
+
+A move is (type, arg, target):
+    END_TURN, BUY_CARD           0, 0
+    BUILD_SETTLEMENT             vertex id, 0
+    BUILD_ROAD                   edge id, 0
+    PLAY_ROAD_BUILDING_CARD      edge id, edge id (the first one lower)
+    BANK_TRADE                   index in RESOURCES of the given one, of the received one
+    MOVE_ROBBER, PLAY_KNIGHT     hexagon id, player id to steal from or NO_TARGET
+                                 (a random player of the hexagon)
+
+legal_moves follows the rules of GameState.can_apply, and also that the
+turn cannot go on after a 7 until the robber is moved, like
+available_actions. Bank trades of a resource for itself are left out.
+"""
+import numpy as np
+
+from catan.engine import RESOURCES, position_json
+from catan.occupancy import iter_bits
+from catan.rules import *
+from catan.topology import *
+
+MOVE_TYPES = [
+    "end_turn",
+    "build_settlement",
+    "build_road",
+    "bank_trade",
+    "buy_card",
+    "play_road_building_card",
+    "move_robber",
+    "play_knight_card",
+]
+(
+    END_TURN, BUILD_SETTLEMENT, BUILD_ROAD, BANK_TRADE, BUY_CARD,
+    PLAY_ROAD_BUILDING_CARD, MOVE_ROBBER, PLAY_KNIGHT_CARD
+) = range(len(MOVE_TYPES))
+
+NO_TARGET = -1
+
+
+def legal_moves(state):
+    """Returns the (n, 3) int32 array of the moves the player in turn may play."""
+    player = state.turn
+    moves = []
+    if player is None or state.winner is not None:
+        return np.zeros((0, 3), dtype=np.int32)
+
+    if sum(state.dices) == 7 and not state.robber_moved:
+        robber_moves(state, player, MOVE_ROBBER, moves)
+        return np.array(moves, dtype=np.int32).reshape(-1, 3)
+
+    moves.append((END_TURN, 0, 0))
+    occupancy = state.occupancy
+
+    if state.can_afford(player, SETTLEMENT_COST) and \
+            occupancy.count_settlements(player) < MAX_SETTLEMENTS:
+        moves.extend((BUILD_SETTLEMENT, v, 0) for v in iter_bits(occupancy.settlement_mask(player)))
+
+    roads = list(iter_bits(occupancy.road_mask(player)))
+    if state.can_afford(player, ROAD_COST) and occupancy.count_roads(player) < MAX_ROADS:
+        moves.extend((BUILD_ROAD, e, 0) for e in roads)
+    if state.count_cards(player, "road_building") > 0:
+        moves.extend(
+            (PLAY_ROAD_BUILDING_CARD, fst, snd)
+            for i, fst in enumerate(roads) for snd in roads[i + 1:]
+        )
+
+    for give, resource in enumerate(RESOURCES):
+        if state.count_resources(player, resource) >= BANK_TRADE_RATE:
+            moves.extend(
+                (BANK_TRADE, give, receive) for receive, other in enumerate(RESOURCES)
+                if receive != give and state.count_resources(None, other) >= 1
+            )
+
+    if state.can_buy_card(player, None):
+        moves.append((BUY_CARD, 0, 0))
+
+    if not state.robber_moved and state.count_cards(player, "knight") > 0:
+        robber_moves(state, player, PLAY_KNIGHT_CARD, moves)
+
+    return np.array(moves, dtype=np.int32).reshape(-1, 3)
+
+
+def robber_moves(state, player, kind, moves):
+    for h in range(HEXAGON_COUNT):
+        if h != state.robber:
+            moves.append((kind, h, NO_TARGET))
+            moves.extend((kind, h, p) for p in state.adjacent_players(h) if p != player)
+
+
+def decode_move(state, move):
+    """Returns the (action, payload) of the move, as PlayerAction.post takes them."""
+    kind, arg, target = (int(x) for x in move)
+    action = MOVE_TYPES[kind]
+    if kind in (END_TURN, BUY_CARD):
+        return action, None
+    if kind == BUILD_SETTLEMENT:
+        return action, position_json(VERTEX_POSITIONS[arg])
+    if kind == BUILD_ROAD:
+        return action, [position_json(p) for p in edge_positions(arg)]
+    if kind == PLAY_ROAD_BUILDING_CARD:
+        return action, [[position_json(p) for p in edge_positions(e)] for e in (arg, target)]
+    if kind == BANK_TRADE:
+        return action, {"give": RESOURCES[arg], "receive": RESOURCES[target]}
+    return action, {
+        "position": position_json(HEXAGON_POSITIONS[arg]),
+        "player": state.usernames[target] if target != NO_TARGET else "",
+    }
+
+
+def apply_move(state, move):
+    """Plays the move on state (in place) as the next action of the game."""
+    action, payload = decode_move(state, move)
+    state.apply(state.version + 1, state.turn, action, payload)
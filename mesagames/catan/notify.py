@@ -0,0 +1,47 @@
+"""
+In-process registry used to wake up the requests waiting for a game to
+change (long polling). Notifications are only a shortcut: waiters still
+re-read the game every so often, so changes made by other processes are
+picked up too.
+"""
+import threading
+from contextlib import contextmanager
+
+
+class GameNotifier:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listeners = dict()  # game id -> set of threading.Event
+
+    @contextmanager
+    def listen(self, game_id):
+        """
+        Registers a listener for the game and yields its threading.Event,
+        which is set by every notify(game_id) until the block exits. Register
+        before reading the game so no change can be missed in between.
+        """
+        event = threading.Event()
+        with self._lock:
+            self._listeners.setdefault(game_id, set()).add(event)
+        try:
+            yield event
+        finally:
+            with self._lock:
+                listeners = self._listeners[game_id]
+                listeners.discard(event)
+                if not listeners:
+                    del self._listeners[game_id]
+
+    def notify(self, game_id):
+        """Wakes up everyone listening to the game."""
+        with self._lock:
+            for event in self._listeners.get(game_id, ()):
+                event.set()
+
+    def listening(self, game_id):
+        """Returns how many listeners the game has."""
+        with self._lock:
+            return len(self._listeners.get(game_id, ()))
+
+
+game_notifier = GameNotifier()
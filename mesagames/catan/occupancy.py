@@ -0,0 +1,127 @@
+"""
+Buildings and roads of a game as integer bitmasks over the topology ids, so
+the placement rules are a few bitwise operations instead of list scans.
+"""
+from catan.topology import *
+
+ALL_VERTICES = (1 << VERTEX_COUNT) - 1
+ALL_EDGES = (1 << EDGE_COUNT) - 1
+
+# vertex id -> mask of the vertex and its neighbors (the distance rule)
+VERTEX_EXCLUSION = tuple(
+    (1 << v) | sum(1 << n for n in VERTEX_NEIGHBORS[v]) for v in range(VERTEX_COUNT)
+)
+
+# edge id -> mask of both of its vertices
+EDGE_VERTICES = tuple((1 << fst) | (1 << snd) for fst, snd in EDGES)
+
+# vertex id -> mask of the edges that touch it
+VERTEX_EDGE_MASK = tuple(sum(1 << e for e in VERTEX_EDGES[v]) for v in range(VERTEX_COUNT))
+
+
+def iter_bits(mask):
+    """Yields the positions of the bits set in mask, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class Occupancy:
+    """
+    Who owns what on the board of a game. Owners are opaque keys (player ids
+    when loaded from the database).
+    """
+    def __init__(self):
+        self.settlements = dict()  # vertex id -> owner
+        self.cities = dict()  # vertex id -> owner
+        self.roads = dict()  # edge id -> owner
+        self.occupied = 0  # vertices with a building
+        self.excluded = 0  # vertices where the distance rule forbids building
+        self.built_edges = 0  # edges with a road
+        self.building_vertices = dict()  # owner -> vertices with its buildings
+        self.road_vertices = dict()  # owner -> vertices touched by its roads
+
+    @staticmethod
+    def for_game(game):
+        """Loads the buildings and roads of the game, one query per table."""
+        occupancy = Occupancy()
+        for owner, level, index in game.settlementbuilding_set \
+                                       .values_list('owner', 'pos_level', 'pos_index'):
+            occupancy.add_settlement(owner, vertex_id((level, index)))
+        for owner, level, index in game.citybuilding_set \
+                                       .values_list('owner', 'pos_level', 'pos_index'):
+            occupancy.add_city(owner, vertex_id((level, index)))
+        roads = game.roadbuilding_set.values_list(
+            'owner', 'fst_pos_level', 'fst_pos_index', 'snd_pos_level', 'snd_pos_index'
+        )
+        for owner, fst_level, fst_index, snd_level, snd_index in roads:
+            occupancy.add_road(owner, edge_id((fst_level, fst_index), (snd_level, snd_index)))
+        return occupancy
+
+    def copy(self):
+        occupancy = Occupancy()
+        occupancy.settlements = dict(self.settlements)
+        occupancy.cities = dict(self.cities)
+        occupancy.roads = dict(self.roads)
+        occupancy.occupied = self.occupied
+        occupancy.excluded = self.excluded
+        occupancy.built_edges = self.built_edges
+        occupancy.building_vertices = dict(self.building_vertices)
+        occupancy.road_vertices = dict(self.road_vertices)
+        return occupancy
+
+    def _occupy(self, owner, vertex):
+        self.occupied |= 1 << vertex
+        self.excluded |= VERTEX_EXCLUSION[vertex]
+        self.building_vertices[owner] = self.building_vertices.get(owner, 0) | 1 << vertex
+
+    def add_settlement(self, owner, vertex):
+        if vertex is not None:
+            self.settlements[vertex] = owner
+            self._occupy(owner, vertex)
+
+    def add_city(self, owner, vertex):
+        if vertex is not None:
+            self.cities[vertex] = owner
+            self._occupy(owner, vertex)
+
+    def add_road(self, owner, edge):
+        if edge is not None:
+            self.roads[edge] = owner
+            self.built_edges |= 1 << edge
+            self.road_vertices[owner] = self.road_vertices.get(owner, 0) | EDGE_VERTICES[edge]
+
+    def count_settlements(self, owner):
+        return sum(1 for o in self.settlements.values() if o == owner)
+
+    def count_roads(self, owner):
+        return sum(1 for o in self.roads.values() if o == owner)
+
+    def settlement_mask(self, owner):
+        """Vertices where owner may build a settlement."""
+        return self.road_vertices.get(owner, 0) & ~self.excluded & ALL_VERTICES
+
+    def can_build_settlement(self, owner, position):
+        v = vertex_id(position)
+        return v is not None and bool(self.settlement_mask(owner) >> v & 1)
+
+    def settlement_positions(self, owner):
+        """Positions where owner may build a settlement, in (level, index) order."""
+        return [VERTEX_POSITIONS[v] for v in iter_bits(self.settlement_mask(owner))]
+
+    def road_mask(self, owner):
+        """Edges where owner may build a road: free and touching its buildings or roads."""
+        frontier = self.building_vertices.get(owner, 0) | self.road_vertices.get(owner, 0)
+        reachable = 0
+        for v in iter_bits(frontier):
+            reachable |= VERTEX_EDGE_MASK[v]
+        return reachable & ~self.built_edges & ALL_EDGES
+
+    def can_build_road(self, owner, position):
+        e = edge_id(position[0], position[1])
+        return e is not None and bool(self.road_mask(owner) >> e & 1)
+
+    def road_positions(self, owner):
+        """Positions where owner may build a road, as pairs of vertex positions."""
+        return [edge_positions(e) for e in iter_bits(self.road_mask(owner))]
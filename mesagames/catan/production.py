@@ -0,0 +1,85 @@
+"""
+Production index of a game: for every dice sum, which buildings collect
+which resource. It is kept up to date as buildings are added, so rolling the
+dice is a dictionary lookup instead of a scan of the board.
+"""
+import json
+from catan.topology import VERTEX_HEXES
+
+SETTLEMENT_YIELD = 1
+CITY_YIELD = 2
+
+
+class ProductionIndex:
+    def __init__(self, hexes):
+        """hexes maps hexagon id -> (resource, token) for the producing hexagons."""
+        self.hexes = dict(hexes)
+        self.payouts = dict()  # token -> [(hexagon id, vertex id, owner, resource, amount)]
+
+    @staticmethod
+    def build(hexes, settlements, cities):
+        """
+        Builds the index from (hexagon id, resource, token) tuples and
+        (owner, vertex id) pairs for settlements and cities.
+        """
+        index = ProductionIndex(
+            (h, (resource, token)) for h, resource, token in hexes if resource is not None
+        )
+        for owner, vertex in settlements:
+            index.add_building(owner, vertex, SETTLEMENT_YIELD)
+        for owner, vertex in cities:
+            index.add_building(owner, vertex, CITY_YIELD)
+        return index
+
+    def copy(self):
+        index = ProductionIndex(self.hexes)
+        index.payouts = {token: list(entries) for token, entries in self.payouts.items()}
+        return index
+
+    def add_building(self, owner, vertex, amount):
+        """
+        Registers the building at vertex. A city replaces the settlement it
+        stands on, but a settlement never downgrades a city.
+        """
+        if vertex is None:
+            return
+
+        for h in VERTEX_HEXES[vertex]:
+            if h not in self.hexes:
+                continue
+            resource, token = self.hexes[h]
+            entries = self.payouts.setdefault(token, [])
+            for i, (eh, ev, _, _, eamount) in enumerate(entries):
+                if eh == h and ev == vertex:
+                    if eamount <= amount:
+                        entries[i] = (h, vertex, owner, resource, amount)
+                    break
+            else:
+                entries.append((h, vertex, owner, resource, amount))
+
+    def collect(self, dices, robber=None):
+        """
+        Returns {(owner, resource): amount} produced by the dice sum, skipping
+        the hexagon where the robber is.
+        """
+        result = dict()
+        for h, _, owner, resource, amount in self.payouts.get(dices, ()):
+            if h != robber:
+                key = (owner, resource)
+                result[key] = result.get(key, 0) + amount
+        return result
+
+    def dumps(self):
+        return json.dumps({
+            "hexes": [[h, resource, token] for h, (resource, token) in self.hexes.items()],
+            "payouts": {str(token): entries for token, entries in self.payouts.items()},
+        })
+
+    @staticmethod
+    def loads(data):
+        data = json.loads(data)
+        index = ProductionIndex((h, (resource, token)) for h, resource, token in data["hexes"])
+        index.payouts = {
+            int(token): [tuple(e) for e in entries] for token, entries in data["payouts"].items()
+        }
+        return index
@@ -0,0 +1,166 @@
+"""
+Opt-in profiling of the action handlers: tells, per action, how long each
+phase (is_payload_valid, load_state, can_execute, execute) takes and how
+many queries it runs, to know which one dominates under real load.
+
+Enabled by the CATAN_ACTION_PROFILING setting, when the app is ready:
+
+    CATAN_ACTION_PROFILING = {
+        "sample_rate": 0.01,  # share of the phases run under cProfile
+        "outlier_seconds": 0.05,  # sampled phases slower than this are dumped
+        "profile_dir": "/var/tmp/catan-profiles",
+    }
+
+Every registered handler is then wrapped by an InstrumentedHandler. The
+timings are served with the request metrics by /metrics, and the cProfile
+stats of the slow sampled phases are written to profile_dir as
+<action>-<phase>-<time>-<pid>.prof files, to be read with pstats.
+"""
+import cProfile
+import os
+import random
+import tempfile
+import threading
+import time
+
+from django.db import connection
+
+from catan.actions import ACTION_HANDLERS
+from catan.metrics import RequestMetrics, format_labels, format_value, register_collector
+
+PHASES = ("is_payload_valid", "load_state", "can_execute", "execute")
+# upper bounds of the buckets of the phase duration histogram
+PHASE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+DEFAULT_PROFILING = {
+    "sample_rate": 0.01,
+    "outlier_seconds": 0.05,
+    "profile_dir": os.path.join(tempfile.gettempdir(), "catan-profiles"),
+}
+
+
+class PhaseRegistry:
+    def __init__(self, buckets=PHASE_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = dict()  # (action, phase) -> [calls, queries, seconds, bucket counts]
+
+    def observe(self, action, phase, seconds, queries):
+        with self._lock:
+            series = self._series.get((action, phase))
+            if series is None:
+                series = self._series[(action, phase)] = [0, 0, 0.0, [0] * len(self.buckets)]
+            series[0] += 1
+            series[1] += queries
+            series[2] += seconds
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[3][i] += 1
+
+    def get(self, action, phase):
+        """Returns (calls, queries, seconds) of the phase of the action."""
+        with self._lock:
+            return tuple(self._series.get((action, phase), (0, 0, 0.0))[:3])
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def exposition(self):
+        """Returns the timings in the Prometheus text format."""
+        with self._lock:
+            series = sorted(
+                ((("action", a), ("phase", p)), s[:3] + [list(s[3])])
+                for (a, p), s in self._series.items()
+            )
+
+        lines = [
+            "# HELP catan_action_phase_queries_total SQL queries run by the action handlers.",
+            "# TYPE catan_action_phase_queries_total counter",
+        ]
+        for labels, s in series:
+            lines.append("catan_action_phase_queries_total{%s} %d" % (format_labels(labels), s[1]))
+
+        name = "catan_action_phase_seconds"
+        lines.append("# HELP %s Time spent in each phase of the action handlers." % name)
+        lines.append("# TYPE %s histogram" % name)
+        for labels, s in series:
+            for bound, count in zip(self.buckets, s[3]):
+                lines.append("%s_bucket{%s} %d" % (
+                    name, format_labels(labels + (("le", format_value(float(bound))),)), count
+                ))
+            lines.append("%s_bucket{%s} %d" % (
+                name, format_labels(labels + (("le", "+Inf"),)), s[0]
+            ))
+            lines.append("%s_sum{%s} %s" % (name, format_labels(labels), format_value(s[2])))
+            lines.append("%s_count{%s} %d" % (name, format_labels(labels), s[0]))
+        return "\n".join(lines) + "\n"
+
+
+phase_registry = PhaseRegistry()
+
+
+class InstrumentedHandler:
+    """Action handler timing the phases of the one it wraps."""
+    def __init__(self, handler, action, options, registry=phase_registry, rng=random):
+        self.handler = handler
+        self.action = action
+        self.options = dict(DEFAULT_PROFILING, **options)
+        self.registry = registry
+        self.rng = rng
+
+    def is_payload_valid(self, payload):
+        return self.measure("is_payload_valid", self.handler.is_payload_valid, payload)
+
+    def load_state(self, game):
+        return self.measure("load_state", self.handler.load_state, game)
+
+    def can_execute(self, *args, **kwargs):
+        return self.measure("can_execute", self.handler.can_execute, *args, **kwargs)
+
+    def execute(self, *args, **kwargs):
+        return self.measure("execute", self.handler.execute, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.handler, name)
+
+    def measure(self, phase, function, *args, **kwargs):
+        profile = None
+        if self.rng.random() < self.options["sample_rate"]:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                profile = None  # another thread is being profiled
+
+        queries = RequestMetrics()
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(queries):
+                return function(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            if profile is not None:
+                profile.disable()
+                if seconds >= self.options["outlier_seconds"]:
+                    self.dump(profile, phase)
+            self.registry.observe(self.action, phase, seconds, queries.queries)
+
+    def dump(self, profile, phase):
+        os.makedirs(self.options["profile_dir"], exist_ok=True)
+        profile.dump_stats(os.path.join(self.options["profile_dir"], "%s-%s-%d-%d.prof" % (
+            self.action, phase, time.time() * 1000, os.getpid()
+        )))
+
+
+def instrument_action_handlers(options):
+    """Wraps every registered action handler, unless already done."""
+    for action, handler in ACTION_HANDLERS.items():
+        if not isinstance(handler, InstrumentedHandler):
+            ACTION_HANDLERS[action] = InstrumentedHandler(handler, action, options)
+    register_collector(phase_registry.exposition)
+
+
+def uninstrument_action_handlers():
+    for action, handler in ACTION_HANDLERS.items():
+        if isinstance(handler, InstrumentedHandler):
+            ACTION_HANDLERS[action] = handler.handler
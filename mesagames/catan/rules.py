@@ -0,0 +1,46 @@
+"""
+Constants of the rules of the game, shared by the models and the in-memory
+engine.
+"""
+
+RESOURCE_TYPES = (
+    ('brick', 'Brick'),
+    ('lumber', 'Lumber'),
+    ('wool', 'Wool'),
+    ('grain', 'Grain'),
+    ('ore', 'Ore'),
+)
+
+CARD_TYPES = (
+    ('road_building', 'Road Building'),
+    ('knight', 'Knight'),
+)
+
+SETTLEMENT_COST = {'brick': 1, 'lumber': 1, 'wool': 1, 'grain': 1}
+ROAD_COST = {'brick': 1, 'lumber': 1}
+DEVELOPMENT_CARD_COST = {'ore': 1, 'wool': 1, 'grain': 1}
+
+SETTLEMENT_POINTS = 1
+CITY_POINTS = 2
+WINNING_POINTS = 10
+
+MAX_SETTLEMENTS = 5
+MAX_ROADS = 15
+BANK_TRADE_RATE = 4
+
+# Starting settlements of each player, in joining order. Each one gets a
+# road towards its first neighbor.
+STARTING_SETTLEMENTS = [
+    [(1, 2), (1, 9)],
+    [(1, 5), (1, 15)],
+    [(1, 7), (1, 11)],
+    [(1, 13), (1, 17)]
+]
+
+# Resources and tokens of the standard board, one hexagon is the desert.
+BOARD_RESOURCES = ['wool'] * 4 + ['grain'] * 4 + ['lumber'] * 4 + ['brick'] * 3 + ['ore'] * 3
+BOARD_TOKENS = [2, 3, 3, 4, 4, 5, 5, 6, 6, 8, 8, 9, 9, 10, 10, 11, 11, 12]
+
+DEVELOPMENT_DECK = ['road_building', 'year_of_plenty', 'monopoly', 'victory_point', 'knight']
+DEVELOPMENT_DECK_SIZE = 25
+BANK_RESOURCES = 19
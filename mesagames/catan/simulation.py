@@ -0,0 +1,162 @@
+"""
+Headless self-play: bots play whole games on the in-memory engine, without
+HTTP nor database, to load-test the rules and compare board layouts (see
+the simulate_games command).
+
+A bot policy is a class built with a random generator whose choose(state,
+player, available) returns the (action, payload) to play, given the
+available actions of PlayerAction.get. Register new ones in BOTS.
+"""
+import random
+import time
+from collections import namedtuple
+from multiprocessing import Pool
+
+from catan.engine import RESOURCES, GameState
+from catan.rules import *
+from catan.topology import HEXAGON_COUNT
+
+# Actions a bot may play in a turn before it is made to end it.
+MAX_ACTIONS_PER_TURN = 20
+
+GameResult = namedtuple("GameResult", ["seed", "winner", "turns", "actions", "timings"])
+
+
+def random_board(rng):
+    """Returns the (hexagon id, resource, token) tuples of a shuffled standard board."""
+    resources = BOARD_RESOURCES + [None]
+    tokens = list(BOARD_TOKENS)
+    rng.shuffle(resources)
+    rng.shuffle(tokens)
+    tokens.insert(resources.index(None), 0)
+    return [(h, resources[h], tokens[h]) for h in range(HEXAGON_COUNT)]
+
+
+def concrete(option, state, player, rng):
+    """Picks a payload for one of the available actions, or None if there is none."""
+    kind, choices = option["type"], option["payload"]
+    if kind in ("build_settlement", "build_road"):
+        return rng.choice(choices)
+    if kind in ("move_robber", "play_knight_card"):
+        choice = rng.choice(choices)
+        target = rng.choice(choice["players"]) if choice["players"] else ""
+        return {"position": choice["position"], "player": target}
+    if kind == "play_road_building_card":
+        return rng.sample(choices, 2) if len(choices) >= 2 else None
+    if kind == "bank_trade":
+        gives = [r for r in RESOURCES if state.count_resources(player, r) >= BANK_TRADE_RATE]
+        give = rng.choice(gives)
+        return {"give": give, "receive": rng.choice([r for r in RESOURCES if r != give])}
+    return None
+
+
+class RandomBot:
+    """Plays any available action, ending the turn with probability end_turn_rate."""
+    end_turn_rate = 0.3
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def choose(self, state, player, available):
+        others = [a for a in available if a["type"] != "end_turn"]
+        if not others or (len(others) < len(available) and self.rng.random() < self.end_turn_rate):
+            return ("end_turn", None)
+        return self.play(self.rng.choice(others), state, player)
+
+    def play(self, option, state, player):
+        return (option["type"], concrete(option, state, player, self.rng))
+
+
+class BuilderBot(RandomBot):
+    """Builds whenever it can, preferring settlements, and trades only to build."""
+    preference = [
+        "move_robber", "build_settlement", "play_road_building_card", "build_road",
+        "play_knight_card", "buy_card",
+    ]
+
+    def choose(self, state, player, available):
+        by_type = {a["type"]: a for a in available}
+        for kind in self.preference:
+            if kind in by_type:
+                return self.play(by_type[kind], state, player)
+        if "bank_trade" in by_type and not state.can_afford(player, SETTLEMENT_COST):
+            return self.play(by_type["bank_trade"], state, player)
+        return ("end_turn", None)
+
+
+BOTS = {
+    "random": RandomBot,
+    "builder": BuilderBot,
+}
+
+
+def play_game(seed, bots, max_turns, hexes=None):
+    """
+    Plays a whole game between the named bots, until someone wins or
+    max_turns turns are played. Returns a GameResult whose timings map
+    each action to (times played, seconds spent validating and applying).
+    """
+    rng = random.Random(seed)
+    state = GameState(seed, hexes if hexes is not None else random_board(rng))
+    players = [[i + 1, "%s%d" % (name, i + 1)] for i, name in enumerate(bots)]
+    state.apply(1, None, "start_game", {"players": players, "first_turn": 1})
+    policies = {
+        p: BOTS[name](random.Random("%d:%d" % (seed, p))) for (p, _), name in zip(players, bots)
+    }
+
+    timings = dict()
+    turns = 0
+    actions = 0
+    played_in_turn = 0
+    while state.winner is None and turns < max_turns:
+        player = state.turn
+        available = state.available_actions(player)
+        can_end_turn = any(a["type"] == "end_turn" for a in available)
+        if can_end_turn and played_in_turn >= MAX_ACTIONS_PER_TURN:
+            action, payload = ("end_turn", None)
+        else:
+            action, payload = policies[player].choose(state, player, available)
+
+        start = time.perf_counter()
+        playable = (
+            (payload is not None or action in ("end_turn", "buy_card")) and
+            state.can_apply(player, action, payload)
+        )
+        if playable:
+            state.apply(state.version + 1, player, action, payload)
+        elapsed = time.perf_counter() - start
+
+        if not playable:
+            # listed but not playable (e.g. a second knight in the turn)
+            played_in_turn = MAX_ACTIONS_PER_TURN
+            continue
+        count, seconds = timings.get(action, (0, 0.0))
+        timings[action] = (count + 1, seconds + elapsed)
+        actions += 1
+        played_in_turn += 1
+        if action == "end_turn":
+            turns += 1
+            played_in_turn = 0
+
+    return GameResult(seed, state.winner, turns, actions, timings)
+
+
+def _play_game(args):
+    return play_game(*args)
+
+
+def simulate(games, bots, max_turns, seed=0, processes=1, hexes=None):
+    """
+    Plays games games with consecutive seeds, spread over a pool of
+    processes. Returns the GameResults (in no particular order) and the
+    seconds it took.
+    """
+    tasks = [(seed + i, bots, max_turns, hexes) for i in range(games)]
+    start = time.perf_counter()
+    if processes <= 1:
+        results = [_play_game(task) for task in tasks]
+    else:
+        with Pool(processes) as pool:
+            chunksize = max(1, games // (processes * 4))
+            results = list(pool.imap_unordered(_play_game, tasks, chunksize))
+    return results, time.perf_counter() - start
@@ -0,0 +1,234 @@
+"""
+Adapters between the database and the in-memory engine (catan.engine):
+load the GameState of a game, apply an action to it and persist what
+changed.
+
+Writes are optimistic: the game row is only updated if its version is
+still the one of the loaded state (compare-and-swap), so of two requests
+racing on the same game one fails with StaleState instead of both
+spending the same cards.
+"""
+from django.db import IntegrityError, models, transaction
+from catan.engine import GameState
+from catan.models import *
+from catan.production import ProductionIndex
+
+
+class StaleState(Exception):
+    """The game changed since its state was loaded."""
+
+
+class ActionRejected(Exception):
+    def __init__(self, index, details):
+        super().__init__(details)
+        self.index = index
+        self.details = details
+
+
+def load_state(game):
+    """
+    Returns the GameState of the game. Games created with start_game are
+    loaded from their snapshot, the rest from their tables, using the fields
+    of the given game object.
+    """
+    if game.snapshot is not None:
+        state = GameState.loads(game.snapshot)
+        if state.version < game.version:
+            ActionLog.replay_onto(state, game.id)
+        return state
+    return state_from_tables(game)
+
+
+def state_from_tables(game):
+    state = GameState(game.seed, game.board_hexes())
+    state.version = game.version
+    players = Player.objects.filter(game=game.id).order_by('id').values_list('id', 'user__username')
+    state.players = [p for p, _ in players]
+    state.usernames = dict(players)
+    state.turn = game.current_turn_id
+    state.winner = game.winner_id
+    state.dices = (game.current_dices_1, game.current_dices_2)
+    state.robber = hexagon_id((game.robber_level, game.robber_index))
+    state.robber_moved = game.robber_moved
+    state.resources = {
+        (player, resource): amount
+        for player, resource, amount in ResourcesCard.objects
+        .filter(game=game.id)
+        .values_list('player', 'resource', 'amount')
+    }
+    state.cards = [
+        [card, player] for card, player in DevelopmentCard.objects
+        .filter(game=game.id)
+        .order_by('id')
+        .values_list('card', 'player')
+    ]
+    state.occupancy = Occupancy.for_game(game)
+    state.production = ProductionIndex.build(
+        state.hexes,
+        [(owner, v) for v, owner in state.occupancy.settlements.items()],
+        [(owner, v) for v, owner in state.occupancy.cities.items()]
+    )
+    return state
+
+
+def persist(game, before, after):
+    """
+    Writes to the tables of the game what changed from the state before to
+    the state after, and updates the game object. Raises StaleState, writing
+    nothing, if the game is no longer at the version of before.
+    """
+    robber_level, robber_index = HEXAGON_POSITIONS[after.robber]
+    snapshot = after.dumps() if game.snapshot is not None else None
+    with transaction.atomic():
+        # first, so concurrent writers of the game wait for each other here
+        updated = Game.objects.filter(pk=game.id, version=before.version).update(
+            current_turn=after.turn,
+            winner=after.winner,
+            current_dices_1=after.dices[0],
+            current_dices_2=after.dices[1],
+            robber_level=robber_level,
+            robber_index=robber_index,
+            robber_moved=after.robber_moved,
+            version=after.version,
+            snapshot=snapshot
+        )
+        if updated == 0:
+            raise StaleState()
+
+        persist_resources(game.id, before.resources, after.resources)
+        persist_cards(game.id, before.cards, after.cards)
+
+        new_settlements = after.occupancy.settlements.keys() - before.occupancy.settlements.keys()
+        SettlementBuilding.objects.bulk_create([
+            SettlementBuilding(game_id=game.id, owner_id=after.occupancy.settlements[v],
+                               pos_level=VERTEX_POSITIONS[v][0], pos_index=VERTEX_POSITIONS[v][1])
+            for v in sorted(new_settlements)
+        ])
+        new_cities = after.occupancy.cities.keys() - before.occupancy.cities.keys()
+        CityBuilding.objects.bulk_create([
+            CityBuilding(game_id=game.id, owner_id=after.occupancy.cities[v],
+                         pos_level=VERTEX_POSITIONS[v][0], pos_index=VERTEX_POSITIONS[v][1])
+            for v in sorted(new_cities)
+        ])
+        new_roads = after.occupancy.roads.keys() - before.occupancy.roads.keys()
+        RoadBuilding.objects.bulk_create([
+            RoadBuilding(
+                game_id=game.id,
+                owner_id=after.occupancy.roads[e],
+                fst_pos_level=fst[0],
+                fst_pos_index=fst[1],
+                snd_pos_level=snd[0],
+                snd_pos_index=snd[1]
+            )
+            for e, (fst, snd) in ((e, edge_positions(e)) for e in sorted(new_roads))
+        ])
+
+    game.current_turn_id = after.turn
+    game.winner_id = after.winner
+    game.current_dices_1, game.current_dices_2 = after.dices
+    game.robber_level, game.robber_index = robber_level, robber_index
+    game.robber_moved = after.robber_moved
+    game.version = after.version
+    game.snapshot = snapshot
+
+
+def persist_resources(game_id, before, after):
+    deltas = {
+        key: after.get(key, 0) - before.get(key, 0)
+        for key in before.keys() | after.keys()
+        if after.get(key, 0) != before.get(key, 0)
+    }
+    if not deltas:
+        return
+
+    ResourcesCard.objects.bulk_create([
+        ResourcesCard(game_id=game_id, player_id=player_id, resource=resource, amount=0)
+        for player_id, resource in deltas
+    ], ignore_conflicts=True)
+    changes = models.Case(
+        *[
+            models.When(player=player_id, resource=resource, then=delta)
+            for (player_id, resource), delta in deltas.items()
+        ],
+        default=0
+    )
+    ResourcesCard.objects \
+                 .filter(game=game_id, resource__in={r for _, r in deltas}) \
+                 .update(amount=models.F('amount') + changes)
+
+
+def persist_cards(game_id, before, after):
+    moved = dict()  # new holder -> deck indexes
+    for i, (old, new) in enumerate(zip(before, after)):
+        if old[1] != new[1]:
+            moved.setdefault(new[1], []).append(i)
+    if not moved:
+        return
+
+    ids = DevelopmentCard.objects.filter(game=game_id).order_by('id').values_list('id', flat=True)
+    ids = list(ids)
+    for holder, indexes in moved.items():
+        DevelopmentCard.objects.filter(id__in=[ids[i] for i in indexes]).update(player=holder)
+
+
+def play(game, player, action, payload, state=None, idempotency_key=None):
+    """
+    Plays the action of player on the game: applies it to the GameState
+    (loaded if not given), persists the result and logs the action in one
+    transaction. Returns the new state. Raises StaleState if the game
+    changed meanwhile, or if a concurrent request used the same
+    idempotency key.
+    """
+    if state is None:
+        state = load_state(game)
+    after = state.copy()
+    after.apply(state.version + 1, player.id, action, payload)
+    try:
+        with transaction.atomic():
+            persist(game, state, after)
+            ActionLog.append(game, player, action, payload, idempotency_key)
+    except IntegrityError:
+        raise StaleState()
+    for kind, data in after.events:
+        game.record_event(kind, **data)
+    return after
+
+
+def play_all(game, player, actions, state=None, idempotency_key=None):
+    """
+    Plays the (action, payload) pairs of player in order, each one checked
+    against the state the previous ones left, then persists the result and
+    logs the actions in one transaction, the idempotency key on the first
+    one. If any action cannot be played, raises ActionRejected and nothing
+    is; like play, raises StaleState if the game changed meanwhile. Returns
+    the new state and the (version, events) of every action.
+    """
+    if state is None:
+        state = load_state(game)
+    after = state.copy()
+    played = []
+    for i, (action, payload) in enumerate(actions):
+        if after.turn != player.id:
+            raise ActionRejected(i, "not in your turn")
+        if not after.can_apply(player.id, action, payload):
+            raise ActionRejected(i, "action cannot be executed")
+        after.apply(after.version + 1, player.id, action, payload)
+        played.append((after.version, after.events))
+
+    try:
+        with transaction.atomic():
+            persist(game, state, after)
+            ActionLog.objects.bulk_create([
+                ActionLog(
+                    game=game,
+                    sequence=v,
+                    player=player,
+                    action=action,
+                    payload=payload,
+                    idempotency_key=idempotency_key if i == 0 else None
+                )
+                for i, ((v, _), (action, payload)) in enumerate(zip(played, actions))
+            ])
+    except IntegrityError:
+        raise StaleState()
+    return after, played
@@ -1,6 +1,7 @@
 from rest_framework.test import APITestCase
 from rest_framework.authtoken.models import Token
 from rest_framework import status
+from catan.factory import start_game
 from catan.models import *
 import json
 from django.contrib.auth.models import User
@@ -95,33 +96,12 @@ class GameTest(APITestCase):
 
         self.assertEquals(response.data, self.expected_games)
 
-    def test_distribute_resources(self):
-        board = Board.objects.create(name="ingenieria")
-        user = User.objects.create(username="diego")
-        game = Game.objects.create(board=board, name="ingenieria")
-        player = Player.objects.create(game=game, user=user)
-        ResourcesCard.objects.create(game=game, resource='brick')
-        ResourcesCard.objects.create(game=game, resource='wool')
-        ResourcesCard.objects.create(game=game, resource='wool')
-        Hexagon.objects.create(board=board, pos_level=2, pos_index=8, resource='brick', token=4)
-        Hexagon.objects.create(board=board, pos_level=2, pos_index=2, resource='wool', token=5)
-        SettlementBuilding.objects.create(owner=player, game=game, pos_level=2, pos_index=20)
-        CityBuilding.objects.create(owner=player, game=game, pos_level=2, pos_index=5)
-
-        game.distribute_resources(4)
-        res = ResourcesCard.count_player_all(player)
-        self.assertEqual(1, res)
-        game.distribute_resources(5)
-        res = ResourcesCard.count_player_all(player)
-        self.assertEqual(3, res)
-
 
 class GameStatusTestCase(APITestCase):
     def make_player_obj(self, game, username, colour, resources, cards):
         user = User.objects.create_user(username)
         player = Player.objects.create(user=user, game=game, colour=colour)
-        for _ in range(resources):
-            ResourcesCard.objects.create(game=game, player=player, resource="ore")
+        ResourcesCard.add(game, player, "ore", resources)
         for _ in range(cards):
             DevelopmentCard.objects.create(game=game, player=player, card="knight")
         return player
@@ -179,6 +159,40 @@ class GameStatusTestCase(APITestCase):
         self.assertEqual(given, expected, "full match failed")
         self.assertEqual(str(game), "Game (103)")
 
+    def test_game_status_query_budget(self):
+        board = Board.objects.create(name="board")
+        game = Game.objects.create(board=board)
+        players = [
+            self.make_player_obj(game, name, colour, 2, 1)
+            for name, colour in [("pepe", "red"), ("juan", "blue")]
+        ]
+        for i, p in enumerate(players):
+            SettlementBuilding.objects.create(owner=p, game=game, pos_level=2, pos_index=i * 5)
+            RoadBuilding.objects.create(
+                owner=p, game=game,
+                fst_pos_level=2, fst_pos_index=i * 5, snd_pos_level=2, snd_pos_index=i * 5 + 1
+            )
+        game.current_turn = players[0]
+        game.winner = players[1]
+        game.save()
+
+        # game, players, settlements, cities, roads, development and resource counts
+        with self.assertNumQueries(7):
+            response = self.client.get("/games/" + str(game.id) + "/")
+        self.assertEqual(response.data["winner"], "juan")
+        self.assertEqual(response.data["players"][1]["victory_points"], 1)
+
+        with self.assertNumQueries(1):
+            response = self.client.get("/games/" + str(game.id) + "/")
+        self.assertEqual(len(response.data["players"]), 2, "served from the cache")
+
+        self.make_player_obj(game, "ana", "green", 0, 0)
+        self.make_player_obj(game, "luis", "yellow", 0, 0)
+        game.bump_version()
+        with self.assertNumQueries(7):
+            response = self.client.get("/games/" + str(game.id) + "/")
+        self.assertEqual(len(response.data["players"]), 4)
+
 
 class RoomTestCase(APITestCase):
     expected_get = [
@@ -370,6 +384,24 @@ class RoomTestCase(APITestCase):
         self.maxDiff = None
         self.assertEqual(response_game.data, self.expected_start_game)
 
+    def test_start_game_creates_initial_state(self):
+        users = [User.objects.create(username=name) for name in ["ana", "beto", "caro", "dani"]]
+        room = Room.objects.create(name="full", owner=users[0], board_id=self.board)
+        for user in users:
+            room.players.add(user)
+
+        game = start_game(room, users[0])
+
+        self.assertEqual(Player.objects.filter(game=game).count(), 4, "players")
+        self.assertEqual(SettlementBuilding.objects.filter(game=game).count(), 8, "settlements")
+        self.assertEqual(RoadBuilding.objects.filter(game=game).count(), 8, "roads")
+        self.assertEqual(DevelopmentCard.count_bank(game), 25, "development deck")
+        for res, _ in RESOURCE_TYPES:
+            self.assertEqual(ResourcesCard.count_bank(game, res), 19, "bank " + res)
+        self.assertEqual(game.current_turn.user, users[0], "owner starts")
+        self.assertTrue(game.are_dices_rolled(), "first roll played")
+        self.assertEqual(Room.objects.get(id=room.id).game_id, game, "room started")
+
 
 class ResourceAndCardsTest(APITestCase):
     expected = {
@@ -396,75 +428,13 @@ class ResourceAndCardsTest(APITestCase):
         self.assertEqual(str(card), "monopoly (pepe (in Game (1)))")
 
 
-class GameTestCase(APITestCase):
-    def test_roll_dices(self):
-        game = Game.objects.create(
-            board=Board.objects.create(name="board"),
-            current_dices_1=1,
-            current_dices_2=2)
-        game.reset_dices()
-        self.assertFalse(game.are_dices_rolled(), "dices should not be rolled when resetted")
-        game.roll_dices()
-        self.assertTrue(game.are_dices_rolled(), "dices should be rolled")
-        self.assertIn(game.dices_sum(), range(2, 12+1), "dices sum should be between 2 and 12")
-
-    def test_advance_turn(self):
-        game = Game.objects.create(board=Board.objects.create(name="board"))
-        game.advance_turn()
-        p1 = Player.objects.create(game=game, user=User.objects.create_user("p1"))
-        p2 = Player.objects.create(game=game, user=User.objects.create_user("p2"))
-        game.current_turn = p1
-        game.save()
-        game.advance_turn()
-        self.assertEqual(game.current_turn, p2, "when advancing 1 turn, p2 should have the turn")
-        game.advance_turn()
-        self.assertEqual(game.current_turn, p1, "when advancing 2 turns, p1 should have the turn")
-
-    def test_robber_activate(self):
-        board = Board.objects.create()
-        game = Game.objects.create(board=board)
-
-        user1 = User.objects.create(username="user1")
-        player1 = Player.objects.create(game=game, user=user1)
-        cards1 = ["brick", "brick", "grain"]
-        for res in cards1:
-            ResourcesCard.objects.create(game=game, player=player1, resource=res)
-
-        user2 = User.objects.create(username="user2")
-        player2 = Player.objects.create(game=game, user=user2)
-        cards2 = ["brick", "grain", "grain", "wool", "ore", "ore", "lumber"]
-        for res in cards2:
-            ResourcesCard.objects.create(game=game, player=player2, resource=res)
-
-        user3 = User.objects.create(username="user3")
-        player3 = Player.objects.create(game=game, user=user3)
-        cards3 = ["brick", "brick", "grain", "wool", "wool", "ore", "lumber", "lumber", "lumber"]
-        for res in cards3:
-            ResourcesCard.objects.create(game=game, player=player3, resource=res)
-
-        game.robber_activate()
-        self.assertEqual(
-            ResourcesCard.count_player_all(player1), len(cards1),
-            "1 not affected by the robber"
-        )
-        self.assertEqual(
-            ResourcesCard.count_player_all(player2), len(cards2),
-            "2 not affected by the robber"
-        )
-        self.assertEqual(
-            ResourcesCard.count_player_all(player3), len(cards3) // 2 + len(cards3) % 2,
-            "3 has been affected by the robber"
-        )
-
-
 class ResourcesCardTest(APITestCase):
     def setUp(self):
         self.game = Game.objects.create(board=Board.objects.create(name="board"))
         self.player = Player.objects.create(user=User.objects.create_user("user"), game=self.game)
 
     def spawn_resources(self, game, resource, amount, player=None):
-        for _ in range(amount):
-            ResourcesCard.objects.create(game=game, player=player, resource=resource)
+        ResourcesCard.add(game, player, resource, amount)
 
     def test_owned_by_bank(self):
         res = ResourcesCard.objects.create(game=self.game)
@@ -483,31 +453,17 @@ class ResourcesCardTest(APITestCase):
         self.assertEqual(ResourcesCard.count_player(player, "wool"), 1, "player has incorrect wool")
         self.assertEqual(ResourcesCard.count_player(player, "ore"), 2, "player has incorrect ore")
 
-    def test_take(self):
-        game = self.game
-        player = self.player
-
-        with self.assertRaises(ValueError):
-            ResourcesCard.take(player, 'wool', 1)
-        self.spawn_resources(game, "wool", 4)
-        self.spawn_resources(game, "wool", 1, player)
-
-        ResourcesCard.take(player, "wool", 1)
-        self.assertEqual(ResourcesCard.count_bank(game, "wool"), 5, "bank has incorrect wool")
-        self.assertEqual(ResourcesCard.count_player(player, "wool"), 0, "player has incorrect wool")
-
-    def test_give(self):
+    def test_one_row_per_holder(self):
         game = self.game
         player = self.player
-
-        with self.assertRaises(ValueError):
-            ResourcesCard.give(player, 'ore', 1)
-        self.spawn_resources(game, "wool", 4)
-        self.spawn_resources(game, "wool", 1, player)
-
-        ResourcesCard.give(player, "wool", 4)
-        self.assertEqual(ResourcesCard.count_bank(game, "wool"), 0, "bank has incorrect wool")
-        self.assertEqual(ResourcesCard.count_player(player, "wool"), 5, "player has incorrect wool")
+        self.spawn_resources(game, "grain", 19)
+
+        self.spawn_resources(game, "grain", 3, player)
+        self.spawn_resources(game, "grain", 2, player)
+        self.spawn_resources(game, "grain", 1)
+        self.assertEqual(ResourcesCard.objects.filter(game=game).count(), 2, "one row per holder")
+        self.assertEqual(ResourcesCard.count_bank(game, "grain"), 20, "bank has incorrect grain")
+        self.assertEqual(ResourcesCard.count_player(player, "grain"), 5, "player has wrong grain")
 
 
 class UserTestCase(APITestCase):
@@ -96,8 +96,7 @@ class BankTradeActionTest(APITestCase):
         }), "invalid resource and invalid format")
 
     def test_execute_passes(self):
-        for _ in range(4):
-            ResourcesCard.objects.create(game=self.game, player=self.player, resource="wool")
+        ResourcesCard.add(self.game, self.player, "wool", 4)
 
         payload = {
             "give": "wool",
@@ -112,8 +111,7 @@ class BankTradeActionTest(APITestCase):
         self.assertEqual(ResourcesCard.count_player(self.player, "ore"), 1, "player count")
 
     def test_execute_fail(self):
-        for _ in range(3):  # 3, not 4.
-            ResourcesCard.objects.create(game=self.game, player=self.player, resource="wool")
+        ResourcesCard.add(self.game, self.player, "wool", 3)  # 3, not 4.
 
         payload = {
             "give": "wool",
@@ -391,7 +389,7 @@ class PlayBuildRoadCardActionTest(APITestCase):
 
     def test_get_available_road_positions(self):
         expected = [((0, 0), (0, 5)), ((0, 4), (0, 5)), ((0, 5), (1, 15))]
-        result = get_available_road_positions(self.player)
+        result = load_state(self.game).occupancy.road_positions(self.player.id)
         self.assertEqual(result, expected)
 
     def test_execute(self):
@@ -492,11 +490,11 @@ class MoveRobberActionTest(APITestCase):
         )
         self.assertTrue(self.game.robber_moved, "the robber has been moved this turn")
         self.assertTrue(
-            ResourcesCard.objects.filter(game=self.game, player=self.player2).count() == 0,
+            ResourcesCard.count_player_all(self.player2) == 0,
             "player2 has no resources now"
         )
         self.assertTrue(
-            ResourcesCard.objects.filter(game=self.game, player=self.player1).count() == 1,
+            ResourcesCard.count_player_all(self.player1) == 1,
             "player1 has one resource now"
         )
 
@@ -594,11 +592,11 @@ class PlayKnightCardActionTest(APITestCase):
         )
         self.assertTrue(self.game.robber_moved, "the robber has been moved this turn")
         self.assertTrue(
-            ResourcesCard.objects.filter(game=self.game, player=self.player2).count() == 0,
+            ResourcesCard.count_player_all(self.player2) == 0,
             "player2 has no resources now"
         )
         self.assertTrue(
-            ResourcesCard.objects.filter(game=self.game, player=self.player1).count() == 1,
+            ResourcesCard.count_player_all(self.player1) == 1,
             "player1 has one resource now"
         )
 
@@ -0,0 +1,60 @@
+from io import StringIO
+
+import numpy as np
+from django.core.management import call_command
+from django.test import SimpleTestCase
+from rest_framework.test import APITestCase
+
+from catan.analysis import *
+from catan.models import Board, Hexagon
+
+
+class AnalysisTest(SimpleTestCase):
+    def test_roll_frequencies(self):
+        frequencies = roll_frequencies(2500000, np.random.default_rng(1))
+        self.assertAlmostEqual(frequencies.sum(), 1)
+        np.testing.assert_allclose(frequencies, DICE_PROBABILITY, atol=0.002)
+
+    def test_roll_frequencies_in_batches(self):
+        rolls = ROLL_BATCH + 10
+        frequencies = roll_frequencies(rolls, np.random.default_rng(1))
+        self.assertEqual(round(frequencies.sum() * rolls), rolls)
+
+    def test_vertex_yield(self):
+        hexes = [(h, "ore", 8) for h in range(HEXAGON_COUNT)]
+        hexes[0] = (0, None, 0)
+        analysis = analyze(hexes, rolls=10, seed=3)
+        frequency = roll_frequencies(10, np.random.default_rng(3))[8]
+
+        ore = RESOURCES.index("ore")
+        for v, touching in enumerate(VERTEX_HEXES):
+            producing = len([h for h in touching if h != 0])
+            self.assertAlmostEqual(analysis.vertex_yield[v, ore], producing * frequency)
+        self.assertEqual(analysis.vertex_yield.sum(), analysis.vertex_yield[:, ore].sum())
+
+        for seat, vertices in enumerate(STARTING_VERTICES):
+            self.assertAlmostEqual(
+                analysis.seat_yield[seat, ore], analysis.vertex_yield[vertices, ore].sum()
+            )
+
+    def test_seeded(self):
+        hexes = [(h, "wool", 6) for h in range(HEXAGON_COUNT)]
+        np.testing.assert_array_equal(
+            analyze(hexes, 1000, seed=4).vertex_yield, analyze(hexes, 1000, seed=4).vertex_yield
+        )
+
+
+class AnalyzeBoardCommandTest(APITestCase):
+    def test_report(self):
+        board = Board.objects.create(name="ingenieria")
+        for h, (level, index) in enumerate(HEXAGON_POSITIONS):
+            Hexagon.objects.create(
+                board=board, pos_level=level, pos_index=index, resource="grain", token=6
+            )
+        out = StringIO()
+        call_command('analyze_board', 'ingenieria', rolls=1000, seed=1, top=3, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], "1000 rolls, resources per roll (%s)" % ", ".join(RESOURCES))
+        self.assertEqual([line.split(":")[0] for line in lines[1:5]],
+                         ["seat 1", "seat 2", "seat 3", "seat 4"])
+        self.assertEqual(len([line for line in lines if line.startswith("vertex")]), 3)
@@ -0,0 +1,183 @@
+from rest_framework.test import APITestCase
+
+from catan.factory import start_game
+from catan.models import *
+from catan.moves import END_TURN, decode_move, legal_moves
+from catan.actions import ACTION_HANDLERS
+from catan.store import StaleState, load_state, play
+from catan.tests_replay import TOKENS, replayed_state, stored_state
+
+
+class StartedGameTestCase(APITestCase):
+    def setUp(self):
+        board = Board.objects.create(name="board")
+        resources = [r for r, _ in RESOURCE_TYPES]
+        for h, (level, index) in enumerate(HEXAGON_POSITIONS):
+            Hexagon.objects.create(
+                board=board,
+                pos_level=level,
+                pos_index=index,
+                resource=resources[h % len(resources)],
+                token=TOKENS[h % len(TOKENS)]
+            )
+        self.users = [User.objects.create_user(name) for name in ["ana", "beto", "caro"]]
+        room = Room.objects.create(name="room", owner=self.users[0], board_id=board)
+        for user in self.users:
+            room.players.add(user)
+        self.game = start_game(room, self.users[0])
+        self.client.force_authenticate(user=self.game.current_turn.user)
+
+
+class PlayerActionBatchTest(StartedGameTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = "/games/" + str(self.game.id) + "/player/actions/batch/"
+
+    def turn(self):
+        """Actions of a whole turn of the player in turn: the first legal ones, then end_turn."""
+        state = load_state(self.game).copy()
+        actions = []
+        while True:
+            moves = legal_moves(state)
+            move = next((m for m in moves if m[0] != END_TURN), moves[0])
+            if len(actions) == 3:
+                move = moves[0]
+            action, payload = decode_move(state, move)
+            actions.append({"type": action, "payload": payload})
+            if move[0] == END_TURN:
+                return actions
+            state.apply(state.version + 1, state.turn, action, payload)
+
+    def test_plays_all_in_order(self):
+        # resources from outside the game: load it from its tables from now on
+        player = self.game.current_turn
+        for resource, amount in [("wool", 4), ("brick", 2), ("lumber", 2), ("grain", 1)]:
+            ResourcesCard.transfer(self.game.id, None, player.id, resource, amount)
+        Game.objects.filter(pk=self.game.id).update(snapshot=None)
+        self.game = Game.objects.get(pk=self.game.id)
+        before = load_state(self.game)
+
+        actions = self.turn()
+        self.assertGreater(len(actions), 2)
+        response = self.client.post(self.url, {"actions": actions}, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+
+        results = response.data["results"]
+        self.assertEqual([r["type"] for r in results], [a["type"] for a in actions])
+        self.assertEqual([r["version"] for r in results], list(range(2, len(actions) + 2)))
+        self.assertEqual(results[-1]["events"][0]["type"], "turn_advanced")
+
+        game = Game.objects.get(pk=self.game.id)
+        self.assertEqual(game.version, len(actions) + 1)
+        self.assertEqual(game.current_turn, Player.objects.get(game=game, user=self.users[1]))
+        self.assertEqual(
+            list(game.actionlog_set.order_by('sequence').values_list('action', flat=True)),
+            ["start_game"] + [a["type"] for a in actions]
+        )
+        for action in actions:
+            before.apply(before.version + 1, player.id, action["type"], action["payload"])
+        self.assertEqual(replayed_state(before), stored_state(game))
+
+    def test_all_or_nothing(self):
+        actions = self.turn() + [{"type": "end_turn", "payload": None}]
+        response = self.client.post(self.url, {"actions": actions}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {"details": "not in your turn", "index": len(actions) - 1})
+
+        game = Game.objects.get(pk=self.game.id)
+        self.assertEqual(game.version, 1)
+        self.assertEqual(game.current_turn, self.game.current_turn)
+        self.assertEqual(game.actionlog_set.count(), 1)
+
+    def test_idempotency_key(self):
+        actions = self.turn()
+        for _ in range(2):
+            response = self.client.post(
+                self.url, {"actions": actions}, format="json", HTTP_IDEMPOTENCY_KEY="b1"
+            )
+            self.assertEqual(response.status_code, 200)
+        game = Game.objects.get(pk=self.game.id)
+        self.assertEqual(game.version, len(actions) + 1, "played once")
+        keys = game.actionlog_set.order_by('sequence').values_list('idempotency_key', flat=True)
+        self.assertEqual(list(keys), [None, "b1"] + [None] * (len(actions) - 1))
+
+        response = self.client.post(self.url, {"actions": actions}, format="json",
+                                    HTTP_IDEMPOTENCY_KEY="b" * (IDEMPOTENCY_KEY_LENGTH + 1))
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_payload(self):
+        actions = [{"type": "end_turn", "payload": None}, {"type": "build_road", "payload": 3}]
+        response = self.client.post(self.url, {"actions": actions}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["index"], 1)
+
+        response = self.client.post(self.url, {"actions": [{"type": "fly"}]}, format="json")
+        self.assertEqual(response.data["index"], 0)
+
+        response = self.client.post(self.url, {"actions": []}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Game.objects.get(pk=self.game.id).version, 1)
+
+    def test_not_in_turn(self):
+        other = next(u for u in self.users if u != self.game.current_turn.user)
+        self.client.force_authenticate(user=other)
+        response = self.client.post(
+            self.url, {"actions": [{"type": "end_turn", "payload": None}]}, format="json"
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+class ConcurrentActionsTest(StartedGameTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = "/games/" + str(self.game.id) + "/player/actions/"
+        self.player = self.game.current_turn
+
+    def test_stale_state_is_not_written(self):
+        state = load_state(self.game)
+        response = self.client.post(self.url, {"type": "end_turn", "payload": None}, format="json")
+        self.assertEqual(response.status_code, 200)
+
+        with self.assertRaises(StaleState):
+            ACTION_HANDLERS["end_turn"].execute(self.player, self.game, None, state)
+        game = Game.objects.get(pk=self.game.id)
+        self.assertEqual(game.version, 2)
+        self.assertEqual(game.actionlog_set.count(), 2)
+        self.assertNotEqual(game.current_turn, self.player)
+
+    def test_idempotency_key(self):
+        action = {"type": "end_turn", "payload": None}
+        for _ in range(2):
+            response = self.client.post(self.url, action, format="json", HTTP_IDEMPOTENCY_KEY="k1")
+            self.assertEqual(response.status_code, 200)
+        game = Game.objects.get(pk=self.game.id)
+        self.assertEqual(game.version, 2, "played once")
+        self.assertEqual(game.actionlog_set.get(sequence=2).idempotency_key, "k1")
+
+        response = self.client.post(self.url, action, format="json", HTTP_IDEMPOTENCY_KEY="k2")
+        self.assertEqual(response.status_code, 401, "a new key is a new action")
+
+        response = self.client.post(self.url, action, format="json",
+                                    HTTP_IDEMPOTENCY_KEY="k" * (IDEMPOTENCY_KEY_LENGTH + 1))
+        self.assertEqual(response.status_code, 400)
+
+    def test_key_reused_by_another_player(self):
+        action = {"type": "end_turn", "payload": None}
+        response = self.client.post(self.url, action, format="json", HTTP_IDEMPOTENCY_KEY="k1")
+        self.assertEqual(response.status_code, 200)
+
+        game = Game.objects.get(pk=self.game.id)
+        self.client.force_authenticate(user=game.current_turn.user)
+        response = self.client.post(self.url, action, format="json", HTTP_IDEMPOTENCY_KEY="k1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Game.objects.get(pk=self.game.id).version, 3, "played by both")
+
+    def test_key_used_concurrently(self):
+        ActionLog.objects.create(
+            game=self.game, sequence=99, player=self.player, action="end_turn", idempotency_key="k1"
+        )
+        with self.assertRaises(StaleState):
+            play(self.game, self.player, "end_turn", None, idempotency_key="k1")
+        game = Game.objects.get(pk=self.game.id)
+        self.assertEqual(game.version, 1, "rolled back")
+        self.assertEqual(game.current_turn, self.player)
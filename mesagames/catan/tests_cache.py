@@ -0,0 +1,109 @@
+from django.test import SimpleTestCase
+from rest_framework.test import APITestCase
+
+from catan.cache import LocalStateCache, get_state_cache
+from catan.models import *
+
+
+class LocalStateCacheTest(SimpleTestCase):
+    def test_lru_eviction(self):
+        cache = LocalStateCache(max_entries=2)
+        cache.set((1, 0, None, "status"), {"a": 1})
+        cache.set((1, 1, None, "status"), {"a": 2})
+        cache.get((1, 0, None, "status"))
+        cache.set((2, 0, None, "status"), {"a": 3})
+
+        self.assertEqual(len(cache), 2, "bounded by entries")
+        self.assertEqual(cache.get((1, 0, None, "status")), {"a": 1}, "recently used is kept")
+        self.assertIsNone(cache.get((1, 1, None, "status")), "least recently used is evicted")
+
+    def test_size_limit(self):
+        cache = LocalStateCache(max_size=300)
+        cache.set((1, 0, None, "big"), "x" * 1000)
+        self.assertIsNone(cache.get((1, 0, None, "big")), "too big to be stored")
+
+        for version in range(10):
+            cache.set((1, version, None, "status"), "y" * 100)
+        self.assertLess(len(cache), 10, "bounded by size")
+        self.assertIsNotNone(cache.get((1, 9, None, "status")), "newest is kept")
+
+    def test_invalidate_game(self):
+        cache = LocalStateCache()
+        cache.set((1, 0, None, "status"), 1)
+        cache.set((1, 0, 3, "cards"), 2)
+        cache.set((2, 0, None, "status"), 3)
+        cache.invalidate_game(1)
+
+        self.assertIsNone(cache.get((1, 0, None, "status")))
+        self.assertIsNone(cache.get((1, 0, 3, "cards")))
+        self.assertEqual(cache.get((2, 0, None, "status")), 3, "other games are kept")
+
+
+class VersionedViewsTest(APITestCase):
+    def setUp(self):
+        self.game = Game.objects.create(board=Board.objects.create(name="board"))
+        self.user = User.objects.create_user("pepe")
+        self.player = Player.objects.create(game=self.game, user=self.user)
+        self.game.current_turn = self.player
+        self.game.save()
+        self.client.force_authenticate(user=self.user)
+
+    def test_actions_bump_version(self):
+        url = "/games/" + str(self.game.id) + "/player/actions/"
+        response = self.client.get(url)
+        self.assertEqual(response.data, [{"type": "end_turn", "payload": None}])
+
+        with self.assertNumQueries(1):
+            self.client.get(url)
+
+        response = self.client.post(url, {"type": "end_turn", "payload": None}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Game.objects.get(id=self.game.id).version, 1, "version bumped")
+
+    def test_new_game_with_reused_id_is_not_served_from_cache(self):
+        get_state_cache().set((self.game.id + 1, 0, None, "status"), {"stale": True})
+        game = Game.objects.create(id=self.game.id + 1, board=self.game.board)
+        game.current_turn = self.player
+        game.save()
+
+        response = self.client.get("/games/" + str(game.id) + "/")
+        self.assertNotIn("stale", response.data)
+
+
+class ETagTest(APITestCase):
+    def setUp(self):
+        self.game = Game.objects.create(board=Board.objects.create(name="board"))
+        self.user = User.objects.create_user("pepe")
+        self.player = Player.objects.create(game=self.game, user=self.user)
+        self.game.current_turn = self.player
+        self.game.save()
+        self.client.force_authenticate(user=self.user)
+
+    def test_not_modified(self):
+        for url in ["/", "/player/", "/player/actions/"]:
+            url = "/games/" + str(self.game.id) + url
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etag = response["ETag"]
+
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, url + " not modified")
+            self.assertEqual(response["ETag"], etag)
+            self.assertEqual(response.content, b"")
+
+            response = self.client.get(url, HTTP_IF_NONE_MATCH='"other", W/' + etag)
+            self.assertEqual(response.status_code, 304, url + " matches any listed tag")
+
+    def test_etag_changes_with_version_and_viewer(self):
+        url = "/games/" + str(self.game.id) + "/player/"
+        etag = self.client.get(url)["ETag"]
+
+        self.game.bump_version()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200, "modified after an action")
+        self.assertNotEqual(response["ETag"], etag)
+
+        other = User.objects.create_user("juan")
+        Player.objects.create(game=self.game, user=other)
+        self.client.force_authenticate(user=other)
+        self.assertNotEqual(self.client.get(url)["ETag"], response["ETag"], "per viewer")
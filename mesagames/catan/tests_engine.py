@@ -0,0 +1,189 @@
+from django.test import SimpleTestCase
+
+from catan.engine import RESOURCES, GameState, action_rng, position_json
+from catan.moves import MOVE_ROBBER, legal_moves
+from catan.rules import *
+from catan.topology import *
+
+HEXES = [(h, "wool", 6) for h in range(HEXAGON_COUNT)]
+
+
+def new_game(usernames=("ana", "beto")):
+    state = GameState(7, HEXES)
+    players = [[i + 1, name] for i, name in enumerate(usernames)]
+    state.apply(1, None, "start_game", {"players": players, "first_turn": 1})
+    return state
+
+
+def position(vertex):
+    level, index = VERTEX_POSITIONS[vertex]
+    return {"level": level, "index": index}
+
+
+class GameStateTest(SimpleTestCase):
+    def test_start_game(self):
+        state = new_game()
+        self.assertEqual(state.version, 1)
+        self.assertEqual(state.turn, 1)
+        self.assertEqual(len(state.occupancy.settlements), 4)
+        self.assertEqual(len(state.occupancy.roads), 4)
+        self.assertEqual(len(state.cards), DEVELOPMENT_DECK_SIZE)
+        self.assertEqual([e[0] for e in state.events], ["dice_rolled"])
+
+    def test_build_road(self):
+        state = new_game()
+        target = next(iter(state.occupancy.settlement_positions(1)), None)
+        self.assertIsNone(target, "no roads to build on yet")
+
+        road = state.occupancy.road_positions(1)[0]
+        payload = [position(vertex_id(road[0])), position(vertex_id(road[1]))]
+        self.assertFalse(state.can_apply(1, "build_road", payload), "no resources")
+        for resource, amount in ROAD_COST.items():
+            state.transfer(None, 1, resource, amount)
+        self.assertTrue(state.can_apply(1, "build_road", payload))
+        self.assertFalse(state.can_apply(2, "build_road", payload), "not connected to p2")
+
+        state.apply(2, 1, "build_road", payload)
+        self.assertEqual(state.occupancy.count_roads(1), 3)
+        self.assertFalse(state.can_apply(1, "build_road", payload), "already built")
+        self.assertEqual(state.version, 2)
+
+    def test_bank_trade(self):
+        state = new_game()
+        payload = {"give": "ore", "receive": "brick"}
+        state.transfer(None, 1, "ore", 3)
+        self.assertFalse(state.can_apply(1, "bank_trade", payload))
+        state.transfer(None, 1, "ore", 1)
+        self.assertTrue(state.can_apply(1, "bank_trade", payload))
+
+        ore = state.count_resources(None, "ore")
+        state.apply(2, 1, "bank_trade", payload)
+        self.assertEqual(state.count_resources(1, "brick"), 1)
+        self.assertEqual(state.count_resources(None, "ore"), ore + 4)
+
+    def test_buy_card_empty_deck(self):
+        state = new_game()
+        for resource, amount in DEVELOPMENT_CARD_COST.items():
+            state.transfer(None, 1, resource, amount)
+        self.assertTrue(state.can_apply(1, "buy_card", None))
+
+        for card in state.cards:
+            card[1] = 2
+        self.assertFalse(state.can_apply(1, "buy_card", None), "no cards left")
+        self.assertNotIn("buy_card", [a["type"] for a in state.available_actions(1)])
+
+    def test_seven_discards_and_locks_turn(self):
+        state = new_game()
+        state.resources = {(None, r): BANK_RESOURCES for r in RESOURCES}
+        for resource, amount in [("brick", 4), ("ore", 3), ("wool", 2)]:
+            state.transfer(None, 1, resource, amount)
+        state.transfer(None, 2, "grain", 7)
+
+        def roll(sequence):
+            rng = action_rng(state.seed, sequence)
+            return rng.randint(1, 6) + rng.randint(1, 6)
+
+        # the first sequence whose end_turn rolls a 7
+        sequence = next(s for s in range(2, 100) if roll(s) == 7)
+        state.version = sequence - 1
+        state.apply(sequence, 1, "end_turn", None)
+        self.assertEqual(sum(state.dices), 7)
+
+        self.assertEqual(state.count_resources(1), 9 - 9 // 2, "more than 7 cards: loses half")
+        self.assertEqual(state.count_resources(2), 7, "7 cards: keeps them")
+        self.assertEqual(state.count_resources(None), len(RESOURCES) * BANK_RESOURCES - 7 - 5)
+
+        self.assertEqual([a["type"] for a in state.available_actions(2)], ["move_robber"])
+        self.assertEqual(set(legal_moves(state)[:, 0]), {MOVE_ROBBER})
+
+    def test_robber(self):
+        state = new_game()
+        state.dices = (3, 4)
+        settlement = next(v for v, owner in state.occupancy.settlements.items() if owner == 2)
+        hexagon = next(h for h in VERTEX_HEXES[settlement] if h != state.robber)
+        level, index = HEXAGON_POSITIONS[hexagon]
+        payload = {"position": {"level": level, "index": index}, "player": "beto"}
+        state.transfer(None, 2, "grain", 1)
+
+        self.assertTrue(state.can_apply(1, "move_robber", payload))
+        self.assertFalse(state.can_apply(2, "move_robber", payload), "cannot rob itself")
+        self.assertFalse(
+            state.can_apply(1, "move_robber", dict(payload, player="nobody")), "unknown player"
+        )
+        self.assertEqual(state.available_actions(1)[0]["type"], "move_robber", "must move it")
+
+        state.apply(2, 1, "move_robber", payload)
+        self.assertEqual(state.robber, hexagon)
+        self.assertEqual(state.count_resources(1, "grain"), 1, "stolen")
+        self.assertFalse(state.can_apply(1, "move_robber", payload), "moved once per turn")
+
+    def test_copy_is_independent(self):
+        state = new_game()
+        copy = state.copy()
+        copy.apply(2, 1, "end_turn", None)
+
+        self.assertEqual(state.turn, 1)
+        self.assertEqual(copy.turn, 2)
+        self.assertEqual(state.version, 1)
+        self.assertEqual(GameState.loads(state.dumps()).dumps(), state.dumps())
+
+    def test_copy_shares_board_until_built(self):
+        state = new_game()
+        for resource, amount in ROAD_COST.items():
+            state.transfer(None, 1, resource, amount)
+        copy = state.copy()
+        self.assertIs(copy.occupancy, state.occupancy)
+
+        road = state.occupancy.road_positions(1)[0]
+        copy.apply(2, 1, "build_road", [position(vertex_id(v)) for v in road])
+        self.assertIsNot(copy.occupancy, state.occupancy)
+        self.assertEqual(copy.occupancy.count_roads(1), 3)
+        self.assertEqual(state.occupancy.count_roads(1), 2)
+        self.assertEqual(state.count_resources(1, "brick"), 1)
+
+
+class UndoTest(SimpleTestCase):
+    def assertUndoes(self, state, player, action, payload):
+        before = state.dumps()
+        copy = state.copy()
+        state.push(player, action, payload)
+        after = state.dumps()
+        self.assertNotEqual(after, before)
+        state.undo()
+        self.assertEqual(state.dumps(), before, action)
+        self.assertEqual(copy.dumps(), before, "copies are not affected")
+
+        state.push(player, action, payload)
+        self.assertEqual(state.dumps(), after, "actions replay the same")
+        state.undo()
+
+    def test_undo_every_action(self):
+        state = new_game(("ana", "beto", "carla"))
+        state.dices = (2, 3)
+        for resource in RESOURCES:
+            state.transfer(None, 1, resource, 5)
+        state.cards[0][1] = 1
+        state.cards[0][0] = "road_building"
+        state.cards[1][1] = 1
+        state.cards[1][0] = "knight"
+
+        road = state.occupancy.road_positions(1)[0]
+        self.assertUndoes(state, 1, "build_road", [position(vertex_id(v)) for v in road])
+        state.push(1, "build_road", [position(vertex_id(v)) for v in road])
+        self.assertUndoes(state, 1, "build_settlement",
+                          position(vertex_id(state.occupancy.settlement_positions(1)[0])))
+        roads = state.occupancy.road_positions(1)[:2]
+        self.assertUndoes(state, 1, "play_road_building_card",
+                          [[position(vertex_id(v)) for v in r] for r in roads])
+        self.assertUndoes(state, 1, "bank_trade", {"give": "ore", "receive": "brick"})
+        self.assertUndoes(state, 1, "buy_card", None)
+        knight = {"position": position_json(HEXAGON_POSITIONS[1]), "player": ""}
+        self.assertUndoes(state, 1, "play_knight_card", knight)
+        self.assertUndoes(state, 1, "end_turn", None)
+
+        state.dices = (3, 4)
+        self.assertUndoes(state, 1, "move_robber", knight)
+
+        state.undo()
+        self.assertEqual(state.version, 1)
+        self.assertEqual(state.history, [])
@@ -0,0 +1,82 @@
+import threading
+import time
+
+from django.test import SimpleTestCase
+from rest_framework.test import APITestCase
+
+from catan.events import *
+from catan.models import *
+
+
+class SubscriptionTest(SimpleTestCase):
+    def test_overflow_drops_queue_and_resyncs(self):
+        broker = EventBroker()
+        with broker.subscribe(1, max_pending=2) as subscription:
+            broker.publish(1, 1, [(DICE_ROLLED, {"dices": [1, 2]})])
+            broker.publish(1, 2, [(DICE_ROLLED, {"dices": [3, 4]})])
+            self.assertEqual(len(subscription.get(0)[0]), 2)
+
+            broker.publish(1, 3, [(DICE_ROLLED, {"dices": [1, 1]})] * 3)
+            broker.publish(1, 4, [(DICE_ROLLED, {"dices": [2, 2]})])
+            self.assertEqual(subscription.get(0), ([], 4), "resync to the last version")
+
+            broker.publish(1, 5, [(TURN_ADVANCED, {"player": "pepe"})])
+            self.assertEqual(
+                subscription.get(0), ([GameEvent(TURN_ADVANCED, 5, {"player": "pepe"})], None)
+            )
+        self.assertEqual(broker.subscribers(1), 0)
+
+    def test_other_games_are_not_received(self):
+        broker = EventBroker()
+        with broker.subscribe(1) as subscription:
+            broker.publish(2, 1, [(DICE_ROLLED, {"dices": [1, 2]})])
+            self.assertEqual(subscription.get(0), ([], None))
+
+    def test_event_stream(self):
+        broker = EventBroker()
+        stream = event_stream(1, lambda: 7, 5, 0.05, broker)
+        self.assertEqual(next(stream), 'id: 7\nevent: sync\ndata: {"version": 7}\n\n')
+        self.assertEqual(next(stream), ": keepalive\n\n")
+
+        def act():
+            time.sleep(0.01)
+            broker.publish(1, 8, [(ROBBER_MOVED, {"position": {"level": 1, "index": 2}})])
+
+        threading.Thread(target=act).start()
+        self.assertEqual(
+            next(stream),
+            'id: 8\nevent: robber_moved\ndata: {"position": {"level": 1, "index": 2}}\n\n'
+        )
+        stream.close()
+        self.assertEqual(broker.subscribers(1), 0, "closing the stream unsubscribes")
+
+
+class GameEventsTest(APITestCase):
+    def setUp(self):
+        self.game = Game.objects.create(board=Board.objects.create(name="board"))
+        self.user = User.objects.create_user("pepe")
+        self.player = Player.objects.create(game=self.game, user=self.user)
+        self.game.current_turn = self.player
+        self.game.save()
+        self.client.force_authenticate(user=self.user)
+
+    def test_actions_publish_events(self):
+        url = "/games/" + str(self.game.id) + "/player/actions/"
+        with event_broker.subscribe(self.game.id) as subscription:
+            response = self.client.post(url, {"type": "end_turn", "payload": None}, format="json")
+            self.assertEqual(response.status_code, 200)
+            events, _ = subscription.get(0)
+
+        self.assertEqual([e.type for e in events], [TURN_ADVANCED, DICE_ROLLED])
+        self.assertEqual(events[0], GameEvent(TURN_ADVANCED, 1, {"player": "pepe"}))
+
+    def test_stream_starts_with_sync(self):
+        response = self.client.get("/games/" + str(self.game.id) + "/events/")
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        first = next(iter(response.streaming_content))
+        self.assertEqual(first, b'id: 0\nevent: sync\ndata: {"version": 0}\n\n')
+        response.close()
+
+    def test_unknown_game(self):
+        response = self.client.get("/games/" + str(self.game.id + 1) + "/events/")
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,78 @@
+import fcntl
+import os
+import tempfile
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from catan.executor import *
+
+
+class GameExecutorTest(SimpleTestCase):
+    def setUp(self):
+        self.lock_dir = tempfile.TemporaryDirectory()
+        self.executor = GameExecutor(self.lock_dir.name)
+
+    def tearDown(self):
+        self.lock_dir.cleanup()
+
+    def test_runs_in_arrival_order(self):
+        order = []
+        started = []
+
+        def play(i):
+            started.append(i)
+            self.executor.run(1, order.append, i)
+
+        with self.executor.serialized(1):
+            threads = []
+            for i in range(5):
+                threads.append(threading.Thread(target=play, args=(i,)))
+                threads[-1].start()
+                while self.executor.waiting(1) < i + 2:
+                    time.sleep(0.001)
+            self.assertEqual(order, [], "all wait for the first one")
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(order, list(range(5)))
+        self.assertEqual(self.executor.waiting(1), 0)
+
+    def test_games_run_in_parallel(self):
+        with self.executor.serialized(1):
+            self.assertEqual(self.executor.run(2, lambda: "played"), "played")
+
+    def test_timeout(self):
+        with self.executor.serialized(1):
+            result = []
+            thread = threading.Thread(target=self.wait_for_game, args=(1, result))
+            thread.start()
+            thread.join()
+            self.assertEqual(result, ["busy"])
+            self.assertEqual(self.executor.waiting(1), 1, "gave up its place")
+        self.assertEqual(self.executor.run(1, lambda: "played"), "played")
+
+    def test_file_lock(self):
+        # another process holding the game
+        fd = os.open(os.path.join(self.lock_dir.name, "game-3.lock"), os.O_RDWR | os.O_CREAT)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            result = []
+            self.wait_for_game(3, result)
+            self.assertEqual(result, ["busy"])
+            self.assertEqual(self.executor.waiting(3), 0)
+        finally:
+            os.close(fd)
+        self.assertEqual(self.executor.run(3, lambda: "played"), "played")
+
+    def test_without_file_lock(self):
+        executor = GameExecutor(None)
+        self.assertEqual(executor.run(1, lambda: "played"), "played")
+
+    def wait_for_game(self, game_id, result):
+        try:
+            with self.executor.serialized(game_id, timeout=0.05):
+                result.append("played")
+        except GameBusy:
+            result.append("busy")
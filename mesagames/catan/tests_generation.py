@@ -0,0 +1,74 @@
+from collections import Counter
+from io import StringIO
+
+import numpy as np
+from django.core.management import call_command
+from django.test import SimpleTestCase
+from rest_framework.test import APITestCase
+
+from catan.generation import *
+
+
+class GenerationTest(SimpleTestCase):
+    def test_generate_layouts(self):
+        resources, tokens = generate_layouts(50, np.random.default_rng(2))
+        self.assertEqual(resources.shape, (50, HEXAGON_COUNT))
+        for layout in zip(resources, tokens):
+            hexes = layout_hexes(*layout)
+            self.assertEqual(Counter(r for _, r, _ in hexes if r is not None),
+                             Counter(BOARD_RESOURCES))
+            self.assertEqual([t for _, r, t in hexes if r is None], [0])
+            self.assertEqual(sorted(t for _, r, t in hexes if r is not None), BOARD_TOKENS)
+
+    def test_valid_layouts(self):
+        tokens = np.full((2, HEXAGON_COUNT), 5)
+        # the center hexagon and the first one of level 1 share a side
+        tokens[0, [hexagon_id((0, 0)), hexagon_id((1, 0))]] = [6, 8]
+        tokens[1, [hexagon_id((0, 0)), hexagon_id((2, 0))]] = [6, 8]
+        self.assertEqual(list(valid_layouts(tokens)), [False, True])
+
+    def test_score_matches_analysis(self):
+        resources, tokens = generate_layouts(1, np.random.default_rng(5))
+        hexes = layout_hexes(resources[0], tokens[0])
+        vertex_yield = ADJACENCY @ np.array([
+            [DICE_PROBABILITY[t] * (r == resource) for resource in RESOURCES]
+            for _, r, t in hexes
+        ])
+        seats = [vertex_yield[vertices].sum() for vertices in STARTING_VERTICES]
+        per_hex = [
+            sum(DICE_PROBABILITY[t] for _, r, t in hexes if r == resource) /
+            BOARD_RESOURCES.count(resource)
+            for resource in RESOURCES
+        ]
+        self.assertAlmostEqual(
+            score_layouts(resources, tokens)[0],
+            max(seats) - min(seats) + max(per_hex) - min(per_hex)
+        )
+
+    def test_best_layouts(self):
+        resources, tokens, scores = best_layouts(LAYOUT_BATCH + 500, 4, np.random.default_rng(1))
+        self.assertEqual(len(scores), 4)
+        self.assertEqual(list(scores), sorted(scores))
+        self.assertTrue(valid_layouts(tokens).all())
+        np.testing.assert_allclose(score_layouts(resources, tokens), scores)
+
+
+class GenerateBoardsCommandTest(APITestCase):
+    def test_boards_stored(self):
+        out = StringIO()
+        call_command('generate_boards', candidates=200, keep=3, seed=1, stdout=out)
+        boards = Board.objects.order_by('id')
+        self.assertEqual([b.name for b in boards], ["generated 1", "generated 2", "generated 3"])
+        for board in boards:
+            hexes = Hexagon.of_board(board.id)
+            self.assertEqual(sorted(h for h, _, _ in hexes), list(range(HEXAGON_COUNT)))
+
+        response = self.client.get('/boards/')
+        self.assertEqual(len(response.data), 3)
+        self.assertIn("generated 1: unfairness", out.getvalue())
+
+    def test_names_already_taken(self):
+        call_command('generate_boards', candidates=200, keep=2, seed=1, stdout=StringIO())
+        call_command('generate_boards', candidates=200, keep=2, seed=2, stdout=StringIO())
+        for board in Board.objects.all():
+            self.assertEqual(len(Hexagon.of_board(board.id)), HEXAGON_COUNT)
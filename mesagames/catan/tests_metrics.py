@@ -0,0 +1,78 @@
+import json
+
+from django.test import SimpleTestCase, override_settings
+
+from catan.metrics import *
+from catan.tests_batch import StartedGameTestCase
+
+
+class MetricsRegistryTest(SimpleTestCase):
+    def test_exposition(self):
+        registry = MetricsRegistry(buckets=(0.1, 1))
+        labels = tuple(zip(LABELS, ("catan.views.GameStatus", "GET", "", 200)))
+        metrics = RequestMetrics()
+        metrics.queries = 3
+        metrics.db_seconds = 0.25
+        registry.observe(labels, metrics, 0.5)
+        registry.observe(labels, RequestMetrics(), 0.05)
+
+        text = registry.exposition()
+        series = 'view="catan.views.GameStatus",method="GET",action="",status="200"'
+        self.assertIn("# TYPE catan_requests_total counter", text)
+        self.assertIn("catan_requests_total{%s} 2" % series, text)
+        self.assertIn("catan_request_queries_total{%s} 3" % series, text)
+        self.assertIn("catan_request_db_seconds_total{%s} 0.25" % series, text)
+        self.assertIn('catan_request_duration_seconds_bucket{%s,le="0.1"} 1' % series, text)
+        self.assertIn('catan_request_duration_seconds_bucket{%s,le="1.0"} 2' % series, text)
+        self.assertIn('catan_request_duration_seconds_bucket{%s,le="+Inf"} 2' % series, text)
+        self.assertIn("catan_request_duration_seconds_count{%s} 2" % series, text)
+
+    def test_label_escaping(self):
+        self.assertEqual(format_labels((("view", 'a"b\\'),)), 'view="a\\"b\\\\"')
+
+
+class MetricsMiddlewareTest(StartedGameTestCase):
+    def setUp(self):
+        super().setUp()
+        metrics_registry.clear()
+
+    def metric(self, name, view, method="GET", action="", status=200):
+        series = '%s{view="%s",method="%s",action="%s",status="%d"} ' % (
+            name, view, method, action, status
+        )
+        for line in self.client.get("/metrics").content.decode().splitlines():
+            if line.startswith(series):
+                return float(line[len(series):])
+        return None
+
+    def test_requests_are_counted(self):
+        self.client.get("/boards/")
+        self.client.get("/boards/")
+        self.assertEqual(self.metric("catan_requests_total", "catan.views.BoardList"), 2)
+        self.assertEqual(self.metric("catan_request_queries_total", "catan.views.BoardList"), 2)
+        self.assertGreater(
+            self.metric("catan_request_render_seconds_total", "catan.views.BoardList"), 0
+        )
+
+    def test_actions_are_labeled(self):
+        url = "/games/" + str(self.game.id) + "/player/actions/"
+        self.client.post(url, {"type": "end_turn", "payload": None}, format="json")
+        self.client.post(url, {"type": "end_turn", "payload": None}, format="json")
+        view = "catan.views.PlayerAction"
+        self.assertEqual(self.metric("catan_requests_total", view, "POST", "end_turn"), 1)
+        self.assertEqual(self.metric("catan_requests_total", view, "POST", "end_turn", 401), 1)
+        self.assertGreater(self.metric("catan_request_queries_total", view, "POST", "end_turn"), 0)
+
+    @override_settings(CATAN_SLOW_REQUEST_SECONDS=0)
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs("catan.metrics", "WARNING") as logs:
+            self.client.get("/boards/")
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line["view"], "catan.views.BoardList")
+        self.assertEqual(line["status"], 200)
+        self.assertEqual(line["queries"], 1)
+        self.assertGreaterEqual(line["wall_ms"], line["db_ms"])
+
+    def test_only_local(self):
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="10.1.2.3").status_code, 404)
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="::1").status_code, 200)
@@ -0,0 +1,116 @@
+import random
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+from catan.engine import GameState
+from catan.moves import *
+from catan.rules import *
+from catan.simulation import random_board
+from catan.topology import *
+
+
+def new_game():
+    state = GameState(11, random_board(random.Random(11)))
+    players = [[1, "ana"], [2, "beto"], [3, "carla"]]
+    state.apply(1, None, "start_game", {"players": players, "first_turn": 1})
+    return state
+
+
+def give(state, player, resources):
+    for resource, amount in resources.items():
+        state.transfer(None, player, resource, amount)
+
+
+class LegalMovesTest(SimpleTestCase):
+    def test_start(self):
+        state = new_game()
+        state.dices = (2, 3)
+        moves = legal_moves(state)
+        self.assertEqual(moves.shape[1], 3)
+        self.assertEqual(list(moves[0]), [END_TURN, 0, 0])
+
+    def test_build(self):
+        state = new_game()
+        state.dices = (2, 3)
+        state.resources = {(None, r): BANK_RESOURCES for r, _ in RESOURCE_TYPES}
+        give(state, 1, {"brick": 1, "lumber": 1, "wool": 1, "grain": 1})
+        moves = legal_moves(state)
+
+        settlements = [m[1] for m in moves if m[0] == BUILD_SETTLEMENT]
+        self.assertEqual(settlements, list(iter_vertices(state.occupancy.settlement_mask(1))))
+        roads = [m[1] for m in moves if m[0] == BUILD_ROAD]
+        self.assertEqual(len(roads), len(state.occupancy.road_positions(1)))
+        self.assertNotIn(BUY_CARD, moves[:, 0])
+
+    def test_bank_trade(self):
+        state = new_game()
+        state.dices = (2, 3)
+        state.resources = {(None, r): BANK_RESOURCES for r, _ in RESOURCE_TYPES}
+        state.resources[(None, "ore")] = 0
+        give(state, 1, {"wool": 4})
+        trades = [tuple(m) for m in legal_moves(state) if m[0] == BANK_TRADE]
+        wool = RESOURCES.index("wool")
+        self.assertEqual(trades, [
+            (BANK_TRADE, wool, RESOURCES.index(r)) for r in RESOURCES if r not in ("wool", "ore")
+        ])
+
+    def test_buy_card_empty_deck(self):
+        state = new_game()
+        state.dices = (2, 3)
+        give(state, 1, DEVELOPMENT_CARD_COST)
+        self.assertIn(BUY_CARD, legal_moves(state)[:, 0])
+
+        for card in state.cards:
+            card[1] = 2
+        self.assertNotIn(BUY_CARD, legal_moves(state)[:, 0])
+
+    def test_robber_locks_turn(self):
+        state = new_game()
+        state.dices = (3, 4)
+        moves = legal_moves(state)
+        self.assertEqual(set(moves[:, 0]), {MOVE_ROBBER})
+        self.assertNotIn(state.robber, moves[:, 1])
+        targets = {(h, t) for _, h, t in moves}
+        for h in range(HEXAGON_COUNT):
+            if h != state.robber:
+                self.assertIn((h, NO_TARGET), targets)
+                for p in state.adjacent_players(h):
+                    self.assertEqual((h, p) in targets, p != 1)
+
+    def test_no_moves_out_of_turn(self):
+        state = new_game()
+        state.winner = 2
+        self.assertEqual(legal_moves(state).shape, (0, 3))
+
+    def test_moves_are_valid(self):
+        state = new_game()
+        rng = random.Random(4)
+        for _ in range(400):
+            moves = legal_moves(state)
+            for move in moves:
+                action, payload = decode_move(state, move)
+                self.assertTrue(state.can_apply(state.turn, action, payload), (action, payload))
+            version = state.version
+            apply_move(state, moves[rng.randrange(len(moves))])
+            self.assertEqual(state.version, version + 1)
+
+    def test_apply_move(self):
+        state = new_game()
+        state.dices = (2, 3)
+        apply_move(state, (END_TURN, 0, 0))
+        self.assertEqual(state.turn, 2)
+        self.assertEqual(state.version, 2)
+
+
+def iter_vertices(mask):
+    return [v for v in range(VERTEX_COUNT) if mask >> v & 1]
+
+
+class BenchmarkEngineCommandTest(SimpleTestCase):
+    def test_report(self):
+        out = StringIO()
+        call_command('benchmark_engine', warmup=50, iterations=20, stdout=out)
+        names = [line.split(":")[0] for line in out.getvalue().splitlines()]
+        self.assertEqual(names, ["copies", "legal_moves", "push+undo"])
@@ -0,0 +1,78 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase
+from rest_framework.test import APITestCase
+
+from catan.models import *
+from catan.notify import GameNotifier, game_notifier
+from catan.views import wait_for_version
+
+
+class GameNotifierTest(SimpleTestCase):
+    def test_notify_wakes_listeners_of_the_game(self):
+        notifier = GameNotifier()
+        with notifier.listen(1) as first, notifier.listen(1) as second, \
+                notifier.listen(2) as other:
+            self.assertEqual(notifier.listening(1), 2)
+            notifier.notify(1)
+            self.assertTrue(first.is_set())
+            self.assertTrue(second.is_set())
+            self.assertFalse(other.is_set(), "other games are not woken")
+
+        self.assertEqual(notifier.listening(1), 0, "listeners are removed on exit")
+        self.assertEqual(notifier.listening(2), 0)
+
+    def test_wait_for_version_is_woken_by_notify(self):
+        game = SimpleNamespace(id=-1, version=3)
+
+        def act():
+            time.sleep(0.05)
+            game.version = 4
+            game_notifier.notify(game.id)
+
+        thread = threading.Thread(target=act)
+        start = time.monotonic()
+        thread.start()
+        result = wait_for_version(lambda: game, game.id, 3, 10)
+        thread.join()
+
+        self.assertEqual(result.version, 4)
+        self.assertLess(time.monotonic() - start, 1, "woken before the recheck interval")
+        self.assertEqual(game_notifier.listening(game.id), 0)
+
+    def test_wait_for_version_times_out(self):
+        game = SimpleNamespace(id=-1, version=3)
+        self.assertEqual(wait_for_version(lambda: game, game.id, 3, 0.05).version, 3)
+
+
+class LongPollTest(APITestCase):
+    def setUp(self):
+        self.game = Game.objects.create(board=Board.objects.create(name="board"))
+        self.user = User.objects.create_user("pepe")
+        self.player = Player.objects.create(game=self.game, user=self.user)
+        self.game.current_turn = self.player
+        self.game.save()
+        self.game.bump_version()
+        self.client.force_authenticate(user=self.user)
+        self.url = "/games/" + str(self.game.id) + "/"
+
+    def test_newer_version_answers_at_once(self):
+        response = self.client.get(self.url, {"since": 0})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Game-Version"], "1")
+        self.assertEqual(response.data["current_turn"]["user"], "pepe")
+
+    def test_timeout_answers_not_modified(self):
+        response = self.client.get(self.url, {"since": 1, "timeout": 0})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["X-Game-Version"], "1")
+        self.assertIn("ETag", response)
+
+    def test_invalid_since(self):
+        response = self.client.get(self.url, {"since": "abc"})
+        self.assertEqual(response.status_code, 400)
+        for timeout in ["nan", "inf", "-inf"]:
+            response = self.client.get(self.url, {"since": 1, "timeout": timeout})
+            self.assertEqual(response.status_code, 400, timeout)
@@ -0,0 +1,65 @@
+import os
+import pstats
+import tempfile
+
+from catan.actions import ACTION_HANDLERS, EndTurnAction
+from catan.profiling import *
+from catan.tests_batch import StartedGameTestCase
+
+
+class ActionProfilingTest(StartedGameTestCase):
+    def setUp(self):
+        super().setUp()
+        self.profile_dir = tempfile.TemporaryDirectory()
+        self.url = "/games/" + str(self.game.id) + "/player/actions/"
+        phase_registry.clear()
+
+    def tearDown(self):
+        uninstrument_action_handlers()
+        self.profile_dir.cleanup()
+
+    def instrument(self, sample_rate):
+        instrument_action_handlers({
+            "sample_rate": sample_rate,
+            "outlier_seconds": 0,
+            "profile_dir": self.profile_dir.name,
+        })
+
+    def test_phases_are_timed(self):
+        self.instrument(0)
+        self.assertIsInstance(ACTION_HANDLERS["end_turn"], InstrumentedHandler)
+        response = self.client.post(self.url, {"type": "end_turn", "payload": None}, format="json")
+        self.assertEqual(response.status_code, 200)
+
+        for phase in PHASES:
+            calls, queries, seconds = phase_registry.get("end_turn", phase)
+            self.assertEqual(calls, 1, phase)
+            self.assertGreater(seconds, 0)
+        self.assertEqual(phase_registry.get("end_turn", "is_payload_valid")[1], 0)
+        self.assertGreater(phase_registry.get("end_turn", "execute")[1], 0, "persists")
+        self.assertEqual(phase_registry.get("end_turn", "can_execute")[1], 0, "state given")
+        self.assertEqual(os.listdir(self.profile_dir.name), [])
+
+        metrics = self.client.get("/metrics").content.decode()
+        self.assertIn(
+            'catan_action_phase_seconds_count{action="end_turn",phase="execute"} 1', metrics
+        )
+
+    def test_sampled_outliers_are_dumped(self):
+        self.instrument(1)
+        self.client.post(self.url, {"type": "end_turn", "payload": None}, format="json")
+        dumps = sorted(os.listdir(self.profile_dir.name))
+        self.assertEqual([name.split("-")[1] for name in dumps],
+                         ["can_execute", "execute", "is_payload_valid", "load_state"])
+        stats = pstats.Stats(os.path.join(self.profile_dir.name, dumps[1]))
+        self.assertGreater(stats.total_calls, 0)
+
+    def test_instrumenting_twice(self):
+        self.instrument(0)
+        self.instrument(0)
+        handler = ACTION_HANDLERS["end_turn"]
+        self.assertIsInstance(handler.handler, EndTurnAction)
+        self.assertEqual(handler.action, "end_turn")
+
+        uninstrument_action_handlers()
+        self.assertIsInstance(ACTION_HANDLERS["end_turn"], EndTurnAction)
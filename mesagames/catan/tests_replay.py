@@ -0,0 +1,169 @@
+import random
+
+from django.test import SimpleTestCase
+from rest_framework.test import APITestCase
+
+from catan.engine import GameState, action_rng
+from catan.factory import start_game
+from catan.models import *
+from catan.store import load_state
+
+TOKENS = [2, 3, 4, 5, 6, 8, 9, 10, 11, 12]
+
+
+def choose_action(available, state, player, rng):
+    """Concrete action for one of the available actions, preferring anything but end_turn."""
+    others = [a for a in available if a["type"] != "end_turn"]
+    if not others or (len(others) < len(available) and rng.random() < 0.3):
+        return {"type": "end_turn", "payload": None}
+
+    action = rng.choice(others)
+    kind, options = action["type"], action["payload"]
+    if kind in ("build_settlement", "build_road"):
+        return {"type": kind, "payload": rng.choice(options)}
+    if kind in ("move_robber", "play_knight_card"):
+        option = rng.choice(options)
+        target = rng.choice(option["players"]) if option["players"] else ""
+        return {"type": kind, "payload": {"position": option["position"], "player": target}}
+    if kind == "play_road_building_card":
+        if len(options) < 2:
+            return {"type": "end_turn", "payload": None}
+        return {"type": kind, "payload": rng.sample(options, 2)}
+    if kind == "bank_trade":
+        give = next(r for r, _ in RESOURCE_TYPES if state.count_resources(player, r) >= 4)
+        receive = rng.choice([r for r, _ in RESOURCE_TYPES if r != give])
+        return {"type": kind, "payload": {"give": give, "receive": receive}}
+    return {"type": kind, "payload": None}
+
+
+def stored_state(game):
+    """The parts of the stored game that GameState tracks, in its terms."""
+    game = Game.objects.get(pk=game.id)
+    return {
+        "version": game.version,
+        "turn": game.current_turn_id,
+        "winner": game.winner_id,
+        "dices": (game.current_dices_1, game.current_dices_2),
+        "robber": hexagon_id((game.robber_level, game.robber_index)),
+        "robber_moved": game.robber_moved,
+        "resources": {
+            (player, resource): amount
+            for player, resource, amount in ResourcesCard.objects
+            .filter(game=game, amount__gt=0)
+            .values_list('player', 'resource', 'amount')
+        },
+        "cards": [
+            [card, player] for card, player in DevelopmentCard.objects
+            .filter(game=game).order_by('id').values_list('card', 'player')
+        ],
+        "settlements": Occupancy.for_game(game).settlements,
+        "roads": Occupancy.for_game(game).roads,
+    }
+
+
+def replayed_state(state):
+    return {
+        "version": state.version,
+        "turn": state.turn,
+        "winner": state.winner,
+        "dices": state.dices,
+        "robber": state.robber,
+        "robber_moved": state.robber_moved,
+        "resources": {k: amount for k, amount in state.resources.items() if amount > 0},
+        "cards": state.cards,
+        "settlements": state.occupancy.settlements,
+        "roads": state.occupancy.roads,
+    }
+
+
+class ActionRngTest(SimpleTestCase):
+    def test_deterministic_per_sequence(self):
+        self.assertEqual(action_rng(42, 3).random(), action_rng(42, 3).random())
+        self.assertNotEqual(action_rng(42, 3).random(), action_rng(42, 4).random())
+        self.assertNotEqual(action_rng(42, 3).random(), action_rng(43, 3).random())
+
+
+class ReplayTest(APITestCase):
+    def setUp(self):
+        board = Board.objects.create(name="board")
+        resources = [r for r, _ in RESOURCE_TYPES]
+        for h, (level, index) in enumerate(HEXAGON_POSITIONS):
+            Hexagon.objects.create(
+                board=board,
+                pos_level=level,
+                pos_index=index,
+                resource=resources[h % len(resources)],
+                token=TOKENS[h % len(TOKENS)]
+            )
+        self.users = [User.objects.create_user(name) for name in ["ana", "beto", "caro"]]
+        room = Room.objects.create(name="room", owner=self.users[0], board_id=board)
+        for user in self.users:
+            room.players.add(user)
+        self.game = start_game(room, self.users[0])
+
+    def play(self, steps, rng):
+        url = "/games/" + str(self.game.id) + "/player/actions/"
+        for _ in range(steps):
+            game = Game.objects.get(pk=self.game.id)
+            if game.winner is not None:
+                break
+            player = game.current_turn
+            self.client.force_authenticate(user=player.user)
+            available = self.client.get(url).data
+            if game.robber_moved:
+                # still listed, but the robber can only be moved once per turn
+                available = [a for a in available if a["type"] != "play_knight_card"]
+            action = choose_action(available, load_state(game), player.id, rng)
+            response = self.client.post(url, action, format="json")
+            self.assertEqual(response.status_code, 200, action)
+
+    def test_start_is_logged(self):
+        log = ActionLog.objects.get(game=self.game)
+        self.assertEqual(log.sequence, 1)
+        self.assertEqual(log.action, "start_game")
+        self.assertEqual(self.game.version, 1)
+        self.assertEqual(replayed_state(self.game.replay()), stored_state(self.game))
+
+    def test_replay_matches_stored_state(self):
+        self.play(60, random.Random(1))
+        game = Game.objects.get(pk=self.game.id)
+
+        self.assertEqual(game.actionlog_set.count(), game.version)
+        self.assertGreater(game.actionlog_set.exclude(action="end_turn").count(), 10)
+        self.assertEqual(replayed_state(game.replay()), stored_state(game))
+
+    def test_replay_up_to_version(self):
+        self.play(10, random.Random(2))
+        version = Game.objects.get(pk=self.game.id).version
+        self.play(10, random.Random(3))
+
+        self.assertEqual(self.game.replay(version).version, version)
+        self.assertLess(version, Game.objects.get(pk=self.game.id).version)
+
+    def test_snapshot_follows_actions(self):
+        self.play(20, random.Random(4))
+        game = Game.objects.get(pk=self.game.id)
+
+        with self.assertNumQueries(1):
+            state = load_state(Game.objects.get(pk=game.id))
+        self.assertEqual(state.version, game.version)
+        self.assertEqual(replayed_state(state), stored_state(game))
+        self.assertLess(len(game.snapshot), 1024, "compact")
+
+    def test_stale_snapshot_catches_up(self):
+        self.play(10, random.Random(5))
+        game = Game.objects.get(pk=self.game.id)
+        Game.objects.filter(pk=game.id).update(snapshot=game.replay(game.version - 3).dumps())
+
+        with self.assertNumQueries(2):
+            state = load_state(Game.objects.get(pk=game.id))
+        self.assertEqual(replayed_state(state), stored_state(game))
+
+    def test_snapshot_round_trip(self):
+        self.play(10, random.Random(6))
+        state = self.game.replay()
+        loaded = GameState.loads(state.dumps())
+
+        self.assertEqual(replayed_state(loaded), replayed_state(state))
+        self.assertEqual(loaded.production.payouts, state.production.payouts)
+        self.assertEqual(loaded.usernames, state.usernames)
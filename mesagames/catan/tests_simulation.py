@@ -0,0 +1,65 @@
+import random
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase
+
+from catan.simulation import *
+
+
+def summary(result):
+    counts = {action: count for action, (count, _) in result.timings.items()}
+    return (result.seed, result.winner, result.turns, result.actions, counts)
+
+
+class SimulationTest(SimpleTestCase):
+    def test_random_board(self):
+        hexes = random_board(random.Random(3))
+        self.assertEqual([h for h, _, _ in hexes], list(range(HEXAGON_COUNT)))
+        deserts = [(resource, token) for _, resource, token in hexes if resource is None]
+        self.assertEqual(deserts, [(None, 0)])
+        self.assertEqual(sorted(t for _, r, t in hexes if r is not None), BOARD_TOKENS)
+
+    def test_play_game(self):
+        result = play_game(5, ["random", "builder", "random"], 40)
+        self.assertEqual(result.turns, 40)
+        self.assertEqual(result.timings["end_turn"][0], 40)
+        self.assertEqual(result.actions, sum(count for count, _ in result.timings.values()))
+
+    def test_play_long_game(self):
+        # long enough for the development deck to run out
+        result = play_game(3, ["random"] * 3, 2000)
+        self.assertEqual(result.turns, 2000)
+
+    def test_play_game_is_deterministic(self):
+        bots = ["builder", "random"]
+        self.assertEqual(summary(play_game(9, bots, 60)), summary(play_game(9, bots, 60)))
+
+    def test_simulate_in_processes(self):
+        bots = ["builder", "builder", "random"]
+        inline, _ = simulate(4, bots, 30, seed=20)
+        pooled, _ = simulate(4, bots, 30, seed=20, processes=2)
+        self.assertEqual(
+            sorted(summary(r) for r in inline),
+            sorted(summary(r) for r in pooled)
+        )
+
+
+class SimulateGamesCommandTest(SimpleTestCase):
+    def test_report(self):
+        out = StringIO()
+        call_command('simulate_games', games=3, bots='builder,random', max_turns=20, stdout=out)
+        report = out.getvalue()
+        self.assertIn("games: 3 in", report)
+        self.assertIn("turns/game: 20.0", report)
+        self.assertIn("end_turn: 60 played", report)
+
+    def test_default_max_turns(self):
+        out = StringIO()
+        call_command('simulate_games', games=3, seed=24, stdout=out)
+        self.assertIn("turns/game: 500.0", out.getvalue())
+
+    def test_unknown_bot(self):
+        with self.assertRaises(CommandError):
+            call_command('simulate_games', games=1, bots='random,nobody', stdout=StringIO())
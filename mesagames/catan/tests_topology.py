@@ -0,0 +1,82 @@
+from django.test import SimpleTestCase
+
+from catan.topology import *
+from catan.occupancy import Occupancy, iter_bits
+
+
+class TopologyTest(SimpleTestCase):
+    def test_sizes(self):
+        self.assertEqual(VERTEX_COUNT, 54, "vertex count")
+        self.assertEqual(HEXAGON_COUNT, 19, "hexagon count")
+        self.assertEqual(EDGE_COUNT, 72, "edge count")
+
+    def test_ids_are_dense_and_ordered(self):
+        self.assertEqual(vertex_id((0, 0)), 0)
+        self.assertEqual(vertex_id((1, 0)), 6)
+        self.assertEqual(vertex_id((2, 29)), 53)
+        self.assertEqual(hexagon_id((2, 11)), 18)
+        self.assertIsNone(vertex_id((1, 18)), "invalid vertex")
+        self.assertIsNone(hexagon_id((3, 0)), "invalid hexagon")
+
+    def test_neighbors_are_symmetric(self):
+        for v in range(VERTEX_COUNT):
+            self.assertIn(len(VERTEX_NEIGHBORS[v]), (2, 3))
+            for n in VERTEX_NEIGHBORS[v]:
+                self.assertIn(v, VERTEX_NEIGHBORS[n], "neighbors of " + str(v))
+
+    def test_hexes_and_vertices_agree(self):
+        for h in range(HEXAGON_COUNT):
+            self.assertEqual(len(HEX_VERTICES[h]), 6)
+            for v in HEX_VERTICES[h]:
+                self.assertIn(h, VERTEX_HEXES[v])
+        for v in range(VERTEX_COUNT):
+            self.assertIn(len(VERTEX_HEXES[v]), (1, 2, 3))
+
+    def test_edges(self):
+        self.assertEqual(edge_id((0, 0), (0, 5)), edge_id((0, 5), (0, 0)), "orientation")
+        self.assertIsNone(edge_id((0, 0), (0, 3)), "not neighbors")
+        self.assertEqual(edge_positions(edge_id((0, 5), (1, 15))), ((0, 5), (1, 15)))
+        for e, (fst, snd) in enumerate(EDGES):
+            self.assertIn(e, VERTEX_EDGES[fst])
+            self.assertIn(e, VERTEX_EDGES[snd])
+
+
+class OccupancyTest(SimpleTestCase):
+    def test_iter_bits(self):
+        self.assertEqual(list(iter_bits(0)), [])
+        self.assertEqual(list(iter_bits(0b101001)), [0, 3, 5])
+
+    def test_settlement_rules(self):
+        occupancy = Occupancy()
+        occupancy.add_road(1, edge_id((1, 2), (1, 3)))
+        occupancy.add_road(1, edge_id((1, 3), (1, 4)))
+        self.assertEqual(
+            occupancy.settlement_positions(1), [(1, 2), (1, 3), (1, 4)],
+            "vertices touched by own roads"
+        )
+        self.assertEqual(occupancy.settlement_positions(2), [], "no roads, no settlements")
+
+        occupancy.add_settlement(2, vertex_id((1, 2)))
+        self.assertEqual(occupancy.settlement_positions(1), [(1, 4)], "distance rule")
+        self.assertFalse(occupancy.can_build_settlement(1, (1, 2)), "occupied")
+        self.assertTrue(occupancy.can_build_settlement(1, (1, 4)), "free")
+
+        occupancy.add_city(2, vertex_id((1, 5)))
+        self.assertEqual(occupancy.settlement_positions(1), [], "cities count too")
+        self.assertEqual(occupancy.count_settlements(2), 1, "cities are not settlements")
+
+    def test_road_rules(self):
+        occupancy = Occupancy()
+        occupancy.add_settlement(1, vertex_id((0, 5)))
+        self.assertEqual(
+            occupancy.road_positions(1), [((0, 0), (0, 5)), ((0, 4), (0, 5)), ((0, 5), (1, 15))],
+            "edges around the settlement"
+        )
+        occupancy.add_road(2, edge_id((0, 5), (0, 0)))
+        self.assertFalse(occupancy.can_build_road(1, ((0, 0), (0, 5))), "taken, any orientation")
+        self.assertTrue(occupancy.can_build_road(1, ((1, 15), (0, 5))), "free, any orientation")
+        self.assertFalse(occupancy.can_build_road(1, ((0, 0), (0, 3))), "not an edge")
+
+        occupancy.add_road(1, edge_id((0, 5), (1, 15)))
+        self.assertIn(((1, 14), (1, 15)), occupancy.road_positions(1), "extends from own road")
+        self.assertEqual(occupancy.count_roads(1), 1, "road count")
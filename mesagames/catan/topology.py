@@ -0,0 +1,165 @@
+"""
+Static topology of the board: vertices, hexagons, edges and how they touch.
+
+Everything is computed once at import time and stored in immutable tables
+keyed by dense integer ids, so rule checks never recompute the geometry:
+
+    vertex id   0..53, ordered by (level, index)
+    hexagon id  0..18, ordered by (level, index)
+    edge id     0..71, ordered by the lowest vertex and then by neighbor order
+"""
+
+LEVELS = 3
+
+
+def vertex_count(level):
+    return 6 * (1 + level * 2)
+
+
+def hexagon_count(level):
+    if level == 0:
+        return 1
+    else:
+        return level * 6
+
+
+# Vertices of every hexagon, by position. The order of each list is the one
+# clients have always received, so keep it as is.
+_HEXAGON_VERTICES = {
+    (0, 0): [(0, 0), (0, 1), (0, 2), (0, 3), (0, 4), (0, 5)],
+
+    (1, 0): [(0, 0), (0, 1), (1, 0), (1, 1), (1, 2), (1, 3)],
+    (1, 1): [(0, 1), (0, 2), (1, 3), (1, 4), (1, 5), (1, 6)],
+    (1, 2): [(0, 2), (0, 3), (1, 6), (1, 7), (1, 8), (1, 9)],
+    (1, 3): [(0, 3), (0, 4), (1, 9), (1, 10), (1, 11), (1, 12)],
+    (1, 4): [(0, 4), (0, 5), (1, 12), (1, 13), (1, 14), (1, 15)],
+    (1, 5): [(0, 0), (0, 5), (1, 0), (1, 15), (1, 16), (1, 17)],
+
+    (2, 0): [(1, 0), (1, 1), (2, 0), (2, 1), (1, 17), (2, 29)],
+    (2, 1): [(1, 1), (1, 2), (2, 1), (2, 2), (2, 3), (2, 4)],
+    (2, 2): [(1, 2), (1, 3), (1, 4), (2, 4), (2, 5), (2, 6)],
+    (2, 3): [(1, 4), (1, 5), (2, 6), (2, 7), (2, 8), (2, 9)],
+    (2, 4): [(1, 5), (1, 6), (1, 7), (2, 9), (2, 10), (2, 11)],
+    (2, 5): [(1, 7), (1, 8), (2, 11), (2, 12), (2, 13), (2, 14)],
+    (2, 6): [(1, 8), (1, 9), (1, 10), (2, 14), (2, 15), (2, 16)],
+    (2, 7): [(1, 10), (1, 11), (2, 16), (2, 17), (2, 18), (2, 19)],
+    (2, 8): [(1, 11), (1, 12), (1, 13), (2, 19), (2, 20), (2, 21)],
+    (2, 9): [(1, 13), (1, 14), (2, 21), (2, 22), (2, 23), (2, 24)],
+    (2, 10): [(1, 14), (1, 15), (1, 16), (2, 24), (2, 25), (2, 26)],
+    (2, 11): [(1, 16), (1, 17), (2, 26), (2, 27), (2, 28), (2, 29)],
+}
+
+
+def _next_neighbors(vertex):
+    """Neighbors of the vertex in its own ring."""
+    count = vertex_count(vertex[0])
+    return [
+        (vertex[0], (vertex[1] + 1) % count),
+        (vertex[0], (vertex[1] - 1) % count)
+    ]
+
+
+def _extern_neighbor(vertex):
+    """Neighbor of the vertex in the adjacent ring, if it has one."""
+    result = []
+
+    level = vertex[0]
+    index = vertex[1]
+
+    if level == 0:
+        result.append((1, index * 3))
+    elif level == 1:
+        if index % 3 == 0:
+            result.append((0, index // 3))
+        else:
+            result.append((2, (index % 3)**2 + 5 * (index // 3)))
+    else:
+        if index % 5 == 1:
+            result.append((1, 1 + 3 * (index // 5)))
+        elif index % 5 == 4:
+            result.append((1, 2 + 3 * (index // 5)))
+    return result
+
+
+VERTEX_POSITIONS = tuple(
+    (level, index) for level in range(LEVELS) for index in range(vertex_count(level))
+)
+VERTEX_IDS = {pos: vid for vid, pos in enumerate(VERTEX_POSITIONS)}
+VERTEX_COUNT = len(VERTEX_POSITIONS)
+
+HEXAGON_POSITIONS = tuple(
+    (level, index) for level in range(LEVELS) for index in range(hexagon_count(level))
+)
+HEXAGON_IDS = {pos: hid for hid, pos in enumerate(HEXAGON_POSITIONS)}
+HEXAGON_COUNT = len(HEXAGON_POSITIONS)
+
+# hexagon id -> vertex ids
+HEX_VERTICES = tuple(
+    tuple(VERTEX_IDS[v] for v in _HEXAGON_VERTICES[pos]) for pos in HEXAGON_POSITIONS
+)
+
+# vertex id -> hexagon ids
+VERTEX_HEXES = tuple(
+    tuple(h for h in range(HEXAGON_COUNT) if v in HEX_VERTICES[h]) for v in range(VERTEX_COUNT)
+)
+
+# vertex id -> neighbor vertex ids: the two ring neighbors first, then the
+# extern one (if any).
+VERTEX_NEIGHBORS = tuple(
+    tuple(VERTEX_IDS[n] for n in _next_neighbors(pos) + _extern_neighbor(pos))
+    for pos in VERTEX_POSITIONS
+)
+
+
+def _build_edges():
+    edges = []
+    ids = dict()
+    for v in range(VERTEX_COUNT):
+        for n in VERTEX_NEIGHBORS[v]:
+            if (v, n) not in ids:
+                ids[(v, n)] = ids[(n, v)] = len(edges)
+                edges.append((v, n))
+    return tuple(edges), ids
+
+
+# edge id -> (vertex id, vertex id); EDGE_IDS accepts both orientations.
+EDGES, EDGE_IDS = _build_edges()
+EDGE_COUNT = len(EDGES)
+
+# vertex id -> incident edge ids, in neighbor order
+VERTEX_EDGES = tuple(
+    tuple(EDGE_IDS[(v, n)] for n in VERTEX_NEIGHBORS[v]) for v in range(VERTEX_COUNT)
+)
+
+# Same tables keyed by (level, index) positions, for the position based API.
+HEXAGON_VERTEX_POSITIONS = {
+    pos: tuple(VERTEX_POSITIONS[v] for v in HEX_VERTICES[h])
+    for h, pos in enumerate(HEXAGON_POSITIONS)
+}
+VERTEX_NEIGHBOR_POSITIONS = {
+    pos: tuple(VERTEX_POSITIONS[n] for n in VERTEX_NEIGHBORS[v])
+    for v, pos in enumerate(VERTEX_POSITIONS)
+}
+
+
+def vertex_id(position):
+    """Returns the id of the vertex at (level, index), or None if there is none."""
+    return VERTEX_IDS.get(position)
+
+
+def hexagon_id(position):
+    """Returns the id of the hexagon at (level, index), or None if there is none."""
+    return HEXAGON_IDS.get(position)
+
+
+def edge_id(fst_position, snd_position):
+    """Returns the id of the edge joining both vertices, or None if they are not neighbors."""
+    fst = VERTEX_IDS.get(fst_position)
+    snd = VERTEX_IDS.get(snd_position)
+    return EDGE_IDS.get((fst, snd))
+
+
+def edge_positions(edge):
+    """Returns the edge as a pair of (level, index) positions."""
+    fst, snd = EDGES[edge]
+    return (VERTEX_POSITIONS[fst], VERTEX_POSITIONS[snd])
@@ -1,5 +1,6 @@
 from django.urls import path
 from catan import views
+from catan.metrics import metrics_view
 
 urlpatterns = [
     path('games/', views.GamesList.as_view()),
@@ -8,10 +9,13 @@ urlpatterns = [
     path('rooms/<int:id>/', views.RoomsId.as_view()),
     path('games/<int:id>/player/', views.ResourcesCardsList.as_view()),
     path('games/<int:id>/', views.GameStatus.as_view()),
+    path('games/<int:id>/events/', views.GameEvents.as_view()),
     path('games/<int:id>/player/actions/', views.PlayerAction.as_view()),
+    path('games/<int:id>/player/actions/batch/', views.PlayerActionBatch.as_view()),
     path('users/', views.UserRegister.as_view()),
     path('users/login/', views.UserLogin.as_view()),
     path('boards/', views.BoardList.as_view()),
+    path('metrics', metrics_view),
 
     path('games', views.GamesList.as_view()),
     path('games/<int:id>/board', views.HexList.as_view()),
@@ -19,7 +23,9 @@ urlpatterns = [
     path('rooms/<int:id>', views.RoomsId.as_view()),
     path('games/<int:id>/player', views.ResourcesCardsList.as_view()),
     path('games/<int:id>', views.GameStatus.as_view()),
+    path('games/<int:id>/events', views.GameEvents.as_view()),
     path('games/<int:id>/player/actions', views.PlayerAction.as_view()),
+    path('games/<int:id>/player/actions/batch', views.PlayerActionBatch.as_view()),
     path('users', views.UserRegister.as_view()),
     path('users/login', views.UserLogin.as_view()),
     path('boards', views.BoardList.as_view()),
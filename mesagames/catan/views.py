@@ -1,3 +1,6 @@
+import math
+import time
+
 from rest_framework.authtoken.models import Token
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.generics import ListAPIView
@@ -6,24 +9,97 @@ from rest_framework.views import APIView, status
 from rest_framework import permissions
 
 from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404
-from django.http import Http404
+from django.http import Http404, StreamingHttpResponse
+from django.utils.http import parse_etags
 
 from catan.serializers import RoomSerializer, GameSerializer, BoardSerializer
-from catan.actions import ACTION_HANDLERS, get_available_road_positions
-from catan.actions import get_available_settlement_positions_pos, get_available_road_positions_pos
-from catan.actions import get_available_settlement_positions, get_available_robber_positions
+from catan.actions import ACTION_HANDLERS
+from catan.cache import cached_payload
+from catan.events import event_broker, event_stream
+from catan.executor import GameBusy, get_game_executor
+from catan.factory import start_game
+from catan.metrics import tag_request
 from catan.models import *
+from catan.notify import game_notifier
+from catan.store import ActionRejected, StaleState, load_state, play_all
 
 
 def vertex_position_json(level, index):
     return {"level": level, "index": index}
 
 
+# Long polling of GameStatus: seconds to hold the request by default and at
+# most, and seconds between re-reads of the game (changes made by other
+# processes are not notified).
+LONG_POLL_TIMEOUT = 25
+LONG_POLL_MAX_TIMEOUT = 60
+LONG_POLL_RECHECK = 2
+
+# Event streams: seconds before the server closes it (clients reconnect on
+# their own) and seconds between keepalive comments.
+EVENT_STREAM_DURATION = 300
+EVENT_STREAM_KEEPALIVE = 15
+
+# Most actions a player may send in one batch.
+MAX_BATCH_ACTIONS = 20
+
+
+def state_etag(game, viewer, view):
+    """Strong ETag of the payload of view for the viewer at the game's state version."""
+    return '"%s-%d-%d-%d"' % (view, game.id, game.version, viewer or 0)
+
+
+def versioned_response(request, game, viewer, view, build, since=None):
+    """
+    Answers the payload of view tagged with its ETag, or 304 Not Modified
+    without building it when the client already has that version (or a
+    version since which the game did not change).
+    """
+    etag = state_etag(game, viewer, view)
+    client_etags = parse_etags(request.META.get("HTTP_IF_NONE_MATCH", ""))
+    not_modified = etag in client_etags or "W/" + etag in client_etags or "*" in client_etags
+    if not_modified or (since is not None and game.version <= since):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(cached_payload(game.id, game.version, viewer, view, build))
+    response["ETag"] = etag
+    response["X-Game-Version"] = game.version
+    return response
+
+
+def wait_for_version(load_game, game_id, since, timeout):
+    """
+    Reloads the game with load_game() until its version is greater than
+    since or timeout seconds elapse, sleeping until PlayerAction.post
+    notifies a change. Returns the last loaded game.
+    """
+    deadline = time.monotonic() + timeout
+    with game_notifier.listen(game_id) as changed:
+        game = load_game()
+        remaining = deadline - time.monotonic()
+        while game.version <= since and remaining > 0:
+            changed.wait(min(remaining, LONG_POLL_RECHECK))
+            changed.clear()
+            game = load_game()
+            remaining = deadline - time.monotonic()
+    return game
+
+
+def play_in_turn(game_id, play):
+    """Returns play() once the other actions of the game before it are done."""
+    try:
+        with get_game_executor().serialized(game_id):
+            return play()
+    except GameBusy:
+        return Response({"details": "the game is busy, try again"}, status=503)
+
+
 def player_for_game_or_404(user, game_id):
     try:
         game = Game.objects.get(pk=game_id)
-        return Player.objects.get(game=game_id, user=user.id), game
+        return Player.objects.select_related('user').get(game=game_id, user=user.id), game
     except ObjectDoesNotExist:
         raise Http404
 
@@ -42,8 +118,12 @@ class HexList(APIView):
         except Game.DoesNotExist:
             raise Http404
 
+        hexes = cached_payload(game.id, game.version, None, "board", lambda: self.hexes_json(game))
+        return Response({"hexes": hexes})
+
+    def hexes_json(self, game):
         result = []
-        for h in Hexagon.objects.filter(board=game.board):
+        for h in Hexagon.objects.filter(board=game.board_id):
             terrain = h.resource
             if terrain is None:
                 terrain = "desert"
@@ -54,14 +134,32 @@ class HexList(APIView):
                 "token": h.token
             })
 
-        return Response({"hexes": result})
+        return result
 
 
 class PlayerAction(APIView):
     permission_classes = (IsAuthenticated,)
 
     def post(self, request, id):
+        """
+        Actions of a game are played one at a time, in arrival order (see
+        catan.executor). An Idempotency-Key header makes retries safe: an
+        action already played with that key is answered as played again,
+        and is not.
+        """
+        action = request.data.get("type") if isinstance(request.data, dict) else None
+        if isinstance(action, str) and action in ACTION_HANDLERS:
+            tag_request(request, action)
+        return play_in_turn(id, lambda: self.play(request, id))
+
+    def play(self, request, id):
         player, game = player_for_game_or_404(request.user, id)
+        idempotency_key = request.headers.get("Idempotency-Key")
+        if idempotency_key is not None:
+            if len(idempotency_key) > IDEMPOTENCY_KEY_LENGTH:
+                return Response({"details": "idempotency key too long"}, status=400)
+            if ActionLog.was_played(game, player, idempotency_key):
+                return Response()
         if game.current_turn != player:
             return Response({"details": "not in your turn"}, status=401)
 
@@ -75,100 +173,165 @@ class PlayerAction(APIView):
         if not handler.is_payload_valid(payload):
             return Response({"details": "invalid payload"}, status=400)
 
-        if not handler.can_execute(player, game, payload):
+        state = handler.load_state(game)
+        if not handler.can_execute(player, game, payload, state):
             return Response({"details": "action cannot be executed"}, status=400)
 
-        handler.execute(player, game, payload)
-        game.try_set_to_winner(player)
+        try:
+            handler.execute(player, game, payload, state, idempotency_key)
+        except StaleState:
+            return Response({"details": "the game changed, try again"}, status=409)
+        game_notifier.notify(game.id)
+        event_broker.publish(game.id, game.version, game.pop_events())
         return Response()
 
     def get(self, request, id):
-        player = get_object_or_404(Player, user=request.user, game=id)
-
-        available_actions = list()
-
-        if player.game.current_turn == player:
-            end_turn_locked = player.game.dices_sum() == 7 and not player.game.robber_moved
-            robber = list()
-            for h in get_available_robber_positions(player):
-                players = list()
-                for p in get_adjacent_players(player.game, h["level"], h["index"]):
-                    if p != player:
-                        players.append(p.user.username)
-                robber.append({"position": h, "players": players})
-            if end_turn_locked:
-                if robber != []:
-                    available_actions.append({"type": "move_robber", "payload": robber})
-            else:
-                available_actions.append({"type": "end_turn", "payload": None})
-
-                sett = get_available_settlement_positions_pos(player)
-                if sett != []:
-                    if SettlementBuilding.has_resources_to_build(player):
-                        available_actions.append({"type": "build_settlement", "payload": sett})
-
-                if robber != []:
-                    if DevelopmentCard.count_player(player, "knight") > 0:
-                        available_actions.append({"type": "play_knight_card", "payload": robber})
-
-                road = get_available_road_positions_pos(player)
-                if road != []:
-                    if RoadBuilding.has_resources_to_build(player):
-                        available_actions.append({"type": "build_road", "payload": road})
-                    if DevelopmentCard.count_player(player, "road_building") > 0:
-                        available_actions.append(
-                            {
-                                "type": "play_road_building_card",
-                                "payload": road
-                            }
-                        )
-
-                # bank_trade
-                for r, _ in RESOURCE_TYPES:
-                    if ResourcesCard.count_player(player, r) >= 4:
-                        available_actions.append({"type": "bank_trade", "payload": None})
-                        break
-
-                # buy card
-                has_ore = ResourcesCard.count_player(player, 'ore') >= 1
-                has_wool = ResourcesCard.count_player(player, 'wool') >= 1
-                has_grain = ResourcesCard.count_player(player, 'grain') >= 1
-                if has_grain and has_ore and has_wool:
-                    available_actions.append({"type": "buy_card", "payload": None})
-
-        return Response(available_actions)
+        players = Player.objects.select_related('game')
+        player = get_object_or_404(players, user=request.user, game=id)
+        return versioned_response(
+            request, player.game, player.id, "actions", lambda: self.available_actions(player)
+        )
+
+    def available_actions(self, player):
+        return load_state(player.game).available_actions(player.id)
+
+
+class PlayerActionBatch(APIView):
+    """
+    Plays several actions of a turn in one request: {"actions": [{"type":
+    ..., "payload": ...}, ...]}. They are played in order and all or none:
+    if one is rejected, the answer tells its index and nothing is played.
+    Like PlayerAction, an Idempotency-Key header makes retries safe: a batch
+    already played with that key is answered as played again, without
+    results, and is not.
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request, id):
+        tag_request(request, "batch")
+        return play_in_turn(id, lambda: self.play(request, id))
+
+    def play(self, request, id):
+        player, game = player_for_game_or_404(request.user, id)
+        idempotency_key = request.headers.get("Idempotency-Key")
+        if idempotency_key is not None:
+            if len(idempotency_key) > IDEMPOTENCY_KEY_LENGTH:
+                return Response({"details": "idempotency key too long"}, status=400)
+            if ActionLog.was_played(game, player, idempotency_key):
+                return Response()
+        if game.current_turn != player:
+            return Response({"details": "not in your turn"}, status=401)
+
+        actions = request.data.get("actions") if isinstance(request.data, dict) else None
+        if not isinstance(actions, list) or not 0 < len(actions) <= MAX_BATCH_ACTIONS:
+            return Response(
+                {"details": "between 1 and %d actions must be given" % MAX_BATCH_ACTIONS},
+                status=400
+            )
+
+        for i, entry in enumerate(actions):
+            try:
+                action = entry["type"]
+                payload = entry["payload"]
+                handler = ACTION_HANDLERS[action]
+            except (KeyError, TypeError):
+                return Response(
+                    {"details": "invalid action or no payload given", "index": i}, status=400
+                )
+            if not handler.is_payload_valid(payload):
+                return Response({"details": "invalid payload", "index": i}, status=400)
+
+        try:
+            _, played = play_all(
+                game, player, [(entry["type"], entry["payload"]) for entry in actions],
+                idempotency_key=idempotency_key
+            )
+        except ActionRejected as e:
+            return Response({"details": e.details, "index": e.index}, status=400)
+        except StaleState:
+            return Response({"details": "the game changed, try again"}, status=409)
+
+        game_notifier.notify(game.id)
+        for version, events in played:
+            event_broker.publish(game.id, version, events)
+        return Response({"results": [
+            {
+                "type": entry["type"],
+                "version": version,
+                "events": [{"type": kind, "data": data} for kind, data in events]
+            }
+            for entry, (version, events) in zip(actions, played)
+        ]})
 
 
 class GameStatus(APIView):
-    def player_to_json(self, game, p):
+    def player_to_json(self, p, development_cards, resources_cards):
+        settlements = p.settlementbuilding_set.all()
+        cities = p.citybuilding_set.all()
         return {
             "username": p.user.username,
             "colour": p.colour,
             "settlements": [
                 {"level": s.pos_level, "index": s.pos_index}
-                for s in SettlementBuilding.objects.filter(owner=p)
+                for s in settlements
             ],
             "cities": [],
             "roads": [(
                 {"level": r.fst_pos_level, "index": r.fst_pos_index},
                 {"level": r.snd_pos_level, "index": r.snd_pos_index})
-                for r in RoadBuilding.objects.filter(owner=p)
+                for r in p.roadbuilding_set.all()
             ],
-            "development_cards": DevelopmentCard.objects.filter(player=p).count(),
-            "resources_cards": ResourcesCard.objects.filter(player=p).count(),
+            "development_cards": development_cards.get(p.id, 0),
+            "resources_cards": resources_cards.get(p.id, 0),
             "last_gained": [],
-            "victory_points": game.calculate_points(p)
+            "victory_points": Game.points(len(settlements), len(cities))
         }
 
-    def get(self, request, id, format=None):
+    def load_game(self, id):
         try:
-            game = Game.objects.get(pk=id)
+            return Game.objects.select_related('current_turn__user', 'winner__user').get(pk=id)
         except Game.DoesNotExist:
             raise Http404
 
-        players = [self.player_to_json(game, p) for p in Player.objects.filter(game=id)]
+    def get(self, request, id, format=None):
+        """
+        With ?since=<version> (and optionally &timeout=<seconds>) waits until
+        the game changes past that version, answering 304 if it never does.
+        """
+        since = request.query_params.get("since")
+        if since is None:
+            game = self.load_game(id)
+        else:
+            try:
+                since = int(since)
+                timeout = float(request.query_params.get("timeout", LONG_POLL_TIMEOUT))
+            except ValueError:
+                return Response({"details": "invalid since or timeout"}, status=400)
+            if not math.isfinite(timeout):
+                return Response({"details": "invalid since or timeout"}, status=400)
+
+            timeout = min(max(timeout, 0), LONG_POLL_MAX_TIMEOUT)
+            game = wait_for_version(lambda: self.load_game(id), id, since, timeout)
+
+        return versioned_response(
+            request, game, None, "status", lambda: self.status_json(game), since
+        )
+
+    def status_json(self, game):
+        id = game.id
+        players = Player.objects.filter(game=id).order_by('id').select_related('user')
+        players = players.prefetch_related(
+            Prefetch('settlementbuilding_set', SettlementBuilding.objects.order_by('id')),
+            Prefetch('citybuilding_set', CityBuilding.objects.order_by('id')),
+            Prefetch('roadbuilding_set', RoadBuilding.objects.order_by('id')),
+        )
+        development_cards = DevelopmentCard.count_by_player(id)
+        resources_cards = ResourcesCard.count_by_player(id)
+
         result = {
-            "players": players,
+            "players": [
+                self.player_to_json(p, development_cards, resources_cards) for p in players
+            ],
             "robber": vertex_position_json(game.robber_level, game.robber_index),
             "current_turn": {
                 "user": game.current_turn.user.username,
@@ -176,7 +339,25 @@ class GameStatus(APIView):
             },
             "winner": game.get_winner_name_or_none()
         }
-        return Response(result)
+        return result
+
+
+class GameEvents(APIView):
+    def get(self, request, id, format=None):
+        """Server-Sent Events stream of the game, see catan.events."""
+        if not Game.objects.filter(pk=id).exists():
+            raise Http404
+
+        def load_version():
+            return Game.objects.values_list('version', flat=True).get(pk=id)
+
+        response = StreamingHttpResponse(
+            event_stream(id, load_version, EVENT_STREAM_DURATION, EVENT_STREAM_KEEPALIVE),
+            content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
 
 
 class GamesList(APIView):
@@ -245,63 +426,7 @@ class RoomsId(APIView):
         if not 3 <= room.players.count() and room.players.count() <= 4:
             return Response("faltan jugadores", status=status.HTTP_400_BAD_REQUEST)
 
-        game = Game.objects.create(board=room.board_id, name=room.name)
-        colours = ['red', 'green', 'yellow', 'blue']
-        count = 0
-        settlements = [
-            [(1, 2), (1, 9)],
-            [(1, 5), (1, 15)],
-            [(1, 7), (1, 11)],
-            [(1, 13), (1, 17)]
-        ]
-        for u in room.players.all():
-            p = Player.objects.create(user=u, game=game, colour=colours[count])
-            ss = settlements[count]
-            for s in ss:
-                SettlementBuilding.objects.create(
-                    game=game,
-                    owner=p,
-                    pos_level=s[0],
-                    pos_index=s[1]
-                )
-                route_dst = get_neighbors(s)[0]
-                RoadBuilding.objects.create(
-                    game=game,
-                    owner=p,
-                    fst_pos_level=s[0],
-                    fst_pos_index=s[1],
-                    snd_pos_level=route_dst[0],
-                    snd_pos_index=route_dst[1]
-                )
-
-            count = count+1
-
-        # crear recursos
-        cards = ['road_building', 'year_of_plenty', 'monopoly', 'victory_point', 'knight']
-        for _ in range(25):
-            DevelopmentCard.objects.create(
-                        game=game,
-                        player=None,
-                        card=random.choice(cards)
-            )
-        for res, _ in RESOURCE_TYPES:
-            for _ in range(19):
-                ResourcesCard.objects.create(
-                            game=game,
-                            player=None,
-                            resource=res
-                )
-
-        # movimiento inicial de la partida
-        game.current_turn = Player.objects.get(game=game, user=request.user)
-        game.roll_dices()
-        game.distribute_resources(game.dices_sum())
-        game.save()
-
-        # iniciar room
-        room.game_has_started = True
-        room.game_id = game
-        room.save()
+        start_game(room, request.user)
         return Response()
 
 
@@ -309,16 +434,20 @@ class ResourcesCardsList(APIView):
     permission_classes = (IsAuthenticated,)
 
     def get(self, request, id, format=None):
-        p, _ = player_for_game_or_404(request.user, id)
+        p, game = player_for_game_or_404(request.user, id)
+        return versioned_response(request, game, p.id, "cards", lambda: self.cards_json(p))
+
+    def cards_json(self, p):
         resources = [
             r.resource for r in
-            ResourcesCard.objects.filter(player=p.id)
+            ResourcesCard.objects.filter(player=p.id).order_by('id')
+            for _ in range(r.amount)
         ]
         cards = [
             c.card for c in
             DevelopmentCard.objects.filter(player=p.id)
         ]
-        return Response({"resources": resources, "cards": cards})
+        return {"resources": resources, "cards": cards}
 
 
 class UserRegister(APIView):
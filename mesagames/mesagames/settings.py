@@ -48,6 +48,8 @@ APPEND_SLASH = False
 
 CORS_ORIGIN_ALLOW_ALL = True
 
+CORS_EXPOSE_HEADERS = ['ETag', 'X-Game-Version']
+
 TEST_RUNNER = 'django_nose.NoseTestSuiteRunner'
 
 NOSE_ARGS = [
@@ -56,6 +58,7 @@ NOSE_ARGS = [
 ]
 
 MIDDLEWARE = [
+    'catan.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -104,6 +107,23 @@ DATABASES = {
 }
 
 
+# Cache of the payloads of the game read endpoints, see catan/cache.py
+CATAN_STATE_CACHE = {
+    'BACKEND': 'catan.cache.LocalStateCache',
+    'OPTIONS': {
+        'max_entries': 4096,
+        'max_size': 16 * 1024 * 1024,
+    },
+}
+
+# Requests slower than this many seconds are logged, see catan/metrics.py
+CATAN_SLOW_REQUEST_SECONDS = 0.5
+
+# Timing of the phases of the action handlers, off unless set to a dict of
+# options, see catan/profiling.py
+CATAN_ACTION_PROFILING = None
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 